@@ -0,0 +1,305 @@
+# ann_index.py
+# Optional FAISS HNSW index over a DB's embedding store (vector_store ".emb"),
+# for helpers.rank_documents once exact brute force gets too slow.
+#
+# Files written next to <name>.db:
+#   <name>.db.ann.faiss   IndexIDMap(IndexHNSWFlat, inner product), labels = chunks rowids
+#   <name>.db.ann.json    {db_stamp, count, max_rowid, dim, m, ef_construction, ...}
+#
+# - Vectors are the store's L2-normalized rows, so inner product = cosine.
+# - New chunks (rowid > max_rowid) are added in place, off the request thread
+#   (queries use the exact path meanwhile); HNSW can't delete, so a
+#   DB whose older rows changed needs a rebuild (non-app/build_ann.py). The
+#   meta keeps a digest of the indexed vectors (rowids + store rows, in rowid
+#   order) so rows re-embedded in place are caught, not just removed ones.
+# - The WO range becomes an IDSelectorBitmap over rowids, applied during the
+#   graph walk. Ranges holding only a few rows skip the graph and scan those
+#   rows exactly.
+# faiss is optional: without it every caller falls back to the exact path.
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import vector_store
+
+try:
+    import faiss
+except ImportError:  # optional dependency
+    faiss = None
+
+# auto: use an index when one exists and the store is large enough; off: never
+ANN_MODE = os.getenv("ASKAI_ANN", "auto")
+ANN_MIN_ROWS = int(os.getenv("ASKAI_ANN_MIN_ROWS", "200000"))
+HNSW_M = int(os.getenv("ASKAI_ANN_M", "32"))
+EF_CONSTRUCTION = int(os.getenv("ASKAI_ANN_EF_CONSTRUCTION", "80"))
+EF_SEARCH = int(os.getenv("ASKAI_ANN_EF_SEARCH", "128"))
+# New rows added while serving a query; more than this waits for build_ann.py
+MAX_INLINE_ADD = int(os.getenv("ASKAI_ANN_MAX_INLINE_ADD", "20000"))
+# WO ranges holding fewer rows than this are scanned exactly instead
+EXACT_SUBSET_ROWS = int(os.getenv("ASKAI_ANN_EXACT_SUBSET", "20000"))
+ADD_BATCH_ROWS = 50000
+
+INDEX_SUFFIX = ".ann.faiss"
+META_SUFFIX = ".ann.json"
+
+
+def available() -> bool:
+    return faiss is not None
+
+
+def index_paths(db_path: str) -> Tuple[str, str]:
+    return (db_path + INDEX_SUFFIX, db_path + META_SUFFIX)
+
+
+class AnnIndex:
+    def __init__(self, index, meta: Dict):
+        self.index = index
+        self.meta = meta
+
+    def __len__(self) -> int:
+        return int(self.index.ntotal)
+
+    def search(
+        self,
+        query_vec: np.ndarray,
+        k: int,
+        allowed_ids: Optional[np.ndarray] = None,
+        ef_search: int = EF_SEARCH,
+    ) -> List[Tuple[int, float]]:
+        """Approximate cosine top-k over rowids, optionally restricted to `allowed_ids`."""
+        if len(self) == 0 or k <= 0:
+            return []
+        q = vector_store.l2_normalize(np.asarray(query_vec, dtype=np.float32).reshape(1, -1))
+        bitmap = None
+        params = faiss.SearchParametersHNSW(efSearch=max(ef_search, k))
+        if allowed_ids is not None:
+            if len(allowed_ids) == 0:
+                return []
+            # bit i of byte j selects rowid 8*j + i; keep `bitmap` alive for the search
+            bits = np.zeros(int(allowed_ids.max()) + 1, dtype=bool)
+            bits[allowed_ids] = True
+            bitmap = np.packbits(bits, bitorder="little")
+            params.sel = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        scores, labels = self.index.search(q, k, params=params)
+        return [(int(rid), float(s)) for rid, s in zip(labels[0], scores[0]) if rid >= 0]
+
+    def add(self, vecs: np.ndarray, rowids: np.ndarray) -> None:
+        """Not safe alongside searches; only used on indexes no reader holds yet."""
+        self.index.add_with_ids(np.ascontiguousarray(vecs, dtype=np.float32), rowids.astype(np.int64))
+        self.meta["count"] = len(self)
+        self.meta["max_rowid"] = max(int(self.meta.get("max_rowid", -1)), int(rowids.max()))
+
+
+class _Digest:
+    """Running hash of store rows (rowids and vectors as separate streams, so chunking doesn't matter)."""
+
+    def __init__(self):
+        self.ids = hashlib.blake2b(digest_size=16)
+        self.vecs = hashlib.blake2b(digest_size=16)
+
+    def update(self, store: vector_store.VectorStore, start: int, end: int) -> "_Digest":
+        for lo in range(start, end, ADD_BATCH_ROWS):
+            hi = min(end, lo + ADD_BATCH_ROWS)
+            self.ids.update(np.ascontiguousarray(store.ids[lo:hi], dtype=np.int64).tobytes())
+            self.vecs.update(np.ascontiguousarray(store.matrix[lo:hi]).tobytes())
+        return self
+
+    def hexdigest(self) -> str:
+        return self.ids.hexdigest() + self.vecs.hexdigest()
+
+
+def _add_rows(ann: AnnIndex, store: vector_store.VectorStore, positions: np.ndarray) -> None:
+    for start in range(0, len(positions), ADD_BATCH_ROWS):
+        pos = positions[start:start + ADD_BATCH_ROWS]
+        ann.add(np.asarray(store.matrix[pos], dtype=np.float32), np.asarray(store.ids[pos]))
+
+
+def _save(db_path: str, ann: AnnIndex) -> None:
+    index_path, meta_path = index_paths(db_path)
+    tmp = index_path + ".tmp"
+    faiss.write_index(ann.index, tmp)
+    os.replace(tmp, index_path)
+    tmp_meta = meta_path + ".tmp"
+    with open(tmp_meta, "w", encoding="utf-8") as fh:
+        json.dump(ann.meta, fh)
+    os.replace(tmp_meta, meta_path)
+    with _INDEX_LOCK:
+        _INDEX_CACHE.pop(os.path.normcase(os.path.abspath(db_path)), None)
+
+
+def build(
+    db_path: str,
+    store: vector_store.VectorStore,
+    m: int = HNSW_M,
+    ef_construction: int = EF_CONSTRUCTION,
+) -> Dict:
+    """Build the HNSW index from every row of `store` and write it next to the DB."""
+    if faiss is None:
+        raise RuntimeError("faiss is not installed (pip install faiss-cpu)")
+    t0 = time.perf_counter()
+    dim = int(store.matrix.shape[1]) if len(store) else 0
+    hnsw = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+    hnsw.hnsw.efConstruction = ef_construction
+    ann = AnnIndex(faiss.IndexIDMap(hnsw), {
+        "db_stamp": store.meta.get("db_stamp"),
+        "count": 0,
+        "max_rowid": -1,
+        "dim": dim,
+        "m": m,
+        "ef_construction": ef_construction,
+    })
+    _add_rows(ann, store, np.arange(len(store)))
+    ann.meta["digest"] = _Digest().update(store, 0, len(store)).hexdigest()
+    ann.meta["build_seconds"] = round(time.perf_counter() - t0, 2)
+    ann.meta["built_at"] = time.time()
+    _save(db_path, ann)
+    return ann.meta
+
+
+# -----------------------------
+# Loading / incremental sync
+# -----------------------------
+_INDEX_CACHE: Dict[str, Tuple[int, AnnIndex]] = {}
+_INDEX_LOCK = threading.Lock()
+# db path -> (store db_stamp, index digest, "pending" | "stale"): one entry per
+# DB, so a query against an index that is behind returns at once
+_SYNC_STATE: Dict[str, Tuple[Optional[str], Optional[str], str]] = {}
+_SYNC_STATE_LOCK = threading.Lock()
+# Catching up reads the whole index and hashes the store: never on a request thread
+_SYNC_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ann-sync")
+
+
+def _read(db_path: str) -> Optional[AnnIndex]:
+    index_path, meta_path = index_paths(db_path)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except FileNotFoundError:
+        return None
+    return AnnIndex(faiss.read_index(index_path), meta)
+
+
+def load(db_path: str) -> Optional[AnnIndex]:
+    """The index for `db_path` (cached per process), or None if none was built."""
+    if faiss is None:
+        return None
+    try:
+        meta_mtime = os.stat(index_paths(db_path)[1]).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = os.path.normcase(os.path.abspath(db_path))
+    with _INDEX_LOCK:
+        hit = _INDEX_CACHE.get(key)
+    if hit and hit[0] == meta_mtime:
+        return hit[1]
+    ann = _read(db_path)
+    if ann is not None:
+        with _INDEX_LOCK:
+            _INDEX_CACHE[key] = (meta_mtime, ann)
+    return ann
+
+
+def _catch_up(db_path: str, store: vector_store.VectorStore, max_add: Optional[int]) -> bool:
+    """Append the rows `store` has past the index and save it; False if the index is stale."""
+    # Append to a private copy; readers keep the cached one until the swap
+    ann = _read(db_path)
+    if ann is None:
+        return False
+    ids = np.asarray(store.ids)
+    old = ids <= int(ann.meta.get("max_rowid", -1))
+    new_pos = np.flatnonzero(~old)
+    n_old = int(np.count_nonzero(old))
+    if (
+        n_old != len(ann)
+        or int(store.matrix.shape[1]) != int(ann.meta.get("dim", 0))
+        or (max_add is not None and len(new_pos) > max_add)
+    ):
+        return False
+    # Same rows up to max_rowid must also mean the same vectors (ids are sorted)
+    digest = _Digest().update(store, 0, n_old)
+    if digest.hexdigest() != ann.meta.get("digest"):
+        return False
+    if len(new_pos):
+        _add_rows(ann, store, new_pos)
+    ann.meta["digest"] = digest.update(store, n_old, len(store)).hexdigest()
+    ann.meta["db_stamp"] = store.meta.get("db_stamp")
+    _save(db_path, ann)
+    print(f"🧮 ANN index for {os.path.basename(db_path)}: +{len(new_pos)} rows")
+    return True
+
+
+def _sync_job(key: str, state: Tuple, db_path: str, store: vector_store.VectorStore,
+              max_add: Optional[int]) -> None:
+    try:
+        ok = _catch_up(db_path, store, max_add)
+    except Exception as e:
+        print(f"⚠️ ANN sync failed for {os.path.basename(db_path)}: {e}")
+        ok = False
+    with _SYNC_STATE_LOCK:
+        if _SYNC_STATE.get(key) != state:
+            return
+        if ok:
+            _SYNC_STATE.pop(key, None)
+        else:
+            _SYNC_STATE[key] = state[:2] + ("stale",)
+    if not ok:
+        print(f"⚠️ ANN index for {os.path.basename(db_path)} is stale; "
+              "using exact search until non-app/build_ann.py rebuilds it")
+
+
+def sync(db_path: str, store: vector_store.VectorStore, max_add: Optional[int] = MAX_INLINE_ADD) -> Optional[AnnIndex]:
+    """
+    The index for `db_path` if it is in step with `store`, else None (exact
+    search). An index that is behind is caught up in the background: rows
+    appended since it was built are added and saved. One that can't be caught
+    up by appending (rows removed, renumbered or re-embedded, or more than
+    `max_add` new) stays None for that store until it is rebuilt.
+    """
+    ann = load(db_path)
+    if ann is None:
+        return None
+    stamp = store.meta.get("db_stamp")
+    if ann.meta.get("db_stamp") == stamp:
+        return ann
+    key = os.path.normcase(os.path.abspath(db_path))
+    state = (stamp, ann.meta.get("digest"), "pending")
+    with _SYNC_STATE_LOCK:
+        prev = _SYNC_STATE.get(key)
+        if prev and prev[:2] == state[:2]:
+            return None
+        _SYNC_STATE[key] = state
+    _SYNC_POOL.submit(_sync_job, key, state, db_path, store, max_add)
+    return None
+
+
+def search_store(
+    db_path: str,
+    store: vector_store.VectorStore,
+    query_vec: np.ndarray,
+    k: int,
+    min_wo: int,
+    max_wo: int,
+) -> Optional[List[Tuple[int, float]]]:
+    """
+    ANN top-k for rank_documents, or None when the exact path should be used
+    (ANN off, faiss missing, small store, no usable index).
+    """
+    if faiss is None or ANN_MODE == "off" or len(store) < ANN_MIN_ROWS:
+        return None
+    ann = sync(db_path, store)
+    if ann is None:
+        return None
+    mask = store.wo_mask(min_wo, max_wo)
+    if mask is None or mask.all():
+        return ann.search(query_vec, k)
+    if np.count_nonzero(mask) <= EXACT_SUBSET_ROWS:
+        return store.search(query_vec, k, allowed=mask)
+    return ann.search(query_vec, k, allowed_ids=np.asarray(store.ids)[mask])
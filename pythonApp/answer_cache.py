@@ -0,0 +1,243 @@
+# answer_cache.py
+# Dedicated answer cache for AskAI, stored next to chat_history in chat_history.db.
+#
+# Entries are keyed by a hash of the normalized question, the content DB name and
+# content version, the retrieval parameters and the scope (a user, or "*" when
+# answers are shared across users). A hit therefore skips retrieval as well as
+# Gemini: with the DB contents unchanged, retrieval would return the same chunks,
+# whose ids are stored with the entry for provenance.
+#
+# Bounded by TTL and by row count (least-recently-hit rows are evicted first).
+# An optional embedding lookup serves near-duplicate phrasings.
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CACHE_TTL_S = float(os.getenv("ASKAI_CACHE_TTL_S", str(7 * 24 * 3600)))
+CACHE_MAX_ROWS = int(os.getenv("ASKAI_CACHE_MAX_ROWS", "5000"))
+CACHE_SHARED = os.getenv("ASKAI_CACHE_SHARED", "0") == "1"
+CACHE_SEMANTIC = os.getenv("ASKAI_CACHE_SEMANTIC", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("ASKAI_CACHE_SEMANTIC_MIN", "0.95"))
+# Candidates compared per semantic lookup (most recently hit first)
+SEMANTIC_SCAN_LIMIT = 500
+# Run the size-bound eviction every N puts rather than on every write
+EVICT_EVERY = 50
+
+_norm_re = re.compile(r"[^\w\s-]+")
+_space_re = re.compile(r"\s+")
+
+
+def normalize_question(q: str) -> str:
+    """Lowercase, drop punctuation (keeping WO-style dashes), collapse whitespace."""
+    q = _norm_re.sub(" ", (q or "").lower())
+    return _space_re.sub(" ", q).strip()
+
+
+def question_hash(q: str) -> str:
+    return hashlib.sha256(normalize_question(q).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "puts": 0, "evicted": 0}
+        self._init_table()
+
+    def _conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_table(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    key        TEXT PRIMARY KEY,
+                    qhash      TEXT NOT NULL,
+                    question   TEXT,
+                    db_name    TEXT NOT NULL,
+                    db_version TEXT NOT NULL,
+                    params     TEXT NOT NULL,
+                    scope      TEXT NOT NULL,
+                    answer     TEXT NOT NULL,
+                    sources    TEXT,
+                    chunk_ids  TEXT,
+                    chat_id    INTEGER,
+                    q_embedding BLOB,
+                    created_at REAL NOT NULL,
+                    last_hit   REAL NOT NULL,
+                    hits       INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_answer_cache_lookup "
+                "ON answer_cache(db_name, db_version, params, scope, last_hit)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_last_hit ON answer_cache(last_hit)")
+
+    @staticmethod
+    def scope_for(user: str, shared: Optional[bool] = None) -> str:
+        return "*" if (CACHE_SHARED if shared is None else shared) else (user or "guest")
+
+    @staticmethod
+    def make_key(qhash: str, db_name: str, db_version: str, params: str, scope: str) -> str:
+        raw = "\x1f".join((qhash, db_name, db_version, params, scope))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _entry(row) -> Dict:
+        return {
+            "answer": row[0],
+            "sources": json.loads(row[1] or "[]"),
+            "chunk_ids": json.loads(row[2] or "[]"),
+            "chat_id": row[3],
+        }
+
+    def get(
+        self,
+        question: str,
+        db_name: str,
+        db_version: str,
+        params: str,
+        scope: str,
+        embed_fn: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+    ) -> Optional[Dict]:
+        """
+        Exact lookup on the normalized question; with embed_fn (semantic mode),
+        fall back to the closest cached question above SEMANTIC_THRESHOLD.
+        Returns {answer, sources, chunk_ids, chat_id} or None.
+        """
+        now = time.time()
+        key = self.make_key(question_hash(question), db_name, db_version, params, scope)
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT answer, sources, chunk_ids, chat_id, created_at FROM answer_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row and now - row[4] <= CACHE_TTL_S:
+                conn.execute("UPDATE answer_cache SET last_hit = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                with self._lock:
+                    self.stats["hits"] += 1
+                return self._entry(row)
+
+            if embed_fn is not None:
+                cands = conn.execute(
+                    """
+                    SELECT key, answer, sources, chunk_ids, chat_id, q_embedding
+                    FROM answer_cache
+                    WHERE db_name = ? AND db_version = ? AND params = ? AND scope = ?
+                      AND q_embedding IS NOT NULL AND created_at >= ?
+                    ORDER BY last_hit DESC LIMIT ?
+                    """,
+                    (db_name, db_version, params, scope, now - CACHE_TTL_S, SEMANTIC_SCAN_LIMIT),
+                ).fetchall()
+                if cands:
+                    q = np.asarray(embed_fn([question])[0], dtype=np.float32)
+                    q /= (np.linalg.norm(q) or 1.0)
+                    # Entries embedded by another model (different width) can't match
+                    cands = [c for c in cands if len(c[5]) == q.nbytes]
+                if cands:
+                    mat = np.stack([np.frombuffer(c[5], dtype=np.float32) for c in cands])
+                    sims = mat @ q
+                    best = int(np.argmax(sims))
+                    if float(sims[best]) >= SEMANTIC_THRESHOLD:
+                        conn.execute(
+                            "UPDATE answer_cache SET last_hit = ?, hits = hits + 1 WHERE key = ?",
+                            (now, cands[best][0]),
+                        )
+                        with self._lock:
+                            self.stats["semantic_hits"] += 1
+                        return self._entry(cands[best][1:5])
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(
+        self,
+        question: str,
+        db_name: str,
+        db_version: str,
+        params: str,
+        scope: str,
+        answer: str,
+        sources: List[str],
+        chunk_ids: List,
+        chat_id: Optional[int] = None,
+        embed_fn: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+    ) -> str:
+        """Store an answer (embedding the question in semantic mode); returns its key."""
+        now = time.time()
+        qhash = question_hash(question)
+        key = self.make_key(qhash, db_name, db_version, params, scope)
+        emb = None
+        if embed_fn is not None:
+            v = np.asarray(embed_fn([question])[0], dtype=np.float32)
+            emb = (v / (np.linalg.norm(v) or 1.0)).tobytes()
+        with self._conn() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO answer_cache
+                  (key, qhash, question, db_name, db_version, params, scope, answer,
+                   sources, chunk_ids, chat_id, q_embedding, created_at, last_hit, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+                """,
+                (key, qhash, question, db_name, db_version, params, scope, answer,
+                 json.dumps(sources), json.dumps(chunk_ids), chat_id, emb, now, now),
+            )
+        with self._lock:
+            self.stats["puts"] += 1
+            self._puts += 1
+            due = self._puts % EVICT_EVERY == 0
+        if due:
+            self.evict()
+        return key
+
+    def set_chat_id(self, key: str, chat_id: Optional[int]) -> None:
+        """Attach the chat_history id once the (asynchronous) row has been written."""
+        with self._conn() as conn:
+            conn.execute("UPDATE answer_cache SET chat_id = ? WHERE key = ? AND chat_id IS NULL", (chat_id, key))
+
+    def evict(self) -> int:
+        """Drop expired rows, then least-recently-hit rows beyond CACHE_MAX_ROWS."""
+        with self._conn() as conn:
+            n = conn.execute(
+                "DELETE FROM answer_cache WHERE created_at < ?", (time.time() - CACHE_TTL_S,)
+            ).rowcount
+            total = conn.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+            if total > CACHE_MAX_ROWS:
+                n += conn.execute(
+                    """
+                    DELETE FROM answer_cache WHERE key IN (
+                        SELECT key FROM answer_cache ORDER BY last_hit ASC LIMIT ?
+                    )
+                    """,
+                    (total - CACHE_MAX_ROWS,),
+                ).rowcount
+        with self._lock:
+            self.stats["evicted"] += n
+        return n
+
+    def clear(self, db_name: Optional[str] = None) -> int:
+        with self._conn() as conn:
+            if db_name:
+                return conn.execute("DELETE FROM answer_cache WHERE db_name = ?", (db_name,)).rowcount
+            return conn.execute("DELETE FROM answer_cache").rowcount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            out = dict(self.stats)
+        out.update({"ttl_s": CACHE_TTL_S, "max_rows": CACHE_MAX_ROWS, "shared": CACHE_SHARED, "semantic": CACHE_SEMANTIC})
+        return out
@@ -14,7 +14,8 @@ from flask_cors import CORS
 from reports import reports_bp
 from reports_binder import reports_binder_bp
 from core_box_inventory import corebox_bp
-from askai import askai_bp
+from askai import askai_bp, pool_stats as askai_pool_stats, runtime_stats as askai_runtime_stats
+from llm_scheduler import SchedulerBusy, scheduler as llm_scheduler
 from s3 import s3_bp
 from server_search import server_search_bp
 
@@ -37,6 +38,7 @@ TABLE_NAME = "pr_data"
 def init_db():
     os.makedirs(UPLOADS_DIR, exist_ok=True)
     with sqlite3.connect(DB_FILE) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS chat_history (
@@ -87,7 +89,8 @@ def create_app() -> Flask:
     # Health check
     @app.get("/api/health")
     def health():
-        return jsonify({"ok": True, "t": time.time()})
+        return jsonify({"ok": True, "t": time.time(), "askai_pool": askai_pool_stats(),
+                        "llm_scheduler": llm_scheduler.snapshot(), "askai": askai_runtime_stats()})
 
     # -------------------------------------------------------------------------
     # Register blueprints
@@ -121,8 +124,14 @@ def create_app() -> Flask:
             if "image" not in request.files:
                 return jsonify({"error": "No image uploaded."}), 400
             image_file = request.files["image"]
-            extracted_text = extract_work_orders_from_image(image_file)
+            user = request.form.get("user") or request.remote_addr or "guest"
+            extracted_text = extract_work_orders_from_image(image_file, user=user)
             return jsonify({"recognized_work_orders": extracted_text})
+        except SchedulerBusy as e:
+            resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+            resp.status_code = 429
+            resp.headers["Retry-After"] = str(e.retry_after)
+            return resp
         except Exception as e:
             traceback.print_exc()
             return jsonify({"error": f"OCR failed: {str(e)}"}), 500
@@ -269,11 +278,14 @@ def create_app() -> Flask:
 # -----------------------------------------------------------------------------
 # Entrypoint
 # -----------------------------------------------------------------------------
-print("🔧 Starting app...")
-init_db()
-init_users_db()
-app = create_app()
-print("✅ Ready to run Flask")
+# Spawned worker processes (embed_pipeline) re-import this module as
+# __mp_main__ when the server runs as `python app.py`; they skip startup.
+if __name__ != "__mp_main__":
+    print("🔧 Starting app...")
+    init_db()
+    init_users_db()
+    app = create_app()
+    print("✅ Ready to run Flask")
 
 if __name__ == "__main__":
     # Ensure the server listens on all interfaces in prod-like envs
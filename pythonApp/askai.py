@@ -3,13 +3,35 @@
 # Self-contained (no external engine module). Multi-source synthesis from top-20 chunks.
 
 from __future__ import annotations
+import contextvars
+import json
 import os
 import re
 import sqlite3
-from datetime import datetime
-from typing import Iterable, List, Dict, Tuple, Optional
-
-from flask import Blueprint, jsonify, request
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import groupby
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Dict, Tuple, Optional
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+import embed_pipeline
+import vector_store
+from answer_cache import AnswerCache, CACHE_SEMANTIC, normalize_question
+from chat_store import ChatHistoryWriter, init_chat_schema, prune_history
+from context_packer import CONTEXT_TOKENS, estimate_tokens, pack_context
+from retrieval_cache import RetrievalCache
+from embedder import MODEL_NAME as EMBED_MODEL, BACKEND as EMBED_BACKEND, embed_many, embed_queries, loaded_backend
+from embedder import service as _EMBED_SERVICE
+from term_matcher import term_matcher
+import timings
+from timings import StageHistograms, log_event, stage
+from llm_gateway import LLMGateway
+from llm_scheduler import BATCH, INTERACTIVE, SchedulerBusy, scheduler as _LLM_SCHEDULER
 
 # -----------------------------
 # Gemini setup (google-generativeai)
@@ -29,6 +51,16 @@ except Exception as _e:
     print("⚠️ Gemini client init failed:", _e)
     _gemini_client_ok = False
 
+# One shared model client; identical concurrent prompts share a single call,
+# a circuit breaker falls back to extractive answers while Gemini is failing,
+# and the fair-share scheduler (shared with ocr.py) caps concurrent calls.
+_LLM = LLMGateway(
+    lambda: genai.GenerativeModel(_GEMINI_MODEL),  # type: ignore
+    enabled=_gemini_client_ok,
+    name=_GEMINI_MODEL,
+    scheduler=_LLM_SCHEDULER,
+)
+
 # -----------------------------
 # Paths & constants
 # -----------------------------
@@ -37,10 +69,13 @@ UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
 
 # Dedicated chat history DB (separate from content DBs in uploads/)
 CHAT_DB = os.path.join(UPLOADS_DIR, "chat_history.db")
+# Where /chat-history/prune moves old rows when archiving
+CHAT_ARCHIVE_DB = os.path.join(UPLOADS_DIR, "chat_history_archive.db")
 
 # Databases to hide from the "Select database" dropdown
 RESTRICTED_DBS = {
     "chat_history.db",
+    "chat_history_archive.db",
     "reports.db",
     "user_roles.db",
     "pr_data.db",
@@ -50,30 +85,46 @@ RESTRICTED_DBS = {
 # Enable admin endpoints to build chunk DBs
 ENABLE_ADMIN = os.getenv("ASKAI_ENABLE_ADMIN", "0") == "1"
 
+# Read-only connection pool for content DBs (per DB file)
+POOL_SIZE = int(os.getenv("ASKAI_POOL_SIZE", "8"))
+POOL_TIMEOUT_S = float(os.getenv("ASKAI_POOL_TIMEOUT", "10"))
+POOL_CACHE_KB = int(os.getenv("ASKAI_SQLITE_CACHE_KB", "65536"))
+POOL_MMAP_BYTES = int(os.getenv("ASKAI_SQLITE_MMAP_MB", "256")) * 1024 * 1024
+
+# Retrieval: "lexical" (FTS/LIKE only), "hybrid" (FTS + dense vectors, RRF) or
+# "auto" (hybrid whenever a fresh vector store exists next to the DB)
+RETRIEVAL_MODE = os.getenv("ASKAI_RETRIEVAL", "auto")
+RRF_K = 60
+# Worker threads shared by federated (multi-DB) searches
+FEDERATED_WORKERS = int(os.getenv("ASKAI_FEDERATED_WORKERS", "8"))
+# /question/batch: concurrent items, max questions per batch, job retention
+BATCH_WORKERS = int(os.getenv("ASKAI_BATCH_WORKERS", "4"))
+BATCH_MAX_QUESTIONS = int(os.getenv("ASKAI_BATCH_MAX", "500"))
+BATCH_JOB_TTL_S = float(os.getenv("ASKAI_BATCH_JOB_TTL_S", "3600"))
+
 askai_bp = Blueprint("askai", __name__)
 
 # -----------------------------
 # One-time DB init (chat history)
 # -----------------------------
 def _init_chat_db() -> None:
-    os.makedirs(UPLOADS_DIR, exist_ok=True)
-    with sqlite3.connect(CHAT_DB) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS chat_history (
-                id        INTEGER PRIMARY KEY AUTOINCREMENT,
-                user      TEXT,
-                question  TEXT,
-                answer    TEXT,
-                sources   TEXT,
-                timestamp TEXT,
-                db_name   TEXT
-            )
-            """
-        )
+    init_chat_schema(CHAT_DB)
 
 _init_chat_db()
 
+_ANSWER_CACHE = AnswerCache(CHAT_DB)
+# Attaches chat_history ids to cached answers, so the chat writer only writes
+_CACHE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="askai-cache")
+# chat_history inserts are batched off the request path (flushed at exit)
+_CHAT_WRITER = ChatHistoryWriter(CHAT_DB)
+
+def _db_content_version(db_path: str) -> str:
+    """
+    Version string caches key on: askai_meta.content_version (bumped by every
+    build/upsert/delete) when present, else the file's mtime:size.
+    """
+    return vector_store.db_stamp(db_path)
+
 # -----------------------------
 # Utilities (schema + search)
 # -----------------------------
@@ -106,13 +157,118 @@ def _expand_terms(ts: List[str]) -> List[str]:
             out.update(syns)
     return list(out)
 
-def _connect(db_path: str) -> sqlite3.Connection:
+def _connect_ro(db_path: str) -> sqlite3.Connection:
+    """Read-only connection tuned for repeated FTS reads (used by the pool)."""
     if not os.path.exists(db_path):
         raise FileNotFoundError(f"DB not found: {db_path}")
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(vector_store.ro_uri(db_path), uri=True, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA cache_size = -{POOL_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {POOL_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
+def _file_identity(db_path: str) -> Tuple[int, int]:
+    """(device, inode) — changes when a DB is swapped in with os.replace."""
+    st = os.stat(db_path)
+    return (st.st_dev, st.st_ino)
+
+class _ConnPool:
+    """
+    Bounded per-DB pool of read-only connections. Keeping connections alive keeps
+    SQLite's page cache (and the mmap) warm between requests. A connection whose
+    file was replaced on disk is dropped instead of being handed out again.
+    """
+
+    def __init__(self, size: int, timeout_s: float):
+        self._size = max(1, size)
+        self._timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[Tuple[Tuple[int, int], sqlite3.Connection]]] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats = {"hits": 0, "opens": 0, "discards": 0, "waits": 0, "wait_ms": 0.0, "timeouts": 0}
+
+    def _key(self, db_path: str) -> str:
+        return os.path.normcase(os.path.abspath(db_path))
+
+    @contextmanager
+    def connection(self, db_path: str) -> Iterator[sqlite3.Connection]:
+        key = self._key(db_path)
+        with self._lock:
+            slots = self._slots.setdefault(key, threading.BoundedSemaphore(self._size))
+
+        t0 = time.perf_counter()
+        if not slots.acquire(blocking=False):
+            ok = slots.acquire(timeout=self._timeout_s)
+            waited_ms = (time.perf_counter() - t0) * 1000.0
+            with self._lock:
+                self._stats["waits"] += 1
+                self._stats["wait_ms"] += waited_ms
+                if not ok:
+                    self._stats["timeouts"] += 1
+            if not ok:
+                raise TimeoutError(f"No free connection for {os.path.basename(db_path)}")
+
+        conn: Optional[sqlite3.Connection] = None
+        try:
+            ident = _file_identity(db_path)
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                while idle and conn is None:
+                    cand_ident, cand = idle.pop()
+                    if cand_ident == ident:
+                        conn = cand
+                        self._stats["hits"] += 1
+                    else:
+                        self._stats["discards"] += 1
+                        cand.close()
+            if conn is None:
+                conn = _connect_ro(db_path)
+                with self._lock:
+                    self._stats["opens"] += 1
+
+            yield conn
+
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._idle.setdefault(key, []).append((ident, conn))
+            conn = None
+        finally:
+            if conn is not None:
+                # Errored mid-use: don't recycle a connection in an unknown state
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            slots.release()
+
+    def evict(self, db_path: str) -> None:
+        """Close idle connections for one DB (e.g. before it is rebuilt)."""
+        with self._lock:
+            idle = self._idle.pop(self._key(db_path), [])
+        for _, conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["idle"] = sum(len(v) for v in self._idle.values())
+            out["dbs"] = len(self._slots)
+        out["wait_ms"] = round(out["wait_ms"], 2)
+        out["size_per_db"] = self._size
+        return out
+
+_POOL = _ConnPool(POOL_SIZE, POOL_TIMEOUT_S)
+
+def _pooled(db_path: str):
+    """`with _pooled(path) as conn:` — pooled read-only connection to a content DB."""
+    return _POOL.connection(db_path)
+
+def pool_stats() -> Dict:
+    return _POOL.stats()
+
 def _list_user_dbs() -> List[str]:
     """Scan uploads/ for .db files (excluding restricted)."""
     if not os.path.exists(UPLOADS_DIR):
@@ -144,21 +300,20 @@ def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
     return [r["name"] for r in conn.execute(f"PRAGMA table_info({table})")]
 
 def _table_has_any(conn: sqlite3.Connection, table: str, candidates: Iterable[str]) -> Optional[str]:
-    cols = [c.lower() for c in _table_columns(conn, table)]
+    by_lower = {c.lower(): c for c in _table_columns(conn, table)}
     for cand in candidates:
-        if cand.lower() in cols:
-            for wc in _table_columns(conn, table):
-                if wc.lower() == cand.lower():
-                    return wc
+        if cand.lower() in by_lower:
+            return by_lower[cand.lower()]
     return None
 
 def _detect_content_table(conn: sqlite3.Connection) -> Tuple[str, str]:
     """
     Find a table with textual chunks. Prefer <known>_fts, then any *_fts,
-    then known base tables, then any with a content-like column.
+    then known base tables, then any with a content-like column. askai's own
+    tables (sentence index, meta) never count.
     Returns (table_name, content_col).
     """
-    tables = _list_tables(conn)
+    tables = [t for t in _list_tables(conn) if not t.startswith(ASKAI_TABLE_PREFIX)]
 
     # known FTS companions
     for base in KNOWN_BASE_TABLES:
@@ -199,11 +354,209 @@ def _file_column(conn: sqlite3.Connection, table: str) -> Optional[str]:
 def _wo_column(conn: sqlite3.Connection, table: str) -> Optional[str]:
     return _pick_column(conn, table, WO_COL_CANDIDATES)
 
-def _count_hits(text: str, ts: Iterable[str]) -> int:
-    if not text:
-        return 0
-    tl = text.lower()
-    return sum(tl.count(t) for t in ts)
+# -----------------------------
+# Schema profile cache
+# -----------------------------
+# Index askai creates on the integer WO column so range filters run in SQL
+WO_INDEX_NAME = "askai_wo_idx"
+# Normalized integer column added to legacy tables whose WO values are text
+WO_NUM_COL = "wo_num"
+# Tables askai creates in content DBs carry this prefix, so schema detection
+# can skip them and rebuilds never touch a user's table
+ASKAI_TABLE_PREFIX = "askai_"
+SENTENCE_TABLE = "askai_sentences"
+SENTENCE_FTS = "askai_sentences_fts"
+SENTENCE_INDEX_NAME = "askai_sentences_file"
+
+@dataclass(frozen=True)
+class SchemaProfile:
+    """Everything search/quick-view need to know about a content DB's layout."""
+    table: str
+    content_col: str
+    file_col: Optional[str]
+    wo_col: Optional[str]
+    pk_expr: str
+    is_fts: bool
+    # External-content table behind an FTS index (e.g. chunks for chunks_fts);
+    # file/WO columns are read from it through a rowid join.
+    base_table: Optional[str] = None
+    base_pk: str = "rowid"
+    # Indexed integer WO column on row_table, used for SQL range pushdown
+    wo_int_col: Optional[str] = None
+    # Precomputed per-file sentence index (SENTENCE_TABLE + SENTENCE_FTS) present
+    has_sentences: bool = False
+
+    @property
+    def row_table(self) -> str:
+        """Table that owns file/WO metadata."""
+        return self.base_table or self.table
+
+    @property
+    def from_sql(self) -> str:
+        if self.base_table:
+            return (f"{self.table} JOIN {self.base_table} "
+                    f"ON {self.base_table}.{self.base_pk} = {self.table}.rowid")
+        return self.table
+
+    @property
+    def chunk_id_expr(self) -> str:
+        return f"{self.table}.{self.pk_expr}"
+
+    @property
+    def file_expr(self) -> Optional[str]:
+        return f"{self.row_table}.{self.file_col}" if self.file_col else None
+
+    @property
+    def wo_expr(self) -> Optional[str]:
+        return f"{self.row_table}.{self.wo_col}" if self.wo_col else None
+
+    def select_cols(self, with_content: bool = True) -> str:
+        """chunk_id plus file/WO columns (aliased to their plain names) and content."""
+        cols = [f"{self.chunk_id_expr} AS chunk_id"]
+        if self.file_col:
+            cols.append(f"{self.file_expr} AS {self.file_col}")
+        if with_content:
+            cols.append(f"{self.table}.{self.content_col} AS {self.content_col}")
+        if self.wo_col:
+            cols.append(f"{self.wo_expr} AS {self.wo_col}")
+        return ", ".join(cols)
+
+    def wo_range_sql(self, min_wo: int, max_wo: int) -> Tuple[str, Tuple]:
+        """(" AND ...", params) restricting to the WO range, or ("", ()) if it can't/needn't."""
+        if not self.wo_int_col or (min_wo <= 0 and max_wo >= 99999999):
+            return "", ()
+        col = f"{self.row_table}.{self.wo_int_col}"
+        # Rows without a WO stay visible, as they always have
+        return f" AND ({col} IS NULL OR {col} BETWEEN ? AND ?)", (min_wo, max_wo)
+
+# db path -> (stamp, profile); stamp = (mtime_ns, size, schema_version)
+_PROFILE_CACHE: Dict[str, Tuple[Tuple[int, int, int], SchemaProfile]] = {}
+_PROFILE_LOCK = threading.Lock()
+
+def _main_db_file(conn: sqlite3.Connection) -> str:
+    """Filesystem path of the connection's main database ('' for :memory:)."""
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return row[2] or ""
+    return ""
+
+def _profile_stamp(conn: sqlite3.Connection, db_file: str) -> Tuple[int, int, int]:
+    st = os.stat(db_file)
+    schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    return (st.st_mtime_ns, st.st_size, int(schema_version))
+
+def _wo_to_int(value) -> Optional[int]:
+    """Leading digit run of a WO value ("8292-05B" -> 8292), or None."""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    m = re.search(r"(\d{1,})", str(value))
+    return int(m.group(1)) if m else None
+
+def _fts_content_table(conn: sqlite3.Connection, fts_table: str) -> Tuple[Optional[str], str]:
+    """(content table, content_rowid) of an external-content FTS5 table, else (None, 'rowid')."""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (fts_table,)
+    ).fetchone()
+    sql = (row[0] if row else "") or ""
+    m = re.search(r"content\s*=\s*['\"]?(\w+)", sql)
+    if not m:
+        return None, "rowid"
+    r = re.search(r"content_rowid\s*=\s*['\"]?(\w+)", sql)
+    return m.group(1), (r.group(1) if r else "rowid")
+
+def _indexed_wo_column(conn: sqlite3.Connection, table: str) -> Optional[str]:
+    for idx in conn.execute(f"PRAGMA index_list({table})"):
+        if idx[1] == WO_INDEX_NAME:
+            info = conn.execute(f"PRAGMA index_info({WO_INDEX_NAME})").fetchone()
+            return info[2] if info else None
+    return None
+
+def _add_wo_index(conn: sqlite3.Connection, table: str, wo_col: str) -> str:
+    """
+    Give `table` an indexed integer WO column and return its name. Uses `wo_col`
+    directly when it only holds integers, otherwise adds WO_NUM_COL filled with
+    the normalized value.
+    """
+    non_int = conn.execute(
+        f"SELECT 1 FROM {table} WHERE typeof({wo_col}) NOT IN ('integer', 'null') LIMIT 1"
+    ).fetchone()
+    target = wo_col
+    if non_int:
+        target = WO_NUM_COL
+        cols = [r[1].lower() for r in conn.execute(f"PRAGMA table_info({table})")]
+        if WO_NUM_COL not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {WO_NUM_COL} INTEGER")
+        conn.create_function("askai_wo_int", 1, _wo_to_int, deterministic=True)
+        conn.execute(f"UPDATE {table} SET {WO_NUM_COL} = askai_wo_int({wo_col})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {WO_INDEX_NAME} ON {table}({target})")
+    return target
+
+def _probe_schema(conn: sqlite3.Connection) -> SchemaProfile:
+    table, content_col = _detect_content_table(conn)
+    # For FTS: use rowid; for normal tables: prefer 'id', else rowid.
+    is_fts = table.endswith("_fts")
+    has_id = "id" in (c.lower() for c in _table_columns(conn, table))
+
+    base_table, base_pk = (None, "rowid")
+    if is_fts:
+        base_table, base_pk = _fts_content_table(conn, table)
+        if base_table not in _list_tables(conn):
+            base_table, base_pk = (None, "rowid")
+
+    # Metadata columns: on the FTS table itself if present, else on its base table
+    file_col, wo_col = _file_column(conn, table), _wo_column(conn, table)
+    meta_on_base = False
+    if base_table and not file_col and not wo_col:
+        file_col, wo_col = _file_column(conn, base_table), _wo_column(conn, base_table)
+        meta_on_base = True
+    elif base_table is not None:
+        base_table = None  # FTS carries its own metadata; no join needed
+
+    # Integer WO pushdown needs a real (non-virtual) table with our index on it.
+    # Legacy DBs without one filter WO in Python until backfill_wo_index has run.
+    wo_int_col = None
+    row_table = base_table if meta_on_base else (None if is_fts else table)
+    if wo_col and row_table:
+        wo_int_col = _indexed_wo_column(conn, row_table)
+
+    return SchemaProfile(
+        table=table,
+        content_col=content_col,
+        file_col=file_col,
+        wo_col=wo_col,
+        pk_expr="rowid" if is_fts else ("id" if has_id else "rowid"),
+        is_fts=is_fts,
+        base_table=base_table,
+        base_pk=base_pk,
+        wo_int_col=wo_int_col,
+        has_sentences={SENTENCE_TABLE, SENTENCE_FTS} <= set(_list_tables(conn)),
+    )
+
+def _schema_profile(conn: sqlite3.Connection) -> SchemaProfile:
+    """
+    Cached schema detection. Probing sqlite_master/table_info on every request is
+    measurable on big chunk DBs, so the result is kept per DB file and re-probed
+    only when the file's mtime/size or PRAGMA schema_version moves.
+    """
+    db_file = _main_db_file(conn)
+    if not db_file:
+        return _probe_schema(conn)
+    key = os.path.normcase(os.path.abspath(db_file))
+    stamp = _profile_stamp(conn, db_file)
+    with _PROFILE_LOCK:
+        hit = _PROFILE_CACHE.get(key)
+    if hit and hit[0] == stamp:
+        return hit[1]
+    profile = _probe_schema(conn)
+    with _PROFILE_LOCK:
+        _PROFILE_CACHE[key] = (stamp, profile)
+    return profile
+
+def _invalidate_profile(db_path: str) -> None:
+    with _PROFILE_LOCK:
+        _PROFILE_CACHE.pop(os.path.normcase(os.path.abspath(db_path)), None)
 
 def _fts_query_from_terms(ts: List[str]) -> str:
     safe = [re.sub(r'[^A-Za-z0-9_\-./]', ' ', t).strip() for t in ts if t.strip()]
@@ -213,6 +566,86 @@ def _fts_query_from_terms(ts: List[str]) -> str:
     return " OR ".join(f"{t}*" for t in safe)
 
 
+def _wo_in_range(value, min_wo: int, max_wo: int) -> bool:
+    """Rows without a parseable WO are kept, matching the historical behaviour."""
+    wo_int = _wo_to_int(value)
+    return wo_int is None or min_wo <= wo_int <= max_wo
+
+# Characters of each chunk pulled in phase one for de-dup (and as a preview)
+HEAD_CHARS = 400
+
+def _dedup_key(file: Optional[str], head: str):
+    return (file, hash(head[:HEAD_CHARS]))
+
+def _hits_sql(col: str, n_terms: int) -> str:
+    """SQL twin of TermMatcher.count: sum of non-overlapping occurrences of each (lowercase) term."""
+    one = f"((length({col}) - length(replace(lower({col}), ?, ''))) / length(?))"
+    return " + ".join([one] * n_terms) or "0"
+
+def _fetch_heads(conn: sqlite3.Connection, prof: SchemaProfile, ids: List[int]) -> Dict[int, str]:
+    """chunk_id -> first HEAD_CHARS chars, by rowid (no MATCH: FTS5 would re-walk the whole doclist)."""
+    if not ids:
+        return {}
+    marks = ",".join("?" * len(ids))
+    sql = (f"SELECT {prof.chunk_id_expr}, substr({prof.table}.{prof.content_col}, 1, {HEAD_CHARS}) "
+           f"FROM {prof.table} WHERE {prof.chunk_id_expr} IN ({marks})")
+    return {int(r[0]): r[1] or "" for r in conn.execute(sql, ids)}
+
+def _materialize(conn: sqlite3.Connection, prof: SchemaProfile, rows: List[Dict], n: Optional[int] = None) -> List[Dict]:
+    """
+    Phase two of retrieval: replace the preview in the first `n` rows (all if None)
+    with the full chunk content, in one IN (...) lookup.
+    """
+    head = rows if n is None else rows[:n]
+    want = [r["chunk_id"] for r in head if r.get("partial")]
+    if want:
+        marks = ",".join("?" * len(want))
+        full = dict(conn.execute(
+            f"SELECT {prof.chunk_id_expr}, {prof.table}.{prof.content_col} "
+            f"FROM {prof.table} WHERE {prof.chunk_id_expr} IN ({marks})",
+            want,
+        ).fetchall())
+        for r in head:
+            if r["chunk_id"] in full:
+                r["content"] = str(full[r["chunk_id"]] or "").strip()
+                r.pop("partial", None)
+    for r in rows:
+        r.pop("_head", None)
+    return rows
+
+def _collect_unique(
+    conn: sqlite3.Connection,
+    prof: SchemaProfile,
+    candidates: List[Dict],
+    top_k: int,
+) -> List[Dict]:
+    """
+    Walk ranked candidates (no content yet) in windows, pulling only a short head
+    per row to de-dup, until top_k unique rows are found. A candidate's "snippet"
+    (from the phase-one FTS query) becomes the preview when present.
+    """
+    out: List[Dict] = []
+    seen = set()
+    pos = 0
+    while pos < len(candidates) and len(out) < top_k:
+        window = candidates[pos: pos + (top_k - len(out)) + max(8, top_k // 4)]
+        pos += len(window)
+        heads = _fetch_heads(conn, prof, [c["chunk_id"] for c in window])
+        for c in window:
+            head = heads.get(c["chunk_id"], "")
+            snip = c.get("snippet")
+            if not head.strip():
+                continue
+            key = _dedup_key(c.get("file"), head)
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append({**c, "content": (snip or head).strip(), "_head": head, "partial": True})
+            if len(out) >= top_k:
+                break
+    return out
+
+
 # -----------------------------
 # Search + snippet pipeline
 # -----------------------------
@@ -222,133 +655,322 @@ def search_rows(
     min_wo: int,
     max_wo: int,
     top_k: int = 200,
+    expand: bool = True,
+    materialize: Optional[int] = None,
+    snippets: bool = False,
 ):
     """
-    Returns rows: [{chunk_id, file, content, score}]
-    - Prefer FTS5 with BM25; fallback to LIKE
+    Returns rows: [{chunk_id, file, content, snippet, score}]
+    - Prefer FTS5 with BM25; fallback to LIKE (ranked by term hits computed in SQL)
     - Apply WO range if present
-    - Soft score by BM25 + term hits
+    - Two-phase: rank on chunk_id/bm25/metadata only, de-dup on a short head,
+      then fetch full `content` for the first `materialize` rows (all if None).
+      Rows past that carry a preview in `content`: the head, or with
+      `snippets=True` the FTS5 snippet(). Snippets are computed in the bounded
+      phase-one query; a later MATCH ... rowid IN (...) would re-walk the whole
+      doclist.
     - De-dup and cap to top_k
-    Also prints the selected chunk_ids.
+    `expand=False` skips the SYNONYMS expansion (the hybrid path relies on the
+    dense leg for paraphrases instead).
+    Logs the selected chunk_ids with the request's stage timings.
     """
-    # Detect table/columns
-    table, content_col = _detect_content_table(conn)
-    fcol = _file_column(conn, table)
-    wcol = _wo_column(conn, table)
-
-    # Figure out a primary key expression we can always SELECT as chunk_id
-    # For FTS: use rowid; for normal tables: prefer 'id', else rowid.
-    cols_lower = [c.lower() for c in _table_columns(conn, table)]
-    is_fts = table.endswith("_fts")
-    pk_expr = "rowid" if is_fts else ("id" if "id" in cols_lower else "rowid")
+    # Detect table/columns (cached per DB file)
+    with stage("schema"):
+        prof = _schema_profile(conn)
+    table, content_col = prof.table, prof.content_col
+    fcol, wcol = prof.file_col, prof.wo_col
+    is_fts = prof.is_fts
 
     # Tokenize/expand terms
-    ts = _expand_terms(_terms(query))
+    ts = _expand_terms(_terms(query)) if expand else list(dict.fromkeys(_terms(query)))
     if not ts:
         return []
 
-    # Build SELECT column list (include our chunk_id)
-    sel_cols = f"{pk_expr} AS chunk_id," \
-               f"{(fcol + ',') if fcol else ''}" \
-               f"{content_col}" \
-               f"{(',' + wcol) if wcol else ''}"
+    # Phase one SELECT: chunk_id, file, wo — no content. Joined to the base table
+    # when file/WO live there; the WO range is pushed into SQL when the DB has an
+    # indexed integer WO column.
+    sel_cols = prof.select_cols(with_content=False)
+    wo_sql, wo_params = prof.wo_range_sql(min_wo, max_wo)
+    filter_wo_in_python = bool(wcol) and not prof.wo_int_col
+
+    def _like_rows():
+        col = f"{table}.{content_col}"
+        like_clauses = " OR ".join([f"{col} LIKE ?"] * len(ts))
+        like_params = [f"%{t}%" for t in ts]
+        hit_params = [p for t in ts for p in (t, t)]
+        return conn.execute(
+            f"SELECT {sel_cols}, ({_hits_sql(col, len(ts))}) AS _hits "
+            f"FROM {prof.from_sql} WHERE ({like_clauses}){wo_sql} "
+            f"ORDER BY _hits DESC LIMIT ?",
+            (*hit_params, *like_params, *wo_params, top_k * 5),
+        ).fetchall()
 
     # Run query via FTS or LIKE
     rows: List[sqlite3.Row] = []
+    fts_q = ""
     try:
         if is_fts:
-            q = _fts_query_from_terms(ts)
-            if not q:
+            fts_q = _fts_query_from_terms(ts)
+            if not fts_q:
                 return []
-            rows = conn.execute(
-                f"""
-                SELECT {sel_cols}, bm25({table}) AS _bm25
-                FROM {table}
-                WHERE {table} MATCH ?
-                ORDER BY _bm25 ASC
-                LIMIT ?
-                """,
-                (q, top_k * 5),
-            ).fetchall()
+            snip_sql = f", snippet({table}, -1, '', '', '…', 48) AS _snip" if snippets else ""
+            with stage("fts"):
+                rows = conn.execute(
+                    f"""
+                    SELECT {sel_cols}, bm25({table}) AS _bm25{snip_sql}
+                    FROM {prof.from_sql}
+                    WHERE {table} MATCH ?{wo_sql}
+                    ORDER BY _bm25 ASC
+                    LIMIT ?
+                    """,
+                    (fts_q, *wo_params, top_k * 5),
+                ).fetchall()
         else:
-            like_clauses = " OR ".join([f"{content_col} LIKE ?"] * len(ts))
-            like_params = [f"%{t}%" for t in ts]
-            rows = conn.execute(
-                f"SELECT {sel_cols} FROM {table} WHERE {like_clauses} LIMIT ?",
-                (*like_params, top_k * 5),
-            ).fetchall()
+            with stage("like"):
+                rows = _like_rows()
     except Exception as e:
         # Defensive fallback to LIKE
         print("⚠️ FTS failed; fallback to LIKE:", e)
-        like_clauses = " OR ".join([f"{content_col} LIKE ?"] * len(ts))
-        like_params = [f"%{t}%" for t in ts]
-        rows = conn.execute(
-            f"SELECT {sel_cols} FROM {table} WHERE {like_clauses} LIMIT ?",
-            (*like_params, top_k * 5),
-        ).fetchall()
+        fts_q = ""
+        with stage("like"):
+            rows = _like_rows()
 
-    # Convert to scored results
-    results: List[Dict] = []
+    # Score candidates from metadata alone
+    t_score = time.perf_counter()
+    candidates: List[Dict] = []
     for r in rows:
-        content = r[content_col] if isinstance(r, sqlite3.Row) else r[0]
-        if not content:
+        # WO range filter (only when it couldn't be done in SQL)
+        if filter_wo_in_python and not _wo_in_range(r[wcol], min_wo, max_wo):
             continue
 
-        # WO range filter if present
-        if wcol:
-            try:
-                wv = r[wcol]
-                if wv is not None:
-                    m = re.search(r"(\d{1,})", str(wv))
-                    wo_int = int(m.group(1)) if m else None
-                    if wo_int is not None and (wo_int < min_wo or wo_int > max_wo):
-                        continue
-            except Exception:
-                pass
-
-        # Score: BM25-aware if available, else hit-count only
-        hits = _count_hits(content, ts)
+        # Score: bm25 when available (FTS5 bm25 is <= 0, more negative = better),
+        # else the term-hit count
         if "_bm25" in r.keys():
             try:
-                bm25 = float(r["_bm25"])
+                score = max(0.0, -float(r["_bm25"]))
             except Exception:
-                bm25 = 10.0
-            base = 1.0 / (1.0 + max(0.0, bm25))  # smaller bm25 -> higher score
-            score = base * (1.0 + 0.1 * hits)
+                score = 0.0
         else:
+            hits = r["_hits"] or 0
             if hits <= 0:
                 continue
             score = float(hits)
 
-        results.append({
+        candidates.append({
             "chunk_id": r["chunk_id"],
-            "file": (r[fcol] if (fcol and fcol in r.keys()) else None),
-            "content": str(content).strip(),
+            "file": (r[fcol] if fcol else None),
             "score": float(score),
+            "snippet": r["_snip"] if "_snip" in r.keys() else None,
         })
 
-    # Sort, de-dup (by file + first 400 chars), cap to top_k
-    results.sort(key=lambda x: x["score"], reverse=True)
-    out: List[Dict] = []
-    seen = set()
-    for item in results:
-        key = (item.get("file"), hash(item["content"][:400]))
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(item)
-        if len(out) >= top_k:
-            break
+    # Sort, de-dup (by file + first 400 chars), cap to top_k, then fetch content
+    candidates.sort(key=lambda x: x["score"], reverse=True)
+    timer = timings.current()
+    if timer:
+        timer.add("scoring", (time.perf_counter() - t_score) * 1000.0)
+    with stage("dedupe"):
+        out = _collect_unique(conn, prof, candidates, top_k)
+    with stage("materialize"):
+        _materialize(conn, prof, out, materialize)
+
+    log_event(
+        "search_rows", path="fts" if fts_q else "like", terms=len(ts), scanned=len(rows),
+        returned=len(out), chunk_ids=[r["chunk_id"] for r in out],
+    )
 
-    # Print which chunk ids are being returned (as you requested)
-    try:
-        print(f"🔎 search_rows -> chunk_ids: {[r['chunk_id'] for r in out]}")
-    except Exception:
-        pass
+    return out
 
+
+def _embed_texts(texts: List[str]):
+    """Embed query texts through the shared micro-batching service (cached per normalized text)."""
+    return embed_queries(texts)
+
+def _fetch_meta_by_id(
+    conn: sqlite3.Connection, prof: SchemaProfile, ids: List[int], min_wo: int, max_wo: int
+) -> Dict[int, sqlite3.Row]:
+    """chunk_id -> row of metadata (file/WO), with the WO range applied in SQL where possible."""
+    if not ids:
+        return {}
+    wo_sql, wo_params = prof.wo_range_sql(min_wo, max_wo)
+    marks = ",".join("?" * len(ids))
+    rows = conn.execute(
+        f"SELECT {prof.select_cols(with_content=False)} FROM {prof.from_sql} "
+        f"WHERE {prof.chunk_id_expr} IN ({marks}){wo_sql}",
+        (*ids, *wo_params),
+    ).fetchall()
+    return {int(r["chunk_id"]): r for r in rows}
+
+_RETRIEVAL_CACHE = RetrievalCache()
+
+def _retrieval_key(db_path: str, query: str, min_wo: int, max_wo: int, top_k: int, store) -> Tuple:
+    """
+    Everything that determines a ranked result list. Lexical retrieval only
+    sees the term set; dense retrieval embeds the whole (normalized) question
+    and depends on which vector store build answered it.
+    """
+    ident = (_file_identity(db_path), _db_content_version(db_path))
+    if store is None:
+        return ident + ("lexical", tuple(sorted(set(_terms(query)))), min_wo, max_wo, top_k)
+    return ident + ("hybrid", normalize_question(query), store.meta.get("built_at"), min_wo, max_wo, top_k)
+
+def hybrid_search_rows(
+    conn: sqlite3.Connection,
+    db_path: str,
+    query: str,
+    min_wo: int,
+    max_wo: int,
+    top_k: int = 200,
+    mode: str = RETRIEVAL_MODE,
+    materialize: Optional[int] = None,
+):
+    """
+    BM25 + dense retrieval fused with reciprocal-rank fusion.
+    Falls back to plain `search_rows` (with synonyms) when mode is "lexical"
+    or no fresh vector store exists for this DB.
+    Returns the same row shape as `search_rows`; `score` is the RRF score * RRF_K.
+    Results are kept in an LRU (see _retrieval_key); a hit only fetches content
+    for rows the earlier caller left unmaterialized.
+    """
+    store = None if mode == "lexical" else vector_store.load_store(db_path)
+    key = _retrieval_key(db_path, query, min_wo, max_wo, top_k, store)
+    with stage("retrieval_cache"):
+        rows = _RETRIEVAL_CACHE.get(key)
+    if rows is not None:
+        partial = sum(1 for r in rows if r.get("partial"))
+        with stage("materialize"):
+            _materialize(conn, _schema_profile(conn), rows, materialize)
+        if partial and sum(1 for r in rows if r.get("partial")) < partial:
+            _RETRIEVAL_CACHE.put(key, rows)  # keep the deeper materialization
+        return rows
+    rows = _hybrid_search_uncached(conn, db_path, query, min_wo, max_wo, top_k, store, mode, materialize)
+    _RETRIEVAL_CACHE.put(key, rows)
+    return rows
+
+def _hybrid_search_uncached(
+    conn: sqlite3.Connection,
+    db_path: str,
+    query: str,
+    min_wo: int,
+    max_wo: int,
+    top_k: int,
+    store,
+    mode: str,
+    materialize: Optional[int],
+) -> List[Dict]:
+    if store is None:
+        if mode == "hybrid":
+            print(f"⚠️ No fresh vector store for {os.path.basename(db_path)}; lexical only.")
+        return search_rows(conn, query, min_wo, max_wo, top_k=top_k, materialize=materialize)
+
+    with stage("schema"):
+        prof = _schema_profile(conn)
+    lexical = search_rows(conn, query, min_wo, max_wo, top_k=top_k, expand=False, materialize=0)
+    with stage("embed"):
+        qvec = _embed_texts([query])[0]
+    with stage("vector_search"):
+        dense_hits = store.search(qvec, top_k)
+
+    # Dense-only hits: metadata + WO filter first, content later
+    meta: Dict[int, Dict] = {int(r["chunk_id"]): r for r in lexical}
+    missing = [rid for rid, _ in dense_hits if rid not in meta]
+    for rid, r in _fetch_meta_by_id(conn, prof, missing, min_wo, max_wo).items():
+        if prof.wo_col and not prof.wo_int_col and not _wo_in_range(r[prof.wo_col], min_wo, max_wo):
+            continue
+        meta[rid] = {"chunk_id": rid, "file": r[prof.file_col] if prof.file_col else None, "score": 0.0}
+
+    fused = vector_store.reciprocal_rank_fusion(
+        [
+            [int(r["chunk_id"]) for r in lexical],
+            [rid for rid, _ in dense_hits if rid in meta],
+        ],
+        k=RRF_K,
+    )
+    candidates: List[Dict] = []
+    for rid, rrf in fused:
+        item = {k: v for k, v in meta[rid].items() if k not in ("content", "_head", "partial")}
+        item["score"] = rrf * RRF_K
+        candidates.append(item)
+    with stage("dedupe"):
+        out = _collect_unique(conn, prof, candidates, top_k)
+    with stage("materialize"):
+        _materialize(conn, prof, out, materialize)
+
+    log_event(
+        "hybrid_search_rows", lexical=len(lexical), dense=len(dense_hits),
+        returned=len(out), chunk_ids=[r["chunk_id"] for r in out],
+    )
     return out
 
 
+_FEDERATED_POOL = ThreadPoolExecutor(max_workers=max(1, FEDERATED_WORKERS), thread_name_prefix="askai-fed")
+
+def _requested_dbs(value) -> List[str]:
+    """Resolve a `dbs` request value ("*" or a list of names) to allowed DB names."""
+    if value == "*":
+        names = _list_user_dbs()
+    elif isinstance(value, list) and value:
+        names = []
+        for name in value:
+            name = str(name or "").strip()
+            if name in RESTRICTED_DBS:
+                raise _ApiError("Restricted database.", 403)
+            if name and name not in names:
+                names.append(name)
+    else:
+        raise _ApiError("'dbs' must be \"*\" or a non-empty list of database names.", 400)
+    if not names:
+        raise _ApiError("No databases to search.", 404)
+    return names
+
+def federated_search_rows(
+    db_names: List[str],
+    query: str,
+    min_wo: int,
+    max_wo: int,
+    top_k: int = 120,
+    mode: str = RETRIEVAL_MODE,
+    materialize: Optional[int] = None,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Run hybrid_search_rows on every DB in parallel and merge into one top_k list.
+    Raw scores aren't comparable across DBs (BM25 vs LIKE hits vs RRF), so each
+    DB's scores are divided by its own best score before merging; rows keep
+    `db` (provenance) and `raw_score`. Each DB materializes its own top
+    `materialize`, which covers any global top-`materialize` prefix.
+    Returns (rows, per-DB report). A failing DB is reported and skipped.
+    """
+    def _one(name: str) -> Tuple[List[Dict], float]:
+        t0 = time.perf_counter()
+        db_path = _safe_db_path(name)
+        with _pooled(db_path) as conn:
+            rows = hybrid_search_rows(
+                conn, db_path, query, min_wo, max_wo, top_k=top_k, mode=mode, materialize=materialize
+            )
+        return rows, (time.perf_counter() - t0) * 1000.0
+
+    # Each worker runs in a copy of this context, so its stages land on the request's timer
+    futures = {name: _FEDERATED_POOL.submit(contextvars.copy_context().run, _one, name) for name in db_names}
+    merged: List[Tuple[float, int, Dict]] = []
+    report: List[Dict] = []
+    for name, fut in futures.items():
+        try:
+            rows, ms = fut.result()
+        except Exception as e:
+            print(f"⚠️ federated search skipped {name}: {e}")
+            report.append({"db": name, "error": str(e)})
+            continue
+        report.append({"db": name, "rows": len(rows), "ms": round(ms, 1)})
+        best = max((r["score"] for r in rows), default=0.0) or 1.0
+        for rank, r in enumerate(rows):
+            r["db"] = name
+            r["raw_score"] = r["score"]
+            r["score"] = r["score"] / best
+            merged.append((r["score"], -rank, r))
+    if report and all("error" in x for x in report):
+        raise _ApiError("Search failed on every database.", 500)
+    merged.sort(key=lambda x: (x[0], x[1]), reverse=True)
+    return [r for _, _, r in merged[:top_k]], report
+
 def build_snippets_from_top_chunks(rows: List[Dict], max_chunks: int = 20, snip_len: int = 480):
     """
     Take already-scored rows, grab the global top-N chunks,
@@ -365,7 +987,9 @@ def build_snippets_from_top_chunks(rows: List[Dict], max_chunks: int = 20, snip_
         if len(txt) > snip_len:
             txt = txt[: snip_len - 1].rstrip() + "…"
         snippets.append(txt)
-        sources.append(r.get("file") or "document")
+        src = r.get("file") or "document"
+        # Federated rows name their DB so sources stay unambiguous
+        sources.append(f"{r['db']}: {src}" if r.get("db") else src)
 
     # de-dup sources while preserving order
     uniq_sources: List[str] = []
@@ -445,57 +1069,240 @@ Requirements:
 """
     return prompt.strip()
 
-def _gemini_answer_multi(question: str, bundle: Dict) -> str:
+def _extractive_multi(bundle: Dict) -> str:
     snippets = bundle.get("snippets", [])
     sources = bundle.get("sources", [])
-    if not _gemini_client_ok:
-        lead = snippets[0] if snippets else "No snippet."
-        bullets = "\n".join(f"- {s}" for s in snippets[1:5])
-        src = ", ".join(sources) if sources else "documents"
-        return f"**Answer (extractive)**\n\n{lead}\n{bullets}\n\n_Sources: {src}_"
-
-    model = genai.GenerativeModel(_GEMINI_MODEL)  # type: ignore
-    resp = model.generate_content(_build_prompt_multi(question, bundle))
-    text = (getattr(resp, "text", "") or "").strip()
+    lead = snippets[0] if snippets else "No snippet."
+    bullets = "\n".join(f"- {s}" for s in snippets[1:5])
+    src = ", ".join(sources) if sources else "documents"
+    return f"**Answer (extractive)**\n\n{lead}\n{bullets}\n\n_Sources: {src}_"
+
+def _extractive_single(filename: str, snippets: List[str]) -> str:
+    lead = snippets[0] if snippets else "No snippet."
+    bullets = "\n".join(f"- {s}" for s in snippets[1:5])
+    return f"**Answer (extractive)**\n\n{lead}\n{bullets}\n\n_Sources: {filename}_"
+
+def _finish_answer(text: str, lead: str, src: str) -> str:
+    """Empty model output falls back to the lead snippet; always end with a Sources line."""
+    text = (text or "").strip()
     if not text:
-        lead = snippets[0] if snippets else "No snippet."
-        src = ", ".join(sources) if sources else "documents"
         text = f"{lead}\n\n_Sources: {src}_"
     if "Sources:" not in text:
-        src = ", ".join(sources) if sources else "documents"
         text += f"\n\n_Sources: {src}_"
     return text
 
-def _gemini_answer_single(question: str, filename: str, snippets: List[str]) -> str:
-    if not _gemini_client_ok:
-        lead = snippets[0] if snippets else "No snippet."
-        bullets = "\n".join(f"- {s}" for s in snippets[1:5])
-        return f"**Answer (extractive)**\n\n{lead}\n{bullets}\n\n_Sources: {filename}_"
-    model = genai.GenerativeModel(_GEMINI_MODEL)  # type: ignore
-    resp = model.generate_content(_build_prompt_single(question, filename, snippets))
-    text = (getattr(resp, "text", "") or "").strip()
-    if not text:
-        lead = snippets[0] if snippets else "No snippet."
-        text = f"{lead}\n\n_Sources: {filename}_"
-    if "Sources:" not in text:
-        text += f"\n\n_Sources: {filename}_"
-    return text
+def _gemini_answer_multi(
+    question: str, bundle: Dict, user: str = "guest", priority: str = INTERACTIVE
+) -> Tuple[str, bool]:
+    """(answer, whether the model wrote it); the extractive fallback is never cached."""
+    snippets = bundle.get("snippets", [])
+    sources = bundle.get("sources", [])
+    text = _LLM.generate(_build_prompt_multi(question, bundle), user=user, priority=priority)
+    if text is None:  # disabled, failing or too slow
+        return _extractive_multi(bundle), False
+    lead = snippets[0] if snippets else "No snippet."
+    src = ", ".join(sources) if sources else "documents"
+    return _finish_answer(text, lead, src), True
+
+def _gemini_answer_single(question: str, filename: str, snippets: List[str], user: str = "guest") -> str:
+    text = _LLM.generate(_build_prompt_single(question, filename, snippets), user=user)
+    if text is None:
+        return _extractive_single(filename, snippets)
+    lead = snippets[0] if snippets else "No snippet."
+    return _finish_answer(text, lead, filename)
+
+def _gemini_stream_text(
+    prompt: str, extractive: str, src: str, user: str = "guest", outcome: Optional[Dict] = None
+) -> Iterator[str]:
+    """
+    Answer text as Gemini streams it (generate_content(stream=True)).
+    Adds a trailing Sources line if the model didn't write one. Falls back to
+    the extractive answer when the gateway is disabled, or nothing came back
+    (short-circuited, failed before the first token, or empty). `outcome["ok"]`
+    is set when the model finished a non-empty answer. Scheduler admission is
+    checked eagerly, so this raises SchedulerBusy before the response starts.
+    """
+    streamed: Dict = {}
+    pieces = _LLM.stream(prompt, user=user, outcome=streamed)
+
+    def _gen() -> Iterator[str]:
+        if pieces is None:
+            yield extractive
+            return
+        produced: List[str] = []
+        for piece in pieces:
+            produced.append(piece)
+            yield piece
+        text = "".join(produced).strip()
+        if not text:
+            # Short-circuited, failed before the first token, or came back empty
+            yield extractive
+            return
+        if outcome is not None and streamed.get("ok"):
+            outcome["ok"] = True
+        if "Sources:" not in text:
+            yield f"\n\n_Sources: {src}_"
+
+    return _gen()
+
+# -----------------------------
+# Sentence index (quick_view / single_file_answer)
+# -----------------------------
+_sentence_split_re = re.compile(r"(?<=[.!?])\s+|\n+")
+FTS_TOKENIZE = "porter unicode61 remove_diacritics 2 tokenchars '-_./'"
+
+def _split_sentences(text: str) -> List[str]:
+    return [p.strip() for p in _sentence_split_re.split(text or "") if p and p.strip()]
+
+def _build_sentence_index(conn: sqlite3.Connection, table: str, file_col: str, content_col: str) -> int:
+    """
+    (Re)build askai_sentences(id, file, pos, text) + askai_sentences_fts from a
+    chunk table. A file's chunks are joined and split exactly like quick_view
+    always did, so sentences may span chunk boundaries. Each file's sentences
+    get a contiguous id range, which lets lookups restrict the FTS scan with a
+    rowid BETWEEN. Returns the number of sentences written. Caller commits.
+    """
+    conn.execute(f"DROP TABLE IF EXISTS {SENTENCE_FTS}")
+    conn.execute(f"DROP TABLE IF EXISTS {SENTENCE_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {SENTENCE_TABLE} (
+          id INTEGER PRIMARY KEY,
+          file TEXT NOT NULL,
+          pos INTEGER NOT NULL,
+          text TEXT NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {SENTENCE_FTS} USING fts5(
+          text,
+          content='{SENTENCE_TABLE}',
+          content_rowid='id',
+          tokenize = "{FTS_TOKENIZE}"
+        )
+    """)
+    total = 0
+    rows = conn.execute(
+        f"SELECT {file_col}, {content_col} FROM {table} ORDER BY {file_col}, rowid"
+    )
+    # Materialize per file only; the cursor itself streams
+    for file, group in groupby(rows, key=lambda r: r[0]):
+        total += _insert_file_sentences(conn, file, " ".join((r[1] or "") for r in group))
+    conn.execute(f"INSERT INTO {SENTENCE_FTS}({SENTENCE_FTS}) VALUES('rebuild')")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {SENTENCE_INDEX_NAME} ON {SENTENCE_TABLE}(file, pos)")
+    return total
+
+def _insert_file_sentences(conn: sqlite3.Connection, file: str, text: str) -> int:
+    sentences = _split_sentences(text)
+    conn.executemany(
+        f"INSERT INTO {SENTENCE_TABLE}(file, pos, text) VALUES (?,?,?)",
+        [(file, i, sent) for i, sent in enumerate(sentences)],
+    )
+    return len(sentences)
+
+def backfill_sentences(db_path: str) -> Dict:
+    """Build the sentence index for an existing content DB (writable connection)."""
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        prof = _schema_profile(conn)
+        if not prof.file_col:
+            raise RuntimeError("DB has no file column; sentence index needs one.")
+        with conn:
+            n = _build_sentence_index(conn, prof.row_table, prof.file_col, prof.content_col)
+    finally:
+        conn.close()
+    _invalidate_profile(db_path)
+    return {"sentences": n, "seconds": round(time.perf_counter() - t0, 2)}
+
+def backfill_wo_index(db_path: str) -> Dict:
+    """Add the indexed integer WO column to an existing content DB (writable connection)."""
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        prof = _schema_profile(conn)
+        if not prof.wo_col:
+            raise RuntimeError("DB has no WO column.")
+        if prof.is_fts and not prof.base_table:
+            raise RuntimeError("WO column lives on the FTS table; it can't be indexed.")
+        column = prof.wo_int_col
+        if not column:
+            with conn:
+                column = _add_wo_index(conn, prof.row_table, prof.wo_col)
+    finally:
+        conn.close()
+    _invalidate_profile(db_path)
+    return {"table": prof.row_table, "column": column, "seconds": round(time.perf_counter() - t0, 2)}
+
+def _indexed_file_sentences(
+    conn: sqlite3.Connection, filename: str, ts: List[str], limit: int
+) -> Optional[List[str]]:
+    """
+    Top sentences of one file via the sentence FTS, scoped to the file's rowid range.
+    Returns None if the FTS query can't be run (caller falls back to a scan).
+    """
+    lo_hi = conn.execute(
+        f"SELECT MIN(id), MAX(id) FROM {SENTENCE_TABLE} WHERE file = ?", (filename,)
+    ).fetchone()
+    if not lo_hi or lo_hi[0] is None:
+        return []
+    q = _fts_query_from_terms(ts)
+    if not q:
+        return []
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT s.pos, s.text
+            FROM {SENTENCE_FTS} JOIN {SENTENCE_TABLE} s ON s.id = {SENTENCE_FTS}.rowid
+            WHERE {SENTENCE_FTS} MATCH ? AND {SENTENCE_FTS}.rowid BETWEEN ? AND ? AND s.file = ?
+            ORDER BY bm25({SENTENCE_FTS})
+            LIMIT ?
+            """,
+            (q, lo_hi[0], lo_hi[1], filename, max(limit * 8, 64)),
+        ).fetchall()
+    except sqlite3.Error as e:
+        print("⚠️ sentence FTS failed; scanning file:", e)
+        return None
+    # Same ordering as the scan path: most term hits first, then document order
+    matcher = term_matcher(ts)
+    scored = [(r[1], matcher.count(r[1]), r[0]) for r in rows]
+    scored = [x for x in scored if x[1] > 0]
+    scored.sort(key=lambda x: (-x[1], x[2]))
+    return [t for t, _, _ in scored[:limit]]
 
 # -----------------------------
 # Optional chunk DB builder (admin)
 # -----------------------------
-def _create_chunk_db(output_path: str, records: List[Dict]) -> None:
+INGEST_BATCH = int(os.getenv("ASKAI_INGEST_BATCH", "1000"))
+
+def _create_chunk_db(output_path: str, records: Iterable[Dict]) -> Dict:
     """
     Build a chunked DB at `output_path` with canonical schema:
       chunks(id INTEGER PK, file TEXT, page INTEGER NULL, wo INTEGER NULL, content TEXT NOT NULL)
       chunks_fts (FTS5 on content) contentless w/ external content=chunks
-    `records`: [{file, content, page?, wo?}, ...]
+      askai_wo_idx on chunks(wo) for WO-range pushdown (wo normalized to its leading integer)
+      askai_file_idx on chunks(file) for per-file upserts/deletes
+      askai_meta(key, value) holding the content_version caches key on
+      askai_sentences(id, file, pos, text) + askai_sentences_fts for per-file quick_view lookups
+    `records`: any iterable of {file, content, page?, wo?} — consumed once, streaming.
+
+    The DB is built in a temp file next to the target (executemany batches, one
+    FTS 'rebuild' at the end) and swapped in with os.replace, so readers of an
+    existing DB never see a half-built one. Returns ingest stats.
     """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    if os.path.exists(output_path):
-        os.remove(output_path)
+    tmp_path = f"{output_path}.building-{os.getpid()}-{threading.get_ident()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
 
-    with sqlite3.connect(output_path) as conn:
+    t0 = time.perf_counter()
+    count = skipped = 0
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # Scratch file until the swap: durability is pointless here
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
         conn.execute("""
             CREATE TABLE chunks (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -505,28 +1312,345 @@ def _create_chunk_db(output_path: str, records: List[Dict]) -> None:
               content TEXT NOT NULL
             )
         """)
-        conn.execute("""
+        conn.execute(f"""
             CREATE VIRTUAL TABLE chunks_fts USING fts5(
               content,
               content='chunks',
               content_rowid='id',
-              tokenize = "porter unicode61 remove_diacritics 2 tokenchars '-_./'"
+              tokenize = "{FTS_TOKENIZE}"
             )
         """)
+        batch: List[Tuple] = []
         for r in records:
-            file = str(r.get("file") or "document")
             content = str(r.get("content") or "").strip()
             if not content:
+                skipped += 1
                 continue
-            page = r.get("page")
-            wo = r.get("wo")
-            cur = conn.execute(
-                "INSERT INTO chunks(file, page, wo, content) VALUES (?,?,?,?)",
-                (file, page, wo, content),
-            )
-            rowid = cur.lastrowid
-            conn.execute("INSERT INTO chunks_fts(rowid, content) VALUES (?,?)", (rowid, content))
+            batch.append((str(r.get("file") or "document"), r.get("page"), _wo_to_int(r.get("wo")), content))
+            if len(batch) >= INGEST_BATCH:
+                conn.executemany("INSERT INTO chunks(file, page, wo, content) VALUES (?,?,?,?)", batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO chunks(file, page, wo, content) VALUES (?,?,?,?)", batch)
+            count += len(batch)
+        if not count:
+            # Never swap an empty build over a live DB
+            raise ValueError("No records with content were provided")
+        insert_s = time.perf_counter() - t0
+
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('rebuild')")
+        conn.execute(f"CREATE INDEX {WO_INDEX_NAME} ON chunks(wo)")
+        conn.execute(f"CREATE INDEX {FILE_INDEX_NAME} ON chunks(file)")
+        sentences = _build_sentence_index(conn, "chunks", "file", "content")
+        _bump_content_version(conn)
         conn.commit()
+    except BaseException:
+        conn.close()
+        _remove_quietly(tmp_path)
+        raise
+    conn.close()
+
+    _swap_into_place(tmp_path, output_path)
+    seconds = time.perf_counter() - t0
+    return {
+        "count": count,
+        "skipped": skipped,
+        "sentences": sentences,
+        "seconds": round(seconds, 3),
+        "insert_seconds": round(insert_s, 3),
+        "records_per_s": round(count / seconds, 1) if seconds > 0 else None,
+    }
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _swap_into_place(tmp_path: str, output_path: str, attempts: int = 10) -> None:
+    """
+    os.replace the finished DB over the live one. Idle pooled connections are
+    closed first (Windows refuses to replace open files); in-flight readers keep
+    their old file handle and are dropped by the pool on return.
+    """
+    for i in range(attempts):
+        _POOL.evict(output_path)
+        try:
+            os.replace(tmp_path, output_path)
+            break
+        except PermissionError:
+            if i == attempts - 1:
+                _remove_quietly(tmp_path)
+                raise
+            time.sleep(0.2 * (i + 1))
+    _invalidate_profile(output_path)
+    vector_store.drop_cached(output_path)
+
+def _iter_ndjson(stream) -> Iterator[Dict]:
+    """One JSON record per line; blank lines ignored. Raises ValueError with the line number."""
+    for lineno, raw in enumerate(stream, start=1):
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {lineno}: {e.msg}")
+        if not isinstance(rec, dict):
+            raise ValueError(f"Line {lineno} is not a JSON object")
+        yield rec
+
+# -----------------------------
+# Incremental per-file updates
+# -----------------------------
+FILE_INDEX_NAME = "askai_file_idx"
+
+def _bump_content_version(conn: sqlite3.Connection) -> str:
+    """
+    Advance askai_meta.content_version inside the caller's transaction. Values are
+    time-based and strictly increasing, so a rebuilt DB never reuses an old version.
+    """
+    meta = vector_store.META_TABLE
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {meta} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    row = conn.execute(
+        f"SELECT value FROM {meta} WHERE key = ?", (vector_store.CONTENT_VERSION_KEY,)
+    ).fetchone()
+    prev = int(row[0]) if row and str(row[0]).isdigit() else 0
+    version = str(max(prev + 1, time.time_ns()))
+    conn.execute(
+        f"INSERT OR REPLACE INTO {meta}(key, value) VALUES (?, ?)",
+        (vector_store.CONTENT_VERSION_KEY, version),
+    )
+    return version
+
+def replace_file_chunks(db_path: str, file: str, records: List[Dict]) -> Dict:
+    """
+    Replace every chunk of `file` in an existing chunk DB with `records`
+    ({content, page?, wo?}); an empty list deletes the file. One transaction:
+    old rows leave chunks_fts through external-content 'delete' commands, new
+    rows are indexed individually, the file's sentences are rebuilt and the
+    content version is bumped. Cost is proportional to the file, not the DB.
+    """
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        prof = _schema_profile(conn)
+        if not (prof.is_fts and prof.base_table and prof.file_col):
+            raise ValueError("Per-file updates need a chunk DB built by /build-chunks (external-content FTS).")
+        base, fts, col, fcol = prof.base_table, prof.table, prof.content_col, prof.file_col
+        base_cols = {c.lower() for c in _table_columns(conn, base)}
+
+        insert_cols = [fcol, col]
+        if "page" in base_cols:
+            insert_cols.append("page")
+        if prof.wo_col:
+            insert_cols.append(prof.wo_col)
+        if prof.wo_int_col and prof.wo_int_col != prof.wo_col:
+            insert_cols.append(prof.wo_int_col)
+        rows: List[Tuple] = []
+        for r in records:
+            content = str(r.get("content") or "").strip()
+            if not content:
+                continue
+            vals = [file, content]
+            if "page" in base_cols:
+                vals.append(r.get("page"))
+            if prof.wo_col:
+                # Canonical DBs store the normalized integer in `wo` itself
+                vals.append(_wo_to_int(r.get("wo")) if prof.wo_int_col == prof.wo_col else r.get("wo"))
+            if prof.wo_int_col and prof.wo_int_col != prof.wo_col:
+                vals.append(_wo_to_int(r.get("wo")))
+            rows.append(tuple(vals))
+
+        # One-time O(corpus) index so every later update is O(file)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {FILE_INDEX_NAME} ON {base}({fcol})")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old = conn.execute(
+                f"SELECT {prof.base_pk}, {col} FROM {base} WHERE {fcol} = ?", (file,)
+            ).fetchall()
+            conn.executemany(
+                f"INSERT INTO {fts}({fts}, rowid, {col}) VALUES('delete', ?, ?)",
+                [(r[0], r[1]) for r in old],
+            )
+            conn.execute(f"DELETE FROM {base} WHERE {fcol} = ?", (file,))
+            conn.executemany(
+                f"INSERT INTO {base}({', '.join(insert_cols)}) VALUES ({','.join('?' * len(insert_cols))})",
+                rows,
+            )
+            conn.execute(
+                f"INSERT INTO {fts}(rowid, {col}) "
+                f"SELECT {prof.base_pk}, {col} FROM {base} WHERE {fcol} = ? ORDER BY {prof.base_pk}",
+                (file,),
+            )
+
+            sentences = 0
+            if prof.has_sentences:
+                old_s = conn.execute(
+                    f"SELECT id, text FROM {SENTENCE_TABLE} WHERE file = ?", (file,)
+                ).fetchall()
+                conn.executemany(
+                    f"INSERT INTO {SENTENCE_FTS}({SENTENCE_FTS}, rowid, text) VALUES('delete', ?, ?)",
+                    [(r[0], r[1]) for r in old_s],
+                )
+                conn.execute(f"DELETE FROM {SENTENCE_TABLE} WHERE file = ?", (file,))
+                if rows:
+                    # Appended in one go, so the file's sentence ids stay contiguous
+                    sentences = _insert_file_sentences(conn, file, " ".join(r[1] for r in rows))
+                    conn.execute(
+                        f"INSERT INTO {SENTENCE_FTS}(rowid, text) "
+                        f"SELECT id, text FROM {SENTENCE_TABLE} WHERE file = ?",
+                        (file,),
+                    )
+            version = _bump_content_version(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return {
+        "file": file,
+        "removed": len(old),
+        "inserted": len(rows),
+        "sentences": sentences,
+        "content_version": version,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+# -----------------------------
+# Request helpers
+# -----------------------------
+class _ApiError(Exception):
+    """Validation failure that maps straight to a JSON error response."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def _file_snippets(db_path: str, filename: str, query: str, max_len: int, limit: int = 8) -> List[str]:
+    """
+    Best-matching sentences of one file, by expanded-term hit count. Uses the
+    precomputed sentence index when the DB has one; otherwise splits the file's
+    chunks on the fly.
+    """
+    ts = _expand_terms(_terms(query))
+    with _pooled(db_path) as conn:
+        prof = _schema_profile(conn)
+        picked = _indexed_file_sentences(conn, filename, ts, limit) if prof.has_sentences else None
+        if picked is None:
+            table, content_col = prof.row_table, prof.content_col
+            fcol = prof.file_col or "file"
+            rows = conn.execute(
+                f"SELECT {content_col} FROM {table} WHERE {fcol} = ?",
+                (filename,),
+            ).fetchall()
+
+    if picked is None:
+        text = " ".join((r[content_col] or "") for r in rows)
+        matcher = term_matcher(ts)
+        scored: List[Tuple[str, int]] = []
+        for s2 in _split_sentences(text):
+            hits = matcher.count(s2)
+            if hits > 0:
+                scored.append((s2, hits))
+        scored.sort(key=lambda x: x[1], reverse=True)
+        picked = [s for s, _ in scored[:limit]]
+
+    return [s if len(s) <= max_len else (s[: max_len - 3].rstrip() + "…") for s in picked]
+
+def _log_chat(user: str, question: str, answer: str, sources: str, db_name: str) -> Future:
+    """Queue one Q/A row for chat_history; the Future resolves to its id once written."""
+    return _CHAT_WRITER.submit(user, question, answer, sources, db_name)
+
+def _sse(event: str, payload: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def _busy_response(e: SchedulerBusy):
+    """429 with Retry-After when the Gemini scheduler has no room."""
+    resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+def _sse_response(events: Iterator[str]) -> Response:
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _stream_answer_events(
+    sources_payload: Dict,
+    pieces: Iterator[str],
+    persist,
+) -> Iterator[str]:
+    """
+    SSE sequence shared by the streaming endpoints:
+      event: sources  -> ranked sources
+      event: token    -> {"text": ...} per streamed piece
+      event: done     -> {"id": <chat_history id, or null if it wasn't confirmed>}
+    `persist(answer) -> id` runs once the full answer is known.
+    """
+    yield _sse("sources", sources_payload)
+    parts: List[str] = []
+    try:
+        for piece in pieces:
+            parts.append(piece)
+            yield _sse("token", {"text": piece})
+    except Exception as e:
+        print("❌ answer stream error:", e)
+        yield _sse("error", {"error": f"Answer generation failed: {str(e)}"})
+        return
+    answer = "".join(parts).strip()
+    try:
+        chat_id = persist(answer)
+    except Exception as e:  # e.g. the chat writer is backed up past persist's timeout
+        print("⚠️ answer stream: chat history not confirmed:", repr(e))
+        chat_id = None
+    yield _sse("done", {"id": chat_id})
+
+# -----------------------------
+# Per-request stage timings
+# -----------------------------
+_STAGE_HISTOGRAMS = StageHistograms()
+
+def _timing_endpoint() -> str:
+    return request.url_rule.rule if request.url_rule else request.path
+
+def _wants_timings() -> bool:
+    if request.args.get("timings") in ("1", "true"):
+        return True
+    data = request.get_json(silent=True) if request.is_json else None
+    return isinstance(data, dict) and bool(data.get("timings"))
+
+@askai_bp.before_request
+def _start_stage_timer():
+    timings.begin(_timing_endpoint())
+
+@askai_bp.after_request
+def _finish_stage_timer(resp: Response) -> Response:
+    """
+    Server-Timing header, optional "timings" field in JSON bodies, histograms and
+    a log line. Streamed responses are measured up to the start of the stream.
+    """
+    timer = timings.end()
+    if timer is None:
+        return resp
+    stages = timer.snapshot()
+    resp.headers["Server-Timing"] = timer.server_timing()
+    if not resp.is_streamed and resp.is_json and _wants_timings():
+        body = resp.get_json(silent=True)
+        if isinstance(body, dict):
+            body["timings"] = stages
+            resp.set_data(json.dumps(body))
+    endpoint = _timing_endpoint()
+    _STAGE_HISTOGRAMS.observe(endpoint, stages)
+    log_event("request", endpoint=endpoint, method=request.method, status=resp.status_code, stages_ms=stages)
+    return resp
 
 # -----------------------------
 # Routes
@@ -550,147 +1674,444 @@ def rank_only():
         min_wo = int(data.get("min", 0))
         max_wo = int(data.get("max", 99999999))
         db_name = data.get("db")
+        mode = data.get("retrieval") or RETRIEVAL_MODE
         if not query or not db_name:
             return jsonify({"error": "Missing query or db"}), 400
 
         db_path = _safe_db_path(db_name)
-        with _connect(db_path) as conn:
-            rows = search_rows(conn, query, min_wo, max_wo, top_k=120)
+        with _pooled(db_path) as conn:
+            # Ranking only needs file + score; skip full-content materialization
+            rows = hybrid_search_rows(conn, db_path, query, min_wo, max_wo, top_k=120, mode=mode, materialize=0)
             grouped = group_by_file(rows, max_snips_per_file=1)
         ranked = [{"file": f["file"], "score": round(f["score"], 2)} for f in grouped[:30]]
 
         # Cache lightweight trace
-        with sqlite3.connect(CHAT_DB) as conn:
-            conn.execute(
-                """
-                INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (user, query, "[Ranking Only - No answer]", ",".join([r["file"] for r in ranked]), datetime.now().isoformat(), db_name),
-            )
+        _log_chat(user, query, "[Ranking Only - No answer]", ",".join([r["file"] for r in ranked]), db_name)
         return jsonify({"ranked_files": ranked})
     except Exception as e:
         print("❌ /api/rank_only error:", e)
         return jsonify({"error": "Failed to rank documents."}), 500
 
+def _single_file_request(data: Dict) -> Dict:
+    query = (data.get("query") or "").strip()
+    file = data.get("file")
+    db_name = data.get("db")
+    user = data.get("user") or "guest"
+    if not query or not file or not db_name:
+        raise _ApiError("Missing query/file/db", 400)
+    db_path = _safe_db_path(db_name)
+    with stage("snippets"):
+        snippets = _file_snippets(db_path, file, query, max_len=480)
+    return {"query": query, "file": file, "db_name": db_name, "user": user, "snippets": snippets}
+
 @askai_bp.post("/single_file_answer")
 def single_file_answer():
     """Answer from a single file (quick snippets + Gemini)."""
     try:
-        data = request.get_json(force=True) or {}
-        query = (data.get("query") or "").strip()
-        file = data.get("file")
-        db_name = data.get("db")
-        user = data.get("user") or "guest"
+        ctx = _single_file_request(request.get_json(force=True) or {})
+        with stage("gemini"):
+            answer = _gemini_answer_single(ctx["query"], ctx["file"], ctx["snippets"], user=ctx["user"])
+        with stage("chat_log"):
+            _log_chat(ctx["user"], ctx["query"], answer, ctx["file"], ctx["db_name"])
+        return jsonify({"answer": answer})
+    except _ApiError as e:
+        return jsonify({"error": str(e)}), e.status
+    except SchedulerBusy as e:
+        return _busy_response(e)
+    except Exception as e:
+        print("❌ /api/single_file_answer error:", e)
+        return jsonify({"error": f"Failed to answer from selected file. {str(e)}"}), 500
 
-        if not query or not file or not db_name:
-            return jsonify({"error": "Missing query/file/db"}), 400
+@askai_bp.post("/single_file_answer/stream")
+def single_file_answer_stream():
+    """Same as /single_file_answer, streamed as Server-Sent Events."""
+    try:
+        ctx = _single_file_request(request.get_json(force=True) or {})
+        query, file, snippets = ctx["query"], ctx["file"], ctx["snippets"]
+        pieces = _gemini_stream_text(
+            _build_prompt_single(query, file, snippets),
+            _extractive_single(file, snippets),
+            file,
+            user=ctx["user"],
+        )
+    except _ApiError as e:
+        return jsonify({"error": str(e)}), e.status
+    except SchedulerBusy as e:
+        return _busy_response(e)
+    except Exception as e:
+        print("❌ /api/single_file_answer/stream error:", e)
+        return jsonify({"error": f"Failed to answer from selected file. {str(e)}"}), 500
 
-        db_path = _safe_db_path(db_name)
-        with _connect(db_path) as conn:
-            table, content_col = _detect_content_table(conn)
-            fcol = _file_column(conn, table) or "file"
-            rows = conn.execute(
-                f"SELECT {content_col} FROM {table} WHERE {fcol} = ?",
-                (file,),
-            ).fetchall()
+    persist = lambda answer: _log_chat(ctx["user"], query, answer, file, ctx["db_name"]).result(timeout=10)
+    return _sse_response(_stream_answer_events({"sources": [file]}, pieces, persist))
 
-        # Build top snippets within that file
-        contents = " ".join((r[content_col] or "") for r in rows)
-        pieces = re.split(r"(?<=[.!?])\s+|\n+", contents)
-        ts = _expand_terms(_terms(query))
-        scored: List[Tuple[str, int]] = []
-        for s in pieces:
-            s2 = (s or "").strip()
-            if not s2:
-                continue
-            hits = _count_hits(s2, ts)
-            if hits > 0:
-                if len(s2) > 480:
-                    s2 = s2[:477].rstrip() + "…"
-                scored.append((s2, hits))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        snippets = [s for s, _ in scored[:8]]
+def _question_request(data: Dict) -> Dict:
+    """
+    Validate a /question payload, consult the answer cache, else retrieve.
+    Returns a context dict; ctx["cached"] holds the cache entry on a hit
+    (retrieval is skipped), otherwise ctx["rows"] has the retrieved chunks
+    (empty when nothing matched).
+    """
+    query = (data.get("query") or "").strip()
+    user = data.get("user") or "guest"
+    use_cache = bool(data.get("use_cache", True))
+    min_wo = int(data.get("min", 0))
+    max_wo = int(data.get("max", 99999999))
+    max_chunks = int(data.get("max_chunks", 20))  # client can override
+    token_budget = int(data.get("token_budget", CONTEXT_TOKENS))
+    mode = data.get("retrieval") or RETRIEVAL_MODE
+
+    # Federated mode: "dbs": [...] or "*" (all non-restricted DBs)
+    federated = data.get("dbs") is not None
+    if federated:
+        db_names = _requested_dbs(data.get("dbs"))
+    else:
+        db_names = [(data.get("db") or "").strip()]
+    db_name = ",".join(db_names)
+
+    if not query or not db_name:
+        raise _ApiError("Missing query or database name.", 400)
+    if any(n in RESTRICTED_DBS for n in db_names):
+        raise _ApiError("Restricted database.", 403)
+
+    db_paths = [_safe_db_path(n) for n in db_names]
+    ctx = {
+        "query": query, "db_name": db_name, "user": user, "rows": [], "cached": None,
+        "use_cache": use_cache, "federated": federated,
+    }
+
+    # Answer cache: normalized question + DB content version(s) + retrieval params
+    ctx["cache_key"] = {
+        "db_name": db_name,
+        "db_version": ",".join(_db_content_version(p) for p in db_paths),
+        "params": json.dumps([min_wo, max_wo, max_chunks, mode, token_budget]),
+        "scope": AnswerCache.scope_for(user, data.get("share_cache")),
+    }
+    semantic = bool(data.get("semantic_cache", CACHE_SEMANTIC))
+    ctx["cache_embed"] = _embed_texts if semantic else None
+    if use_cache:
+        with stage("answer_cache"):
+            hit = _ANSWER_CACHE.get(query, embed_fn=ctx["cache_embed"], **ctx["cache_key"])
+        if hit:
+            ctx["cached"] = hit
+            return ctx
+
+    # Retrieve many rows; the packer then picks from the top `pool` (full content)
+    pool = max_chunks * 2
+    if federated:
+        rows, ctx["searched"] = federated_search_rows(
+            db_names, query, min_wo, max_wo, top_k=120, mode=mode, materialize=pool
+        )
+    else:
+        with _pooled(db_paths[0]) as conn:
+            rows = hybrid_search_rows(
+                conn, db_paths[0], query, min_wo, max_wo, top_k=120, mode=mode, materialize=pool
+            )
+    ctx["rows"] = rows
+    if not rows:
+        return ctx
+
+    # Token-budgeted, MMR-diversified, query-trimmed context
+    with stage("pack"):
+        packed = pack_context(rows[:pool], _expand_terms(_terms(query)), token_budget, max_chunks)
+    top = packed["rows"]
+    bundle = build_snippets_from_top_chunks(top, max_chunks=len(top), snip_len=99999)
+    ctx["bundle"] = bundle
+    ctx["sources_str"] = ", ".join(bundle.get("sources", []))
+    ctx["context"] = {
+        "chunks": len(top),
+        "considered": packed["considered"],
+        "trimmed": packed["trimmed"],
+        "context_tokens": packed["tokens"],
+        "budget": packed["budget"],
+        "prompt_tokens": estimate_tokens(_build_prompt_multi(query, bundle)),
+    }
+    # Chunk ids are only unique within a DB; federated ids are "db#id"
+    ctx["chunk_ids"] = [f"{r['db']}#{r['chunk_id']}" if federated else r["chunk_id"] for r in top]
+    if federated:
+        ctx["provenance"] = [
+            {"db": r["db"], "file": r.get("file") or "document", "chunk_id": r["chunk_id"],
+             "score": round(r["score"], 4)}
+            for r in top
+        ]
+    return ctx
+
+def _question_answered(ctx: Dict, answer: str, from_model: bool = True) -> Future:
+    """
+    Queue the chat_history row and fill the answer cache on this thread, so an
+    immediate repeat is a hit. The chat id is attached to the cache entry from
+    _CACHE_POOL once the writer has it. Fallback answers (`from_model` False)
+    are logged but not cached. Returns the chat_history Future.
+    """
+    fut = _log_chat(ctx["user"], ctx["query"], answer, ctx["sources_str"], ctx["db_name"])
+    if ctx["use_cache"] and from_model:
+        try:
+            key = _ANSWER_CACHE.put(
+                ctx["query"], answer=answer, sources=ctx["bundle"].get("sources", []),
+                chunk_ids=ctx["chunk_ids"], embed_fn=ctx["cache_embed"], **ctx["cache_key"],
+            )
+        except Exception as e:
+            print("⚠️ answer cache put failed:", e)
+            return fut
 
-        answer = _gemini_answer_single(query, file, snippets)
+        def _attach_chat_id(f: Future) -> None:
+            try:
+                _ANSWER_CACHE.set_chat_id(key, f.result())
+            except Exception as e:
+                print("⚠️ answer cache chat id failed:", e)
 
-        with sqlite3.connect(CHAT_DB) as conn:
-            conn.execute(
-                """
-                INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (user, query, answer, file, datetime.now().isoformat(), db_name),
-            )
-        return jsonify({"answer": answer})
-    except Exception as e:
-        print("❌ /api/single_file_answer error:", e)
-        return jsonify({"error": f"Failed to answer from selected file. {str(e)}"}), 500
+        def _written(f: Future) -> None:
+            try:
+                _CACHE_POOL.submit(_attach_chat_id, f)
+            except RuntimeError:
+                pass  # interpreter shutting down (final flush); the entry just has no chat id
+        fut.add_done_callback(_written)
+    return fut
 
 @askai_bp.post("/question")
 def question():
     """
     Main chat endpoint (multi-source):
-    - Searches (FTS/LIKE) with small domain boosts/synonyms
-    - Takes the global top-N chunks (default 20)
+    - Searches (FTS/LIKE) with small domain boosts/synonyms, fused with dense
+      vector hits when the DB has a vector store (see hybrid_search_rows)
+    - Packs up to N chunks (default 20) into a token budget (default
+      ASKAI_CONTEXT_TOKENS) by MMR, trimmed to query-relevant windows; the
+      response's `context` reports chunk and prompt token counts
     - Synthesizes an answer grounded in those snippets
+    With "dbs": [...] or "*" instead of "db", searches those DBs in parallel
+    (see federated_search_rows) and returns per-chunk `provenance`.
     """
     try:
-        data = request.get_json(force=True) or {}
-        query = (data.get("query") or "").strip()
-        db_name = (data.get("db") or "").strip()
-        user = data.get("user") or "guest"
-        use_cache = bool(data.get("use_cache", True))
-        min_wo = int(data.get("min", 0))
-        max_wo = int(data.get("max", 99999999))
-        max_chunks = int(data.get("max_chunks", 20))  # client can override
+        ctx = _question_request(request.get_json(force=True) or {})
+        if ctx["cached"]:
+            return jsonify({"answer": ctx["cached"]["answer"], "cached": True})
+        if not ctx["rows"]:
+            return jsonify({"answer": "No relevant documents found."})
+
+        with stage("gemini"):
+            answer, from_model = _gemini_answer_multi(ctx["query"], ctx["bundle"], user=ctx["user"])
+        with stage("chat_log"):
+            _question_answered(ctx, answer, from_model)
+        if ctx["federated"]:
+            return jsonify({"answer": answer, "context": ctx["context"],
+                            "provenance": ctx["provenance"], "searched": ctx["searched"]})
+        return jsonify({"answer": answer, "context": ctx["context"]})
+    except _ApiError as e:
+        return jsonify({"error": str(e)}), e.status
+    except SchedulerBusy as e:
+        return _busy_response(e)
+    except Exception as e:
+        print("❌ /api/question error:", e)
+        return jsonify({"error": f"Failed to answer question: {str(e)}"}), 500
 
-        if not query or not db_name:
-            return jsonify({"error": "Missing query or database name."}), 400
-        if db_name in RESTRICTED_DBS:
-            return jsonify({"error": "Restricted database."}), 403
+@askai_bp.post("/question/stream")
+def question_stream():
+    """
+    Streaming /question (Server-Sent Events): `sources` first, then `token`
+    events as Gemini generates, then `done` with the chat_history id.
+    """
+    try:
+        ctx = _question_request(request.get_json(force=True) or {})
+    except _ApiError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        print("❌ /api/question/stream error:", e)
+        return jsonify({"error": f"Failed to answer question: {str(e)}"}), 500
 
-        db_path = _safe_db_path(db_name)
+    if ctx["cached"]:
+        hit = ctx["cached"]
+        payload = {"sources": hit["sources"], "chunk_ids": hit["chunk_ids"], "cached": True}
+        return _sse_response(_stream_answer_events(payload, iter([hit["answer"]]), lambda _a: hit["chat_id"]))
+    if not ctx["rows"]:
+        events = _stream_answer_events(
+            {"sources": [], "chunk_ids": []}, iter(["No relevant documents found."]), lambda _a: None
+        )
+        return _sse_response(events)
 
-        # Retrieve many rows, then take the global top-N chunks
-        with _connect(db_path) as conn:
-            rows = search_rows(conn, query, min_wo, max_wo, top_k=120)
-            if not rows:
-                return jsonify({"answer": "No relevant documents found."})
-
-        bundle = build_snippets_from_top_chunks(rows, max_chunks=max_chunks, snip_len=99999)
-        sources_str = ", ".join(bundle.get("sources", []))
-
-        # Cache hit? (keyed by exact question + joined sources)
-        if use_cache:
-            with sqlite3.connect(CHAT_DB) as conn:
-                cur = conn.execute(
-                    """
-                    SELECT answer FROM chat_history
-                    WHERE user = ? AND db_name = ? AND sources = ? AND LOWER(question) = LOWER(?)
-                    ORDER BY id DESC LIMIT 1
-                    """,
-                    (user, db_name, sources_str, query),
+    bundle = ctx["bundle"]
+    sources_payload = {"sources": bundle.get("sources", []), "chunk_ids": ctx["chunk_ids"], "context": ctx["context"]}
+    if ctx["federated"]:
+        sources_payload.update(provenance=ctx["provenance"], searched=ctx["searched"])
+    sources = bundle.get("sources", [])
+    outcome: Dict = {}
+    try:
+        pieces = _gemini_stream_text(
+            _build_prompt_multi(ctx["query"], bundle),
+            _extractive_multi(bundle),
+            ", ".join(sources) if sources else "documents",
+            user=ctx["user"],
+            outcome=outcome,
+        )
+    except SchedulerBusy as e:
+        return _busy_response(e)
+    persist = lambda answer: _question_answered(ctx, answer, outcome.get("ok", False)).result(timeout=10)
+    return _sse_response(_stream_answer_events(sources_payload, pieces, persist))
+
+# -----------------------------
+# Batch questions
+# -----------------------------
+_BATCH_POOL = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS), thread_name_prefix="askai-batch")
+# job id -> {"status", "created", "total", "results": [...], "done": int}
+_BATCH_JOBS: Dict[str, Dict] = {}
+_BATCH_JOBS_LOCK = threading.Lock()
+# Attempts per item when the Gemini scheduler pushes back
+BATCH_BUSY_RETRIES = 3
+
+_BATCH_ITEM_KEYS = ("db", "dbs", "min", "max", "max_chunks", "token_budget", "retrieval", "use_cache", "share_cache")
+
+def _batch_items(data: Dict) -> List[Dict]:
+    """Expand a batch payload into per-question /question payloads (defaults from the top level)."""
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        raise _ApiError("Provide a non-empty 'questions' array.", 400)
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise _ApiError(f"At most {BATCH_MAX_QUESTIONS} questions per batch.", 400)
+    defaults = {k: data[k] for k in _BATCH_ITEM_KEYS if k in data}
+    defaults["user"] = data.get("user") or "guest"
+    items = []
+    for q in questions:
+        item = dict(defaults)
+        if isinstance(q, dict):
+            item.update({k: q[k] for k in _BATCH_ITEM_KEYS + ("query",) if k in q})
+        else:
+            item["query"] = str(q or "")
+        items.append(item)
+    return items
+
+def _batch_dedupe_key(item: Dict) -> str:
+    scope = {k: item.get(k) for k in _BATCH_ITEM_KEYS}
+    return json.dumps([normalize_question(item.get("query") or ""), scope], sort_keys=True, default=str)
+
+def _answer_batch_item(item: Dict) -> Dict:
+    """One /question worth of work at batch priority; errors are returned, not raised."""
+    try:
+        ctx = _question_request(item)
+        if ctx["cached"]:
+            hit = ctx["cached"]
+            return {"answer": hit["answer"], "sources": hit["sources"], "cached": True}
+        if not ctx["rows"]:
+            return {"answer": "No relevant documents found.", "sources": []}
+        for attempt in range(BATCH_BUSY_RETRIES):
+            try:
+                answer, from_model = _gemini_answer_multi(
+                    ctx["query"], ctx["bundle"], user=ctx["user"], priority=BATCH
                 )
-                row = cur.fetchone()
-                if row:
-                    return jsonify({"answer": row[0]})
+                break
+            except SchedulerBusy as e:
+                if attempt == BATCH_BUSY_RETRIES - 1:
+                    return {"error": str(e), "status": 429, "retry_after": e.retry_after}
+                time.sleep(e.retry_after)
+        _question_answered(ctx, answer, from_model)
+        out = {"answer": answer, "sources": ctx["bundle"].get("sources", []), "context": ctx["context"]}
+        if ctx["federated"]:
+            out["provenance"] = ctx["provenance"]
+        return out
+    except _ApiError as e:
+        return {"error": str(e), "status": e.status}
+    except FileNotFoundError as e:
+        return {"error": str(e), "status": 404}
+    except Exception as e:
+        print("❌ batch question error:", e)
+        return {"error": f"Failed to answer question: {str(e)}", "status": 500}
 
-        answer = _gemini_answer_multi(query, bundle)
+def _run_batch(items: List[Dict]) -> Iterator[Dict]:
+    """
+    Answer every item on the batch pool, yielding {"index", "query", ...} as
+    each completes. Identical items (same normalized question and scope) run
+    once and fan out to every index that asked for them.
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, item in enumerate(items):
+        groups.setdefault(_batch_dedupe_key(item), []).append(i)
+    futures = {_BATCH_POOL.submit(_answer_batch_item, items[idxs[0]]): idxs for idxs in groups.values()}
+    try:
+        for fut in as_completed(futures):
+            result = fut.result()
+            for n, i in enumerate(futures[fut]):
+                yield {"index": i, "query": items[i].get("query"), **result, **({"deduped": True} if n else {})}
+    finally:
+        for fut in futures:
+            fut.cancel()  # client went away: drop what hasn't started
+
+def _expire_batch_jobs() -> None:
+    cutoff = time.time() - BATCH_JOB_TTL_S
+    with _BATCH_JOBS_LOCK:
+        for job_id in [j for j, job in _BATCH_JOBS.items() if job["created"] < cutoff]:
+            del _BATCH_JOBS[job_id]
+
+def _start_batch_job(items: List[Dict]) -> str:
+    _expire_batch_jobs()
+    job_id = uuid.uuid4().hex
+    job = {"status": "running", "created": time.time(), "total": len(items), "done": 0,
+           "results": [None] * len(items)}
+    with _BATCH_JOBS_LOCK:
+        _BATCH_JOBS[job_id] = job
+
+    def _collect() -> None:
+        t0 = time.perf_counter()
+        try:
+            for res in _run_batch(items):
+                with _BATCH_JOBS_LOCK:
+                    job["results"][res["index"]] = res
+                    job["done"] += 1
+            job["status"] = "done"
+        except Exception as e:
+            print("❌ batch job error:", e)
+            job["status"] = "failed"
+        job["seconds"] = round(time.perf_counter() - t0, 2)
 
-        with sqlite3.connect(CHAT_DB) as conn:
-            conn.execute(
-                """
-                INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (user, query, answer, sources_str, datetime.now().isoformat(), db_name),
-            )
+    threading.Thread(target=_collect, name=f"askai-batch-{job_id[:8]}", daemon=True).start()
+    return job_id
 
-        return jsonify({"answer": answer})
+@askai_bp.post("/question/batch")
+def question_batch():
+    """
+    Many questions in one call:
+    { "questions": ["...", {"query": "...", "db": "other.db"}, ...],
+      "db": "hr.db" | "dbs": [...]|"*", "user": "...", "min"/"max"/"max_chunks": ...,
+      "async": false }
+    Streams NDJSON, one {"index", "query", "answer", "sources", ...} line per
+    question as it completes, then {"done": true, ...}. With "async": true,
+    returns 202 {"job_id"} to poll at GET /question/batch/<job_id>.
+    Gemini calls run at batch priority; cached answers are reused.
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        items = _batch_items(data)
+    except _ApiError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
-        print("❌ /api/question error:", e)
-        return jsonify({"error": f"Failed to answer question: {str(e)}"}), 500
+        print("❌ /api/question/batch error:", e)
+        return jsonify({"error": f"Invalid batch: {str(e)}"}), 400
+
+    if data.get("async"):
+        job_id = _start_batch_job(items)
+        return jsonify({"job_id": job_id, "total": len(items), "status": "running"}), 202
+
+    def _lines() -> Iterator[str]:
+        t0 = time.perf_counter()
+        n = 0
+        for res in _run_batch(items):
+            n += 1
+            yield json.dumps(res) + "\n"
+        yield json.dumps({"done": True, "count": n, "seconds": round(time.perf_counter() - t0, 2)}) + "\n"
+
+    return Response(
+        stream_with_context(_lines()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@askai_bp.get("/question/batch/<job_id>")
+def question_batch_status(job_id: str):
+    """Poll an async batch: status, progress and the results finished so far (by index)."""
+    with _BATCH_JOBS_LOCK:
+        job = _BATCH_JOBS.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown or expired job id."}), 404
+        out = {k: v for k, v in job.items() if k != "results"}
+        out["results"] = [r for r in job["results"] if r is not None]
+    return jsonify(out)
 
 @askai_bp.get("/chat_history")
 def chat_history():
@@ -698,6 +2119,7 @@ def chat_history():
     user = request.args.get("user", "guest")
     db_name = request.args.get("db", "")
     try:
+        _CHAT_WRITER.flush(timeout=2)  # read-your-writes for rows still queued
         with sqlite3.connect(CHAT_DB) as conn:
             rows = conn.execute(
                 """
@@ -725,6 +2147,7 @@ def delete_history():
         question = data.get("question")
         if not all([user, db_name, question]):
             return jsonify({"error": "Missing parameters"}), 400
+        _CHAT_WRITER.flush(timeout=2)
         with sqlite3.connect(CHAT_DB) as conn:
             conn.execute(
                 "DELETE FROM chat_history WHERE user=? AND db_name=? AND question=?",
@@ -748,33 +2171,29 @@ def quick_view():
             return jsonify({"error": "Filename and db required."}), 400
 
         db_path = _safe_db_path(db_name)
-        with _connect(db_path) as conn:
-            table, content_col = _detect_content_table(conn)
-            fcol = _file_column(conn, table) or "file"
-            rows = conn.execute(
-                f"SELECT {content_col} FROM {table} WHERE {fcol} = ?",
-                (filename,),
-            ).fetchall()
-        text = " ".join((r[content_col] or "") for r in rows)
-        ts = _expand_terms(_terms(query))
-        pieces = re.split(r"(?<=[.!?])\s+|\n+", text)
-        scored: List[Tuple[str, int]] = []
-        for s in pieces:
-            s2 = (s or "").strip()
-            if not s2:
-                continue
-            hits = _count_hits(s2, ts)
-            if hits > 0:
-                snip = s2 if len(s2) <= 360 else (s2[:357].rstrip() + "…")
-                scored.append((snip, hits))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        snippets = [s for s, _ in scored[:8]]
+        with stage("snippets"):
+            snippets = _file_snippets(db_path, filename, query, max_len=360)
         return jsonify({"snippets": snippets})
     except Exception as e:
         print("❌ /api/quick_view error:", e)
         return jsonify({"error": "Unable to generate quick view."}), 500
 
 # Diagnostics (handy while wiring new DBs)
+def runtime_stats() -> Dict:
+    """Cache/LLM/writer/embedder counters; app.py's /api/health reports these under "askai"."""
+    return {
+        "answer_cache": _ANSWER_CACHE.snapshot(),
+        "llm": _LLM.snapshot(),
+        "retrieval_cache": _RETRIEVAL_CACHE.snapshot(),
+        "chat_writer": _CHAT_WRITER.snapshot(),
+        "embedder": {
+            "model": EMBED_MODEL,
+            "backend": EMBED_BACKEND,
+            "loaded": loaded_backend(),
+            "service": _EMBED_SERVICE.snapshot(),
+        },
+    }
+
 @askai_bp.get("/health")
 def health():
     return jsonify({
@@ -782,6 +2201,8 @@ def health():
         "gemini_ok": _gemini_client_ok,
         "model": _GEMINI_MODEL,
         "admin_enabled": ENABLE_ADMIN,
+        "pool": pool_stats(),
+        **runtime_stats(),
     })
 
 @askai_bp.get("/introspect")
@@ -792,7 +2213,7 @@ def introspect():
         return jsonify({"error": "db param required"}), 400
     try:
         db_path = _safe_db_path(db_name)
-        with _connect(db_path) as conn:
+        with _pooled(db_path) as conn:
             tables = _list_tables(conn)
             info = {}
             for t in tables:
@@ -812,18 +2233,202 @@ if ENABLE_ADMIN:
           "db": "my_new.db",
           "records": [ {"file":"docA.pdf","content":"...","page":1,"wo":123}, ... ]
         }
+        or stream NDJSON (Content-Type: application/x-ndjson, target in ?db=my_new.db),
+        one record object per line. Either way the DB is built off to the side and
+        swapped in atomically; the response reports throughput.
         """
         try:
-            data = request.get_json(force=True) or {}
-            name = (data.get("db") or "").strip()
-            records = data.get("records") or []
-            if not name or not name.lower().endswith(".db"):
+            if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+                name = (request.args.get("db") or "").strip()
+                records: Iterable[Dict] = _iter_ndjson(request.stream)
+            else:
+                data = request.get_json(force=True) or {}
+                name = (data.get("db") or "").strip()
+                records = data.get("records") or []
+                if not isinstance(records, list) or not records:
+                    return jsonify({"error": "Provide a non-empty 'records' array"}), 400
+            if not name or not name.lower().endswith(".db") or any(ch in name for ch in ("/", "\\", "..")):
                 return jsonify({"error": "Provide a target db filename ending in .db"}), 400
-            if not isinstance(records, list) or not records:
-                return jsonify({"error": "Provide a non-empty 'records' array"}), 400
+            if name in RESTRICTED_DBS:
+                return jsonify({"error": "Restricted database."}), 403
             out_path = os.path.join(UPLOADS_DIR, name)
-            _create_chunk_db(out_path, records)
-            return jsonify({"status": "ok", "db": name, "count": len(records)})
+            stats = _create_chunk_db(out_path, records)
+            return jsonify({"status": "ok", "db": name, **stats})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             print("❌ /api/build-chunks error:", e)
             return jsonify({"error": "Failed to build chunk DB"}), 500
+
+    @askai_bp.post("/upsert-file")
+    def upsert_file():
+        """
+        POST JSON: { "db": "hr.db", "file": "Leave Policy.pdf",
+                     "records": [ {"content":"...","page":1,"wo":123}, ... ] }
+        Replaces all chunks of `file` (inserting it if new). An empty `records`
+        array deletes the file.
+        """
+        try:
+            data = request.get_json(force=True) or {}
+            name = (data.get("db") or "").strip()
+            file = (data.get("file") or "").strip()
+            records = data.get("records")
+            if name in RESTRICTED_DBS:
+                return jsonify({"error": "Restricted database."}), 403
+            if not file or not isinstance(records, list):
+                return jsonify({"error": "Provide 'file' and a 'records' array"}), 400
+            return jsonify({"status": "ok", "db": name, **replace_file_chunks(_safe_db_path(name), file, records)})
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            print("❌ /api/upsert-file error:", e)
+            return jsonify({"error": "Failed to update file"}), 500
+
+    @askai_bp.post("/delete-file")
+    def delete_file():
+        """POST JSON: { "db": "hr.db", "file": "Leave Policy.pdf" }"""
+        try:
+            data = request.get_json(force=True) or {}
+            name = (data.get("db") or "").strip()
+            file = (data.get("file") or "").strip()
+            if name in RESTRICTED_DBS:
+                return jsonify({"error": "Restricted database."}), 403
+            if not file:
+                return jsonify({"error": "Provide 'file'"}), 400
+            return jsonify({"status": "ok", "db": name, **replace_file_chunks(_safe_db_path(name), file, [])})
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            print("❌ /api/delete-file error:", e)
+            return jsonify({"error": "Failed to delete file"}), 500
+
+    @askai_bp.post("/build-vectors")
+    def build_vectors():
+        """
+        POST JSON: {"db": "my_db.db", "dtype": "float16"|"float32"}
+        Embeds every chunk and writes the memory-mapped vector store next to the DB.
+        """
+        try:
+            data = request.get_json(force=True) or {}
+            db_path = _safe_db_path((data.get("db") or "").strip())
+            dtype = data.get("dtype") or vector_store.DEFAULT_DTYPE
+            if dtype not in ("float16", "float32"):
+                return jsonify({"error": "dtype must be float16 or float32"}), 400
+            with _pooled(db_path) as conn:
+                prof = _schema_profile(conn)
+            meta = vector_store.build_store(
+                db_path, prof.table, prof.pk_expr, prof.content_col,
+                embed_many, dtype=dtype, model_name=EMBED_MODEL,
+            )
+            return jsonify({"status": "ok", **meta})
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except Exception as e:
+            print("❌ /api/build-vectors error:", e)
+            return jsonify({"error": "Failed to build vector store"}), 500
+
+    # db path -> job id of the embed job running on it; job id -> job
+    _EMBED_JOBS: Dict[str, Dict] = {}
+    _EMBED_RUNNING: Dict[str, str] = {}
+    _EMBED_JOBS_LOCK = threading.Lock()
+
+    @askai_bp.post("/embed-chunks")
+    def embed_chunks():
+        """
+        POST JSON: {"db": "reports_chunks.db", "dtype": "float16"|"float32",
+                    "workers": 4, "threads": 2, "batch_size": 64, "restart": false}
+        (Re)computes chunks.embedding in a background job (embed_pipeline), resuming
+        after the last committed row, then rebuilds the embedding store / ANN index.
+        Returns 202 {"job_id"} to poll at GET /embed-chunks/<job_id>. Always runs
+        in worker processes: the in-process mode would reset this server's
+        torch thread count.
+        """
+        try:
+            data = request.get_json(force=True) or {}
+            name = (data.get("db") or "").strip()
+            if name in RESTRICTED_DBS:
+                return jsonify({"error": "Restricted database."}), 403
+            db_path = _safe_db_path(name)
+            dtype = data.get("dtype") or "float32"
+            if dtype not in ("float16", "float32"):
+                return jsonify({"error": "dtype must be float16 or float32"}), 400
+            opts = {
+                "dtype": dtype,
+                "workers": int(data.get("workers", embed_pipeline.WORKERS)),
+                "threads": max(1, int(data.get("threads", embed_pipeline.THREADS))),
+                "batch_size": max(1, int(data.get("batch_size", embed_pipeline.BATCH_SIZE))),
+                "restart": bool(data.get("restart")),
+            }
+            if opts["workers"] < 1:
+                return jsonify({"error": "workers must be at least 1"}), 400
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+
+        job_id = uuid.uuid4().hex
+        job = {"status": "running", "created": time.time(), "db": name, **opts, "progress": None}
+        with _EMBED_JOBS_LOCK:
+            if db_path in _EMBED_RUNNING:
+                return jsonify({"error": "An embed job is already running for this db.",
+                                "job_id": _EMBED_RUNNING[db_path]}), 409
+            _EMBED_RUNNING[db_path] = job_id
+            _EMBED_JOBS[job_id] = job
+
+        def _progress(p: Dict) -> None:
+            job["progress"] = p
+            print(f"🧮 embed {name}: {p['done']}/{p['rows']} chunks ({p['chunks_per_s']}/s)")
+
+        def _run() -> None:
+            try:
+                job["result"] = embed_pipeline.embed_chunks(db_path, progress=_progress, **opts)
+                job["status"] = "done"
+            except Exception as e:
+                print("❌ embed job error:", e)
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                with _EMBED_JOBS_LOCK:
+                    _EMBED_RUNNING.pop(db_path, None)
+
+        threading.Thread(target=_run, name=f"askai-embed-{job_id[:8]}", daemon=True).start()
+        return jsonify({"job_id": job_id, "status": "running"}), 202
+
+    @askai_bp.get("/embed-chunks/<job_id>")
+    def embed_chunks_status(job_id: str):
+        with _EMBED_JOBS_LOCK:
+            job = _EMBED_JOBS.get(job_id)
+            if job is None:
+                return jsonify({"error": "Unknown job id."}), 404
+            return jsonify(dict(job))
+
+    @askai_bp.post("/chat-history/prune")
+    def prune_chat_history():
+        """
+        POST JSON: {"older_than_days": 180, "archive": true}
+        Removes chat_history rows older than N days; with archive, copies them to
+        chat_history_archive.db first.
+        """
+        try:
+            data = request.get_json(force=True) or {}
+            days = int(data.get("older_than_days", 0))
+            if days <= 0:
+                return jsonify({"error": "older_than_days must be a positive integer"}), 400
+            _CHAT_WRITER.flush(timeout=10)
+            result = prune_history(CHAT_DB, days, CHAT_ARCHIVE_DB if data.get("archive") else None)
+            return jsonify({"status": "ok", **result})
+        except Exception as e:
+            print("❌ /api/chat-history/prune error:", e)
+            return jsonify({"error": "Failed to prune chat history"}), 500
+
+    @askai_bp.get("/timings")
+    def stage_timings():
+        """GET /api/timings[?reset=1] — per-endpoint, per-stage latency histograms (ms)."""
+        snap = _STAGE_HISTOGRAMS.snapshot()
+        if request.args.get("reset") in ("1", "true"):
+            _STAGE_HISTOGRAMS.reset()
+        return jsonify({"buckets_ms": list(_STAGE_HISTOGRAMS.buckets_ms), "endpoints": snap})
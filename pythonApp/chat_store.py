@@ -0,0 +1,224 @@
+# chat_store.py
+# chat_history.db schema upkeep + a write-behind queue for chat_history inserts.
+#
+# Request handlers call ChatHistoryWriter.submit(...) and get a Future back; a
+# single background thread drains the queue and writes each batch in one
+# transaction. Pending rows are flushed at interpreter exit (atexit).
+
+from __future__ import annotations
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+BATCH_SIZE = int(os.getenv("ASKAI_CHAT_BATCH", "200"))
+FLUSH_INTERVAL_S = float(os.getenv("ASKAI_CHAT_FLUSH_MS", "250")) / 1000.0
+MAX_QUEUE = int(os.getenv("ASKAI_CHAT_MAX_QUEUE", "10000"))
+
+_INSERT_SQL = """
+    INSERT INTO chat_history (user, question, answer, sources, timestamp, db_name)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def init_chat_schema(db_path: str) -> None:
+    """chat_history table, WAL mode and the indexes /chat_history and pruning rely on."""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                user      TEXT,
+                question  TEXT,
+                answer    TEXT,
+                sources   TEXT,
+                timestamp TEXT,
+                db_name   TEXT
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_user_db_ts ON chat_history(user, db_name, timestamp)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_ts ON chat_history(timestamp)")
+
+
+class ChatHistoryWriter:
+    """Batching write-behind writer for chat_history rows."""
+
+    def __init__(self, db_path: str, batch_size: int = BATCH_SIZE,
+                 flush_interval_s: float = FLUSH_INTERVAL_S, max_queue: int = MAX_QUEUE):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self._q: "queue.Queue[Tuple[Tuple, Future]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "sync_fallbacks": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # -- producer side --------------------------------------------------------
+    def submit(self, user: str, question: str, answer: str, sources: str, db_name: str,
+               timestamp: Optional[str] = None) -> Future:
+        """Queue one row; the Future resolves to its chat_history id once committed."""
+        row = (user, question, answer, sources, timestamp or datetime.now().isoformat(), db_name)
+        fut: Future = Future()
+        if self._stop.is_set():
+            self._write_sync(row, fut)
+            return fut
+        try:
+            self._q.put_nowait((row, fut))
+            with self._lock:
+                self.stats["queued"] += 1
+        except queue.Full:
+            # Backpressure: never drop history, write inline instead
+            with self._lock:
+                self.stats["sync_fallbacks"] += 1
+            self._write_sync(row, fut)
+        return fut
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far is committed (read-your-writes)."""
+        if self._q.unfinished_tasks == 0:
+            return True
+        marker: Future = Future()
+        try:
+            self._q.put((None, marker), timeout=timeout)
+        except queue.Full:
+            return False
+        try:
+            marker.result(timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        """Stop the worker after draining the queue (registered with atexit)."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=30)
+        # Anything that raced in after the worker exited
+        self._drain_remaining()
+
+    # -- consumer side --------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._q.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch) -> None:
+        rows = [(row, fut) for row, fut in batch if row is not None]
+        markers = [fut for row, fut in batch if row is None]
+        try:
+            if rows:
+                conn = sqlite3.connect(self.db_path, timeout=30)
+                try:
+                    with conn:
+                        ids = [conn.execute(_INSERT_SQL, row).lastrowid for row, _ in rows]
+                finally:
+                    conn.close()
+                for (_, fut), rid in zip(rows, ids):
+                    fut.set_result(int(rid))
+                with self._lock:
+                    self.stats["written"] += len(rows)
+                    self.stats["batches"] += 1
+        except Exception as e:
+            print("❌ chat history batch write failed:", e)
+            with self._lock:
+                self.stats["errors"] += 1
+            for _, fut in rows:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            for fut in markers:
+                fut.set_result(None)
+            for _ in batch:
+                self._q.task_done()
+
+    def _write_sync(self, row: Tuple, fut: Future) -> None:
+        try:
+            with sqlite3.connect(self.db_path, timeout=30) as conn:
+                fut.set_result(int(conn.execute(_INSERT_SQL, row).lastrowid))
+        except Exception as e:
+            fut.set_exception(e)
+
+    def _drain_remaining(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write_batch(batch)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            out = dict(self.stats)
+        out["pending"] = self._q.qsize()
+        return out
+
+
+def prune_history(db_path: str, older_than_days: int, archive_path: Optional[str] = None,
+                  batch: int = 5000) -> Dict:
+    """
+    Delete chat_history rows older than N days, optionally copying them into
+    `archive_path` (same schema) first. Works in batches so the writer thread
+    is never blocked for long.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    moved = 0
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if archive_path:
+            init_chat_schema(archive_path)
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        while True:
+            with conn:
+                ids = [r[0] for r in conn.execute(
+                    "SELECT id FROM chat_history WHERE timestamp < ? ORDER BY timestamp LIMIT ?",
+                    (cutoff, batch),
+                )]
+                if not ids:
+                    break
+                marks = ",".join("?" * len(ids))
+                if archive_path:
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO archive.chat_history "
+                        f"SELECT * FROM main.chat_history WHERE id IN ({marks})",
+                        ids,
+                    )
+                conn.execute(f"DELETE FROM main.chat_history WHERE id IN ({marks})", ids)
+                moved += len(ids)
+        if archive_path:
+            conn.execute("DETACH DATABASE archive")
+    finally:
+        conn.close()
+    return {
+        "cutoff": cutoff,
+        "removed": moved,
+        "archived_to": os.path.basename(archive_path) if archive_path else None,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
@@ -0,0 +1,145 @@
+# context_packer.py
+# Token-budgeted context selection for AskAI prompts.
+#
+# Retrieval hands back ranked chunks of any size. The packer:
+#   1. trims each chunk to its most query-dense window (<= max_chunk_tokens),
+#   2. picks chunks greedily by MMR: lambda * relevance - (1 - lambda) * max
+#      similarity to chunks already picked (word-set Jaccard),
+#   3. stops when the token budget or max_chunks is reached.
+# Token counts are estimates (chars / CHARS_PER_TOKEN); good enough to keep
+# prompt size bounded and predictable without a tokenizer dependency.
+
+from __future__ import annotations
+import math
+import os
+import re
+from typing import Dict, FrozenSet, List, Optional, Sequence, Union
+
+from term_matcher import TermMatcher, term_matcher
+
+CONTEXT_TOKENS = int(os.getenv("ASKAI_CONTEXT_TOKENS", "3000"))
+CHUNK_TOKENS = int(os.getenv("ASKAI_CHUNK_TOKENS", "400"))
+MMR_LAMBDA = float(os.getenv("ASKAI_MMR_LAMBDA", "0.7"))
+CHARS_PER_TOKEN = 4
+# Chunks that would fit only as a shorter window than this are skipped
+MIN_CHUNK_TOKENS = 40
+
+_word_re = re.compile(r"[a-z0-9][a-z0-9\-_.]*")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def _word_set(text: str) -> FrozenSet[str]:
+    return frozenset(_word_re.findall((text or "").lower()))
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def query_window(text: str, terms: Union[Sequence[str], TermMatcher], max_chars: int) -> str:
+    """
+    The `max_chars` slice of `text` containing the most query-term hits, snapped
+    to word boundaries and marked with "…" where it was cut. Text that already
+    fits is returned unchanged; with no hits, the head of the text is used.
+    """
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    hits = [start for start, _, _ in term_matcher(terms).spans(text)]
+
+    best_start, best_count, j = 0, 0, 0
+    for i, pos in enumerate(hits):
+        while hits[j] < pos - max_chars // 2:
+            j += 1
+        # window centred-ish on the hit cluster ending at `pos`
+        count = i - j + 1
+        if count > best_count:
+            best_count, best_start = count, max(0, hits[j] - max_chars // 4)
+    start = min(best_start, len(text) - max_chars)
+    end = start + max_chars
+
+    if start > 0:
+        sp = text.find(" ", start)
+        start = sp + 1 if 0 <= sp < start + 40 else start
+    if end < len(text):
+        sp = text.rfind(" ", start, end)
+        end = sp if sp > start + max_chars // 2 else end
+    window = text[start:end].strip()
+    return ("…" if start > 0 else "") + window + ("…" if end < len(text) else "")
+
+
+def pack_context(
+    rows: List[Dict],
+    terms: Sequence[str],
+    token_budget: int = CONTEXT_TOKENS,
+    max_chunks: int = 20,
+    max_chunk_tokens: int = CHUNK_TOKENS,
+    mmr_lambda: float = MMR_LAMBDA,
+) -> Dict:
+    """
+    Select and trim `rows` (ranked, with "content" and "score") to fit
+    `token_budget`. Returns {"rows": selected rows (content trimmed, in pick
+    order), "tokens", "budget", "considered", "trimmed"}.
+    """
+    matcher = term_matcher(terms)
+    cands = []
+    for rank, r in enumerate(rows):
+        content = (r.get("content") or "").strip()
+        if not content:
+            continue
+        window = query_window(content, matcher, max_chunk_tokens * CHARS_PER_TOKEN)
+        cands.append({
+            "row": r,
+            "rank": rank,
+            "text": window,
+            "tokens": estimate_tokens(window),
+            "words": _word_set(window),
+            "trimmed": len(window) < len(content),
+        })
+    if not cands:
+        return {"rows": [], "tokens": 0, "budget": token_budget, "considered": 0, "trimmed": 0}
+
+    # Relevance on a 0..1 scale; rank breaks ties for equal scores
+    top = max((c["row"].get("score") or 0.0) for c in cands) or 1.0
+    for c in cands:
+        c["rel"] = (c["row"].get("score") or 0.0) / top - c["rank"] * 1e-6
+
+    picked: List[Dict] = []
+    used = 0
+    remaining = list(cands)
+    while remaining and len(picked) < max_chunks:
+        left = token_budget - used
+        best: Optional[Dict] = None
+        best_val = -math.inf
+        for c in remaining:
+            if c["tokens"] > left and left < MIN_CHUNK_TOKENS:
+                continue
+            redundancy = max((_jaccard(c["words"], p["words"]) for p in picked), default=0.0)
+            val = mmr_lambda * c["rel"] - (1.0 - mmr_lambda) * redundancy
+            if val > best_val:
+                best, best_val = c, val
+        if best is None:
+            break
+        remaining.remove(best)
+        if best["tokens"] > left:
+            # Last slot: shrink to what is left of the budget
+            best["text"] = query_window(best["text"], matcher, left * CHARS_PER_TOKEN)
+            best["tokens"] = estimate_tokens(best["text"])
+            best["trimmed"] = True
+        picked.append(best)
+        used += best["tokens"]
+        if used >= token_budget:
+            break
+
+    return {
+        "rows": [{**c["row"], "content": c["text"]} for c in picked],
+        "tokens": used,
+        "budget": token_budget,
+        "considered": len(cands),
+        "trimmed": sum(1 for c in picked if c["trimmed"]),
+    }
@@ -0,0 +1,229 @@
+# embed_pipeline.py
+# (Re)compute the `embedding` column of a chunk DB in bulk.
+#
+# Rows are streamed out of the DB in rowid order, in batches of `batch_size`,
+# and embedded by a pool of worker processes (embed_worker). Each worker
+# loads the model once, with `threads` torch/onnx threads. Each batch is
+# embedded shortest-text-first to keep padding small.
+#
+# The parent writes the blobs (float16 or float32) into a staging column, in
+# transactions of COMMIT_ROWS. Each transaction also records the last rowid
+# written in askai_meta, so an interrupted run resumes where it stopped.
+# Results are written in submission order, so that rowid is always a clean
+# cut-off. Readers keep seeing the old `embedding` column, all one
+# model/dtype, until the run finishes. Then a single transaction moves the
+# staged blobs over and records embedding_dtype/embedding_dim.
+#
+# While the job runs it keeps a heartbeat under askai_meta.embed_job.
+# vector_store then keeps serving the existing store instead of rebuilding it
+# after every commit. At the end the ".emb" store is rebuilt, plus the ANN
+# index when the DB has one (or is big enough to want one).
+
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import ann_index
+import embedder
+import embed_worker
+import vector_store
+
+BATCH_SIZE = int(os.getenv("ASKAI_EMBED_JOB_BATCH", "64"))
+WORKERS = int(os.getenv("ASKAI_EMBED_JOB_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+THREADS = int(os.getenv("ASKAI_EMBED_JOB_THREADS", "2"))
+COMMIT_ROWS = 2048
+TEXT_COLUMNS = ("text", "content", "chunk")
+
+ProgressFn = Callable[[Dict], None]
+
+
+def _progress_key(table: str, blob_col: str) -> str:
+    return f"embed_progress:{table}.{blob_col}"
+
+
+def staging_column(blob_col: str) -> str:
+    return f"askai_{blob_col}_next"
+
+
+def _text_column(cols: set, table: str) -> str:
+    for name in TEXT_COLUMNS:
+        if name in cols:
+            return name
+    raise ValueError(f"'{table}' has none of the text columns {', '.join(TEXT_COLUMNS)}")
+
+
+def _read_meta(conn: sqlite3.Connection, key: str) -> Optional[Dict]:
+    row = conn.execute(f"SELECT value FROM {vector_store.META_TABLE} WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
+    conn.execute(
+        f"INSERT INTO {vector_store.META_TABLE}(key, value) VALUES (?, ?) "
+        f"ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def _heartbeat(conn: sqlite3.Connection) -> None:
+    _set_meta(conn, vector_store.EMBED_JOB_KEY, json.dumps({"pid": os.getpid(), "heartbeat": time.time()}))
+
+
+def embed_chunks(
+    db_path: str,
+    table: str = vector_store.BLOB_TABLE,
+    blob_col: str = vector_store.BLOB_COL,
+    dtype: str = "float32",
+    workers: int = WORKERS,
+    threads: int = THREADS,
+    batch_size: int = BATCH_SIZE,
+    restart: bool = False,
+    rebuild_index: bool = True,
+    progress: Optional[ProgressFn] = None,
+) -> Dict:
+    """
+    Embed every row of `table` into `blob_col`, resuming after the last committed
+    rowid unless `restart` (or the model/dtype changed). `workers=0` embeds in
+    this process and sets its (process-global) thread counts, so it is for the
+    CLI only. Returns counts, timings and the rebuilt store/ANN metadata.
+    """
+    if dtype not in ("float16", "float32"):
+        raise ValueError("dtype must be float16 or float32")
+    if vector_store.embed_job_active(db_path):
+        raise RuntimeError("another embed job is running on this DB")
+    t0 = time.perf_counter()
+    key = _progress_key(table, blob_col)
+    stage_col = staging_column(blob_col)
+    run = {"model": embedder.MODEL_NAME, "backend": embedder.BACKEND, "dtype": dtype}
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        text_col = _text_column(cols, table)
+        with conn:
+            for col in (blob_col, stage_col):
+                if col not in cols:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} BLOB")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {vector_store.META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+            _heartbeat(conn)
+
+        prev = _read_meta(conn, key)
+        start_after = -1
+        if prev and not restart and all(prev.get(k) == v for k, v in run.items()):
+            start_after = int(prev.get("last_rowid", -1))
+        else:
+            with conn:
+                _set_meta(conn, key, json.dumps({**run, "last_rowid": -1}))
+
+        total = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ?", (start_after,)).fetchone()[0]
+        stats = {"rows": total, "done": 0, "resumed_after": start_after, "last_rowid": start_after}
+        pending: List[tuple] = []
+        finished = False
+
+        def _commit() -> None:
+            if not pending:
+                return
+            with conn:
+                conn.executemany(f"UPDATE {table} SET {stage_col} = ? WHERE rowid = ?", pending)
+                _set_meta(conn, key, json.dumps({**run, "last_rowid": stats["last_rowid"]}))
+                _heartbeat(conn)
+            pending.clear()
+            if progress:
+                elapsed = time.perf_counter() - t0
+                progress({**stats, "chunks_per_s": round(stats["done"] / elapsed, 1) if elapsed else None})
+
+        def _write(ids: List[int], vecs: np.ndarray) -> None:
+            blobs = vecs.astype(dtype)
+            pending.extend((blobs[i].tobytes(), rid) for i, rid in enumerate(ids))
+            stats["done"] += len(ids)
+            stats["last_rowid"] = ids[-1]
+            if len(pending) >= COMMIT_ROWS:
+                _commit()
+
+        def _batches():
+            # Keyset pages rather than one open cursor: an open read would hold
+            # the shared lock and block our own commits on non-WAL DBs
+            after = start_after
+            while True:
+                batch = conn.execute(
+                    f"SELECT rowid, {text_col} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (after, batch_size),
+                ).fetchall()
+                if not batch:
+                    return
+                after = int(batch[-1][0])
+                yield [int(r[0]) for r in batch], [str(r[1] or "") for r in batch]
+
+        try:
+            if workers <= 0:
+                embed_worker.init_worker(threads)
+                for ids, texts in _batches():
+                    _write(ids, embed_worker.encode_batch(texts))
+            else:
+                # spawn: workers must not inherit the server's threads/locks
+                with ProcessPoolExecutor(
+                    max_workers=workers, mp_context=get_context("spawn"),
+                    initializer=embed_worker.init_worker, initargs=(threads,),
+                ) as pool:
+                    inflight: deque = deque()
+                    for ids, texts in _batches():
+                        inflight.append((ids, pool.submit(embed_worker.encode_batch, texts)))
+                        # Bounded read-ahead; write strictly in rowid order
+                        while len(inflight) >= workers * 2:
+                            done_ids, fut = inflight.popleft()
+                            _write(done_ids, fut.result())
+                    while inflight:
+                        done_ids, fut = inflight.popleft()
+                        _write(done_ids, fut.result())
+            finished = True
+        finally:
+            # Whatever finished is kept; the next run resumes after it
+            _commit()
+            with conn:
+                if finished:
+                    # Every row is staged in one model/dtype now: swap them in together
+                    width = conn.execute(
+                        f"SELECT length({stage_col}) FROM {table} WHERE {stage_col} IS NOT NULL LIMIT 1"
+                    ).fetchone()
+                    if width:
+                        conn.execute(
+                            f"UPDATE {table} SET {blob_col} = {stage_col}, {stage_col} = NULL "
+                            f"WHERE {stage_col} IS NOT NULL"
+                        )
+                        _set_meta(conn, vector_store.EMBEDDING_DTYPE_KEY, dtype)
+                        _set_meta(conn, vector_store.EMBEDDING_DIM_KEY, str(width[0] // np.dtype(dtype).itemsize))
+                conn.execute(f"DELETE FROM {vector_store.META_TABLE} WHERE key = ?", (vector_store.EMBED_JOB_KEY,))
+    finally:
+        conn.close()
+
+    embed_seconds = time.perf_counter() - t0
+    out = {
+        **stats,
+        "table": table,
+        "text_col": text_col,
+        "dtype": dtype,
+        "model": embedder.MODEL_NAME,
+        "backend": embedder.BACKEND,
+        "workers": workers,
+        "threads": threads,
+        "batch_size": batch_size,
+        "embed_seconds": round(embed_seconds, 2),
+        "chunks_per_s": round(stats["done"] / embed_seconds, 1) if embed_seconds else None,
+    }
+    if rebuild_index and table == vector_store.BLOB_TABLE and blob_col == vector_store.BLOB_COL:
+        store = vector_store.blob_store(db_path)
+        out["store_rows"] = len(store) if store is not None else 0
+        if store is not None and ann_index.available() and (
+            ann_index.load(db_path) is not None or len(store) >= ann_index.ANN_MIN_ROWS
+        ):
+            out["ann"] = ann_index.build(db_path, store)
+    out["seconds"] = round(time.perf_counter() - t0, 2)
+    return out
@@ -0,0 +1,30 @@
+# embed_worker.py
+# What embed_pipeline's worker processes run. Kept to embedder + numpy so a
+# spawned worker imports no Flask/askai code, only the model.
+
+from __future__ import annotations
+from typing import List
+
+import numpy as np
+
+import embedder
+
+
+def init_worker(threads: int) -> None:
+    """Per-process setup: thread counts (process-global), then load the model once."""
+    embedder.ONNX_THREADS = threads
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    embedder.get_embedder()
+
+
+def encode_batch(texts: List[str]) -> np.ndarray:
+    """Embed one batch, shortest texts first (less padding), returned in input order."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vecs = embedder.embed_many([texts[i] for i in order])
+    out = np.empty_like(vecs)
+    out[order] = vecs
+    return out
@@ -0,0 +1,307 @@
+# embedder.py
+# Sentence embeddings for helpers/askai, loaded lazily on first use.
+#
+# Nothing heavy is imported until the first embed: processes that never embed
+# (OCR, reports, most workers) don't pay the model's start-up time or memory.
+# One model per process, behind a lock, shared by all threads.
+#
+# Backends (ASKAI_EMBED_BACKEND):
+#   torch      transformers + torch, as before (default)
+#   onnx       ONNX Runtime on an fp32 export of the same model
+#   onnx-int8  ONNX Runtime on a dynamically int8-quantized export
+# Every backend returns the mean of last_hidden_state over real tokens
+# (padding masked out), so one text embeds exactly as it did before and a
+# batch embeds each text the same way. int8 is close but not identical
+# (compare with non-app/bench_embeddings.py).
+# The ONNX files are exported once into ASKAI_ONNX_DIR; the export itself needs
+# torch, serving from them needs only onnxruntime + the tokenizer.
+#
+# Query embeddings (embed / embed_queries) go through EmbeddingService: an LRU
+# of recent query vectors, then a single worker thread that gathers concurrent
+# requests into micro-batches (up to ASKAI_EMBED_BATCH_MAX texts, waiting at
+# most ASKAI_EMBED_BATCH_WAIT_MS after the first) and runs one padded forward
+# pass for all of them. Bulk jobs (embed_many) call the model directly.
+
+from __future__ import annotations
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MODEL_NAME = os.getenv("ASKAI_EMBED_MODEL", "BAAI/bge-base-en-v1.5")
+BACKEND = os.getenv("ASKAI_EMBED_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = os.getenv("ASKAI_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "askai-onnx"))
+# 0 = let onnxruntime pick
+ONNX_THREADS = int(os.getenv("ASKAI_ONNX_THREADS", "0"))
+ONNX_OPSET = 14
+BATCH_MAX = int(os.getenv("ASKAI_EMBED_BATCH_MAX", "32"))
+BATCH_WAIT_MS = float(os.getenv("ASKAI_EMBED_BATCH_WAIT_MS", "5"))
+QUERY_CACHE_SIZE = int(os.getenv("ASKAI_EMBED_CACHE", "4096"))
+
+
+def _mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Mean over the real tokens of each row: (batch, seq, dim) -> (batch, dim) float32."""
+    mask = mask.astype(np.float32)[:, :, None]
+    summed = (hidden.astype(np.float32) * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+class TorchEmbedder:
+    def __init__(self, model_name: str = MODEL_NAME):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.backend = "torch"
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.eval()
+        self.dim = int(self.model.config.hidden_size)
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        inputs = self.tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True)
+        with self._torch.no_grad():
+            hidden = self.model(**inputs).last_hidden_state
+        return _mean_pool(hidden.numpy(), inputs["attention_mask"].numpy())
+
+
+def onnx_model_path(model_name: str = MODEL_NAME, quantized: bool = False) -> str:
+    folder = os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+    return os.path.join(folder, "model.int8.onnx" if quantized else "model.onnx")
+
+
+def export_onnx(model_name: str = MODEL_NAME, quantized: bool = False) -> str:
+    """Export (and optionally int8-quantize) the model for the ONNX backends; returns the path."""
+    fp32_path = onnx_model_path(model_name, quantized=False)
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(os.path.dirname(fp32_path), exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        sample = tokenizer(["warm up sentence"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        axes = {n: {0: "batch", 1: "seq"} for n in names}
+        axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+        tmp = fp32_path + ".tmp"
+        kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            kwargs["dynamo"] = False  # the TorchScript exporter handles dynamic_axes
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[n] for n in names), tmp,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes=axes, opset_version=ONNX_OPSET, **kwargs,
+            )
+        os.replace(tmp, fp32_path)
+    if not quantized:
+        return fp32_path
+
+    int8_path = onnx_model_path(model_name, quantized=True)
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp = int8_path + ".tmp.onnx"
+        quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, int8_path)
+    return int8_path
+
+
+class OnnxEmbedder:
+    def __init__(self, model_name: str = MODEL_NAME, quantized: bool = False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.backend = "onnx-int8" if quantized else "onnx"
+        path = onnx_model_path(model_name, quantized)
+        if not os.path.exists(path):
+            print(f"🛠️ Exporting {model_name} to ONNX ({self.backend}); one-time step")
+            path = export_onnx(model_name, quantized)
+        opts = ort.SessionOptions()
+        if ONNX_THREADS:
+            opts.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.dim = int(self.session.get_outputs()[0].shape[-1])
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        enc = self.tokenizer(list(texts), return_tensors="np", padding=True, truncation=True)
+        feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._inputs}
+        hidden = self.session.run(None, feeds)[0]
+        return _mean_pool(hidden, enc["attention_mask"])
+
+
+def create_embedder(backend: str = BACKEND, model_name: str = MODEL_NAME):
+    if backend == "torch":
+        return TorchEmbedder(model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(model_name, quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown ASKAI_EMBED_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+_EMBEDDER = None
+_EMBEDDER_LOCK = threading.Lock()
+
+
+def get_embedder():
+    """The process-wide embedder, created on first call (thread-safe)."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        with _EMBEDDER_LOCK:
+            if _EMBEDDER is None:
+                t0 = time.perf_counter()
+                _EMBEDDER = create_embedder()
+                print(f"🧠 Loaded {MODEL_NAME} ({BACKEND}) in {time.perf_counter() - t0:.1f}s")
+    return _EMBEDDER
+
+
+def loaded_backend() -> Optional[str]:
+    """Backend of the loaded model, or None if nothing has been embedded yet."""
+    return _EMBEDDER.backend if _EMBEDDER is not None else None
+
+
+class EmbeddingService:
+    """Micro-batching front end to the process-wide embedder, with an LRU of query vectors."""
+
+    def __init__(
+        self,
+        max_batch: int = BATCH_MAX,
+        max_wait_ms: float = BATCH_WAIT_MS,
+        cache_size: int = QUERY_CACHE_SIZE,
+    ):
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.cache_size = cache_size
+        self._cond = threading.Condition()
+        self._queue: Deque[Tuple[str, Future]] = deque()
+        # Texts already queued or running; later callers share the same Future
+        self._inflight: Dict[str, Future] = {}
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._worker: Optional[threading.Thread] = None
+        self.stats = {"texts": 0, "cache_hits": 0, "shared": 0, "batches": 0, "batched_texts": 0, "max_batch_seen": 0}
+
+    def _key(self, text: str) -> str:
+        """Whitespace-collapsed text (and lowercased for uncased tokenizers): same tokens, same vector."""
+        key = " ".join((text or "").split())
+        tokenizer = getattr(get_embedder(), "tokenizer", None)
+        if getattr(tokenizer, "do_lower_case", False):
+            key = key.lower()
+        return key
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """(n, dim) vectors for `texts`, in order."""
+        if not texts:
+            return np.zeros((0, get_embedder().dim), dtype=np.float32)
+        keys = [self._key(t) for t in texts]
+        out: List[Optional[np.ndarray]] = [None] * len(keys)
+        waiting: List[Tuple[int, Future]] = []
+        with self._cond:
+            self.stats["texts"] += len(keys)
+            for i, key in enumerate(keys):
+                vec = self._cache.get(key)
+                if vec is not None:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    out[i] = vec
+                    continue
+                fut = self._inflight.get(key)
+                if fut is None:
+                    fut = Future()
+                    self._inflight[key] = fut
+                    self._queue.append((key, fut))
+                else:
+                    self.stats["shared"] += 1
+                waiting.append((i, fut))
+            if waiting:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="askai-embed", daemon=True)
+                    self._worker.start()
+                self._cond.notify()
+        for i, fut in waiting:
+            out[i] = fut.result()
+        return np.stack(out)
+
+    def _next_batch(self) -> List[Tuple[str, Future]]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # Give concurrent callers a moment to join this batch
+            deadline = time.monotonic() + self.max_wait_s
+            while len(self._queue) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            n = min(self.max_batch, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            keys = [k for k, _ in batch]
+            try:
+                # Row copies, so a cached vector doesn't pin its whole batch
+                vecs = [np.array(v) for v in get_embedder().encode(keys)]
+            except Exception as e:
+                with self._cond:
+                    for key, _ in batch:
+                        self._inflight.pop(key, None)
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            with self._cond:
+                self.stats["batches"] += 1
+                self.stats["batched_texts"] += len(batch)
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+                for (key, _), vec in zip(batch, vecs):
+                    self._inflight.pop(key, None)
+                    if self.cache_size > 0:
+                        self._cache[key] = vec
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for (_, fut), vec in zip(batch, vecs):
+                fut.set_result(vec)
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            out = dict(self.stats)
+            out.update({
+                "queued": len(self._queue),
+                "cached": len(self._cache),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_s * 1000.0,
+            })
+        out["avg_batch"] = round(out["batched_texts"] / out["batches"], 2) if out["batches"] else None
+        lookups = out["texts"]
+        out["cache_hit_rate"] = round(out["cache_hits"] / lookups, 3) if lookups else None
+        return out
+
+
+service = EmbeddingService()
+
+
+def embed(text: str) -> np.ndarray:
+    """One query text -> (dim,) float32 vector (cached, micro-batched)."""
+    return service.embed([text])[0]
+
+
+def embed_queries(texts: Sequence[str]) -> np.ndarray:
+    """Query texts -> (n, dim) float32 matrix (cached, micro-batched)."""
+    return service.embed(texts)
+
+
+def embed_many(texts: Sequence[str]) -> np.ndarray:
+    """Bulk texts (e.g. building a store) -> (n, dim) float32 matrix, one forward pass, no cache."""
+    if not texts:
+        return np.zeros((0, get_embedder().dim), dtype=np.float32)
+    return get_embedder().encode(texts)
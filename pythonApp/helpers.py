@@ -7,24 +7,17 @@ import heapq
 import requests
 import os
 from dotenv import load_dotenv
-from transformers import AutoTokenizer, AutoModel
-import torch
 
 from difflib import SequenceMatcher
 import google.generativeai as genai
 
 load_dotenv()
 
-MODEL_NAME = "BAAI/bge-base-en-v1.5"
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-embedding_model = AutoModel.from_pretrained(MODEL_NAME)
+# The model loads on first use (see embedder.py); ASKAI_EMBED_BACKEND picks torch/onnx/onnx-int8
+from embedder import embed
 
 def compute_embedding(text):
-    inputs = tokenizer([text], return_tensors="pt", padding=True, truncation=True)
-    with torch.no_grad():
-        outputs = embedding_model(**inputs)
-
-    return outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
+    return embed(text)
 
 
 MAUI_LOCATIONS = {"maui", "lahaina", "kahului", "kihei", "wailuku", "makawao", "kula", "pukalani", "upcountry"}
@@ -46,12 +39,11 @@ def is_in_work_order_range(filename, min_wo, max_wo):
         return min_wo <= work_order <= max_wo
     return True
 
-import numpy as np
+import ann_index
+import vector_store
 
 
 def rank_documents(query, db_path, min_wo=0, max_wo=99999, top_k=20):
-    query_tokens = preprocess_query(query)
-
     with sqlite3.connect(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -64,40 +56,33 @@ def rank_documents(query, db_path, min_wo=0, max_wo=99999, top_k=20):
         if "chunks" not in tables:
             raise Exception("❌ 'chunks' table not found in database.")
 
-        cursor.execute("SELECT file, chunk, text, embedding FROM chunks")
-        rows = cursor.fetchall()
-
-        if not rows:
-            return []
-
-        texts = []
-        embeddings = []
-        file_chunk_pairs = []
-
-        for file, chunk, text, emb_blob in rows:
-            if not is_in_work_order_range(file, min_wo, max_wo):
-                continue
-            texts.append(text)
-            embeddings.append(np.frombuffer(emb_blob, dtype=np.float32))
-            file_chunk_pairs.append((file, chunk))
-
-        if not embeddings:
+        store = vector_store.blob_store(db_path)
+        if store is None or len(store) == 0:
             return []
 
+        # HNSW when the DB has an ANN index (large DBs); else one exact matmul.
+        # Either way the WO range is a row filter, not a post-filter.
         query_embedding = compute_embedding(query)
+        hits = ann_index.search_store(db_path, store, query_embedding, top_k, min_wo, max_wo)
+        if hits is None:
+            hits = store.search(query_embedding, top_k, allowed=store.wo_mask(min_wo, max_wo))
+        if not hits:
+            return []
 
-        scores = [np.dot(query_embedding, emb) / (np.linalg.norm(query_embedding) * np.linalg.norm(emb)) for emb in embeddings]
-
-        ranked = sorted(zip(file_chunk_pairs, texts, scores), key=lambda x: x[2], reverse=True)[:top_k]
+        # Text only for the winners
+        marks = ",".join("?" * len(hits))
+        cursor.execute(f"SELECT rowid, file, chunk, text FROM chunks WHERE rowid IN ({marks})",
+                       [rid for rid, _ in hits])
+        by_id = {row[0]: row[1:] for row in cursor.fetchall()}
 
         return [
             {
-                'file': file,
-                'chunk': chunk,
+                'file': by_id[rid][0],
+                'chunk': by_id[rid][1],
                 'score': round(score, 4),
-                'text': text
+                'text': by_id[rid][2]
             }
-            for (file, chunk), text, score in ranked
+            for rid, score in hits if rid in by_id
         ]
 
 def get_quick_view_sentences(file, query, db_path):
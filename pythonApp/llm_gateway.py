@@ -0,0 +1,286 @@
+# llm_gateway.py
+# Process-wide front door for Gemini calls made by AskAI.
+#
+# - One model client per gateway, created on first use and reused.
+# - Single-flight: concurrent calls with the same prompt share one in-flight
+#   generation (keyed on a hash of model + prompt).
+# - Per-call timeout; a caller that times out gets None, the generation itself
+#   is left to finish on its worker thread.
+# - Circuit breaker: after BREAKER_FAILURES consecutive failures/timeouts, calls
+#   short-circuit (return None) for BREAKER_COOLDOWN_S, then one trial call is
+#   let through. Callers treat None as "use the extractive answer".
+# - With a scheduler (llm_scheduler), each real call first takes a fair-share
+#   slot; SchedulerBusy propagates so routes can answer 429.
+
+from __future__ import annotations
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from llm_scheduler import INTERACTIVE, LLMScheduler, SchedulerBusy
+
+CALL_TIMEOUT_S = float(os.getenv("ASKAI_LLM_TIMEOUT_S", "60"))
+MAX_WORKERS = int(os.getenv("ASKAI_LLM_WORKERS", "8"))
+BREAKER_FAILURES = int(os.getenv("ASKAI_LLM_BREAKER_FAILS", "5"))
+BREAKER_COOLDOWN_S = float(os.getenv("ASKAI_LLM_BREAKER_COOLDOWN_S", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def _response_text(resp) -> str:
+    try:
+        return getattr(resp, "text", "") or ""
+    except ValueError:  # blocked/empty candidate
+        return ""
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.failures = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.trips = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._consecutive >= self.failures:
+                if self._state != OPEN:
+                    self.trips += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """A call ended without a verdict (e.g. an abandoned stream)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+
+class LLMGateway:
+    """Shared client + single-flight + timeout + circuit breaker around one model."""
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        enabled: bool = True,
+        name: str = "",
+        timeout_s: float = CALL_TIMEOUT_S,
+        max_workers: int = MAX_WORKERS,
+        breaker: Optional[CircuitBreaker] = None,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.timeout_s = timeout_s
+        self._factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="llm")
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.breaker = breaker or CircuitBreaker()
+        self.scheduler = scheduler
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "short_circuited": 0, "timeouts": 0, "errors": 0, "streams": 0}
+
+    # -- internals -------------------------------------------------------------
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def _bump(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _prompt_key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.name}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+    def _call(self, prompt: str, timeout_s: float) -> str:
+        resp = self.client().generate_content(prompt, request_options={"timeout": timeout_s})
+        return _response_text(resp)
+
+    # -- public ----------------------------------------------------------------
+    def generate(
+        self, prompt: str, timeout_s: Optional[float] = None, user: str = "guest", priority: str = INTERACTIVE
+    ) -> Optional[str]:
+        """
+        Model text for `prompt`, or None when disabled, short-circuited, timed out
+        or failed (the caller falls back to its extractive answer). Raises
+        SchedulerBusy when no scheduler slot is available.
+        """
+        if not self.enabled:
+            return None
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        key = self._prompt_key(prompt)
+
+        with self._inflight_lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                if not self.breaker.allow():
+                    self._bump("short_circuited")
+                    return None
+                # Registered before queueing, so identical prompts coalesce while waiting too
+                fut = Future()
+                self._inflight[key] = fut
+                fut.add_done_callback(lambda f, k=key: self._finish(k, f))
+        self._bump("calls" if leader else "coalesced")
+
+        if leader:
+            try:
+                started = self.scheduler.acquire(user, priority) if self.scheduler else None
+            except SchedulerBusy as e:
+                fut.no_verdict = True  # type: ignore[attr-defined]
+                fut.set_exception(e)
+                raise
+            work = self._executor.submit(self._call, prompt, timeout_s)
+            work.add_done_callback(lambda w: self._settle(fut, w, started))
+            wait_s = timeout_s
+        else:
+            # Followers may also be waiting out the leader's queue time
+            wait_s = timeout_s + (self.scheduler.queue_timeout_s if self.scheduler else 0.0)
+
+        try:
+            return fut.result(timeout=wait_s)
+        except FutureTimeout:
+            self._bump("timeouts")
+            if leader:
+                # Slow counts as failing, even if the call completes later
+                fut.timed_out = True  # type: ignore[attr-defined]
+                self.breaker.record_failure()
+            return None
+        except SchedulerBusy:
+            raise
+        except Exception as e:
+            if leader:
+                print("⚠️ Gemini call failed:", e)
+            return None
+
+    def _settle(self, fut: Future, work: Future, started: Optional[float]) -> None:
+        if started is not None:
+            self.scheduler.release(started)
+        if work.exception() is not None:
+            fut.set_exception(work.exception())
+        else:
+            fut.set_result(work.result())
+
+    def _finish(self, key: str, fut: Future) -> None:
+        with self._inflight_lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+        if getattr(fut, "no_verdict", False):
+            self.breaker.release()
+            return
+        if fut.exception() is not None:
+            self._bump("errors")
+        if getattr(fut, "timed_out", False):
+            return  # already recorded as a failure when the caller gave up
+        if fut.exception() is not None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stream(
+        self, prompt: str, timeout_s: Optional[float] = None, user: str = "guest", priority: str = INTERACTIVE,
+        outcome: Optional[Dict] = None,
+    ) -> Optional[Iterator[str]]:
+        """
+        Token stream for `prompt`, or None when disabled. Streams are not
+        coalesced (each listener needs its own tokens) but share the client,
+        breaker and scheduler; a mid-stream error just ends the stream.
+        Admission is checked here (SchedulerBusy -> 429 before any bytes go out);
+        the breaker and the scheduler slot are only taken when iteration starts,
+        so a stream that is never iterated holds neither. A short-circuited
+        stream yields nothing. `outcome["ok"]` is set once the model finished
+        the stream without error.
+        """
+        if not self.enabled:
+            return None
+        if self.scheduler:
+            self.scheduler.check_admission(user, priority)
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+
+        def _gen() -> Iterator[str]:
+            if not self.breaker.allow():
+                self._bump("short_circuited")
+                return
+            self._bump("streams")
+            verdict = False
+            started = None
+            try:
+                if self.scheduler:
+                    started = self.scheduler.acquire(user, priority)
+                resp = self.client().generate_content(
+                    prompt, stream=True, request_options={"timeout": timeout_s}
+                )
+                for chunk in resp:
+                    piece = _response_text(chunk)
+                    if piece:
+                        yield piece
+                self.breaker.record_success()
+                verdict = True
+                if outcome is not None:
+                    outcome["ok"] = True
+            except SchedulerBusy:
+                raise
+            except Exception as e:
+                print("⚠️ Gemini stream failed:", e)
+                self._bump("errors")
+                self.breaker.record_failure()
+                verdict = True
+            finally:
+                if started is not None:
+                    self.scheduler.release(started)
+                if not verdict:  # client went away mid-stream, or no slot
+                    self.breaker.release()
+
+        return _gen()
+
+    def snapshot(self) -> Dict:
+        with self._stats_lock:
+            out = dict(self.stats)
+        with self._inflight_lock:
+            out["in_flight"] = len(self._inflight)
+        out.update({
+            "enabled": self.enabled,
+            "model": self.name,
+            "timeout_s": self.timeout_s,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+        })
+        if self.scheduler:
+            out["scheduler"] = self.scheduler.snapshot()
+        return out
@@ -0,0 +1,195 @@
+# llm_scheduler.py
+# Fair-share admission control in front of every Gemini call (askai + ocr).
+#
+# - At most MAX_CONCURRENT calls run at once, process-wide.
+# - Waiting calls queue per priority class ("interactive" before "batch") and,
+#   within a class, per user; users are served round-robin so one user's burst
+#   can't starve the rest. Every BATCH_EVERY-th grant goes to batch work when
+#   some is waiting, so batch jobs still make progress under interactive load.
+# - Backpressure: when the queue (or a user's share of it) is full, or a call
+#   waits longer than QUEUE_TIMEOUT_S, SchedulerBusy is raised carrying a
+#   Retry-After estimate; routes turn it into HTTP 429.
+
+from __future__ import annotations
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+
+MAX_CONCURRENT = int(os.getenv("ASKAI_LLM_MAX_CONCURRENT", "4"))
+MAX_QUEUE = int(os.getenv("ASKAI_LLM_MAX_QUEUE", "64"))
+MAX_PER_USER = int(os.getenv("ASKAI_LLM_MAX_PER_USER", "8"))
+QUEUE_TIMEOUT_S = float(os.getenv("ASKAI_LLM_QUEUE_TIMEOUT_S", "30"))
+BATCH_EVERY = int(os.getenv("ASKAI_LLM_BATCH_EVERY", "4"))
+
+INTERACTIVE, BATCH = "interactive", "batch"
+# Recent waits kept for the percentile stats
+WAIT_SAMPLES = 1000
+
+
+class SchedulerBusy(Exception):
+    """No capacity for this call; retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("user", "priority", "event", "granted", "enqueued_at")
+
+    def __init__(self, user: str, priority: str):
+        self.user = user
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+def _percentile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT,
+        max_queue: int = MAX_QUEUE,
+        max_per_user: int = MAX_PER_USER,
+        queue_timeout_s: float = QUEUE_TIMEOUT_S,
+        batch_every: int = BATCH_EVERY,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_per_user = max(1, max_per_user)
+        self.queue_timeout_s = queue_timeout_s
+        self.batch_every = max(1, batch_every)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._grants = 0
+        # priority -> user -> FIFO of waiters; dict order is the round-robin order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {
+            INTERACTIVE: OrderedDict(),
+            BATCH: OrderedDict(),
+        }
+        self._waits_ms: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._service_s = 5.0  # EWMA of call duration, seeds Retry-After
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_user": 0, "timeouts": 0}
+
+    # -- admission -------------------------------------------------------------
+    def _user_depth(self, user: str) -> int:
+        return sum(len(q.get(user, ())) for q in self._queues.values())
+
+    def _retry_after(self) -> int:
+        backlog = (self._queued + 1) / self.max_concurrent
+        return max(1, math.ceil(self._service_s * backlog))
+
+    def _check_locked(self, user: str) -> None:
+        if self._queued >= self.max_queue:
+            self.stats["rejected_full"] += 1
+            raise SchedulerBusy("Gemini queue is full; try again shortly.", self._retry_after())
+        if self._user_depth(user) >= self.max_per_user:
+            self.stats["rejected_user"] += 1
+            raise SchedulerBusy("Too many of your requests are already waiting.", self._retry_after())
+
+    def check_admission(self, user: str, priority: str = INTERACTIVE) -> None:
+        """Raise SchedulerBusy now if a call would be rejected (no reservation is made)."""
+        with self._lock:
+            if self._running < self.max_concurrent and not self._queued:
+                return
+            self._check_locked(user or "guest")
+
+    def acquire(self, user: str, priority: str = INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """Block until this call may run. Returns the start time to pass to release()."""
+        user = user or "guest"
+        priority = BATCH if priority == BATCH else INTERACTIVE
+        with self._lock:
+            if self._running < self.max_concurrent and not self._queued:
+                self._running += 1
+                self.stats["admitted"] += 1
+                self._waits_ms.append(0.0)
+                return time.monotonic()
+            self._check_locked(user)
+            w = _Waiter(user, priority)
+            self._queues[priority].setdefault(user, deque()).append(w)
+            self._queued += 1
+
+        timeout = self.queue_timeout_s if timeout is None else timeout
+        if not w.event.wait(timeout):
+            with self._lock:
+                if not w.granted:
+                    q = self._queues[priority]
+                    dq = q.get(user)
+                    if dq is not None and w in dq:
+                        dq.remove(w)
+                        if not dq:
+                            del q[user]
+                        self._queued -= 1
+                    self.stats["timeouts"] += 1
+                    raise SchedulerBusy("Timed out waiting for a Gemini slot.", self._retry_after())
+        started = time.monotonic()
+        with self._lock:
+            self.stats["admitted"] += 1
+            self._waits_ms.append((started - w.enqueued_at) * 1000.0)
+        return started
+
+    def release(self, started: float) -> None:
+        with self._lock:
+            self._running -= 1
+            self._service_s = 0.8 * self._service_s + 0.2 * (time.monotonic() - started)
+            self._dispatch_locked()
+
+    def _dispatch_locked(self) -> None:
+        while self._running < self.max_concurrent and self._queued:
+            inter, batch = self._queues[INTERACTIVE], self._queues[BATCH]
+            take_batch = bool(batch) and (not inter or self._grants % self.batch_every == self.batch_every - 1)
+            q = batch if take_batch else inter
+            user, dq = next(iter(q.items()))
+            w = dq.popleft()
+            # Round-robin: this user goes to the back of the line
+            del q[user]
+            if dq:
+                q[user] = dq
+            w.granted = True
+            self._running += 1
+            self._queued -= 1
+            self._grants += 1
+            w.event.set()
+
+    @contextmanager
+    def slot(self, user: str, priority: str = INTERACTIVE, timeout: Optional[float] = None) -> Iterator[None]:
+        started = self.acquire(user, priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            out = dict(self.stats)
+            out.update({
+                "running": self._running,
+                "queued": self._queued,
+                "queued_by_priority": {p: sum(len(d) for d in q.values()) for p, q in self._queues.items()},
+                "users_waiting": len({u for q in self._queues.values() for u in q}),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "avg_service_ms": round(self._service_s * 1000.0, 1),
+            })
+        out["wait_ms"] = {
+            "p50": round(_percentile(waits, 0.50), 1),
+            "p95": round(_percentile(waits, 0.95), 1),
+            "max": round(waits[-1], 1) if waits else 0.0,
+        }
+        return out
+
+
+# One scheduler per process, shared by askai and ocr
+scheduler = LLMScheduler()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Build the AskAI sentence index (askai_sentences + askai_sentences_fts) for existing chunk DBs,
+so /api/quick_view and /api/single_file_answer become indexed per-file lookups.
+
+Usage (from pythonApp/):
+    python non-app/backfill_sentences.py                 # every DB listed by /api/list-dbs
+    python non-app/backfill_sentences.py hr.db safety.db # specific DBs in uploads/
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import askai  # noqa: E402
+
+
+def main(names):
+    names = names or askai._list_user_dbs()
+    for name in names:
+        try:
+            path = askai._safe_db_path(name)
+            res = askai.backfill_sentences(path)
+            print(f"✅ {name}: {res['sentences']} sentences in {res['seconds']}s")
+        except Exception as e:
+            print(f"⚠️ {name}: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
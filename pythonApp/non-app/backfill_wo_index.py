@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Add the AskAI integer WO column + askai_wo_idx to existing chunk DBs, so WO-range
+filters in /api/question and /api/rank_only run in SQL instead of over every
+candidate in Python.
+DBs built by /api/build-chunks already have it.
+
+Usage (from pythonApp/):
+    python non-app/backfill_wo_index.py                 # every DB listed by /api/list-dbs
+    python non-app/backfill_wo_index.py hr.db safety.db # specific DBs in uploads/
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import askai  # noqa: E402
+
+
+def main(names):
+    names = names or askai._list_user_dbs()
+    for name in names:
+        try:
+            path = askai._safe_db_path(name)
+            res = askai.backfill_wo_index(path)
+            print(f"✅ {name}: {res['table']}.{res['column']} indexed in {res['seconds']}s")
+        except Exception as e:
+            print(f"⚠️ {name}: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
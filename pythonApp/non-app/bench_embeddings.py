@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Compare the embedding backends (embedder.py) on CPU: cold start, per-query
+latency, batch throughput, memory, and how close each backend's vectors are to
+the torch baseline.
+
+Each backend runs in a fresh subprocess, so start-up time and RSS are what a
+new worker would see:
+  import_s        importing helpers (should be near zero now that the model is lazy)
+  load_s          building the model on first use (includes a one-time ONNX export
+                  if the files are not in ASKAI_ONNX_DIR yet; run twice for steady state)
+  first_query_ms  first embed after load
+  query_p50/p95   single-text embeds of short queries
+  batch_texts_per_s  throughput at --batch texts per forward pass
+  rss_mb          resident memory after the run
+  vs_torch        cosine (min/mean) and max abs diff against the torch vectors
+
+Usage (from pythonApp/):
+    python non-app/bench_embeddings.py
+    python non-app/bench_embeddings.py --backends torch,onnx-int8 --queries 200 --out emb.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, HERE)
+
+QUERIES = [
+    "How much paid time off do employees get?",
+    "groundwater level at boring B-3",
+    "compaction test results for the foundation slab",
+    "bereavement leave policy",
+    "WO 8292-05 retaining wall recommendations",
+    "allowable bearing capacity of basalt",
+    "who signs off on the field report",
+    "sick leave carry over",
+]
+PASSAGE = (
+    "The subsurface exploration consisted of four borings drilled to depths of 20 to 35 feet. "
+    "Groundwater was not encountered. Fill soils should be compacted to at least 95 percent of the "
+    "maximum dry density. Employees accrue paid time off each pay period and may carry over up to "
+    "forty hours into the next calendar year. "
+)
+
+
+def _rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        return None
+
+
+def child(backend, n_queries, batch, vectors_path):
+    """Runs inside the subprocess: time everything for one backend, save its vectors."""
+    os.environ["ASKAI_EMBED_BACKEND"] = backend
+    t0 = time.perf_counter()
+    import helpers  # noqa: F401  (what every worker imports)
+    import embedder
+    import_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    embedder.get_embedder()
+    load_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    embedder.embed(QUERIES[0])
+    first_ms = (time.perf_counter() - t0) * 1000.0
+
+    lat = []
+    for i in range(n_queries):
+        t0 = time.perf_counter()
+        embedder.embed(QUERIES[i % len(QUERIES)])
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    lat.sort()
+
+    passages = [PASSAGE * (1 + i % 3) for i in range(batch)]
+    t0 = time.perf_counter()
+    rounds = 3
+    for _ in range(rounds):
+        embedder.embed_many(passages)
+    batch_s = time.perf_counter() - t0
+
+    np.save(vectors_path, embedder.embed_many(QUERIES + passages[:4]))
+    return {
+        "backend": backend,
+        "import_s": round(import_s, 3),
+        "load_s": round(load_s, 2),
+        "first_query_ms": round(first_ms, 1),
+        "query_p50_ms": round(lat[len(lat) // 2], 2),
+        "query_p95_ms": round(lat[min(len(lat) - 1, int(0.95 * len(lat)))], 2),
+        "batch_texts_per_s": round(rounds * batch / batch_s, 1),
+        "rss_mb": _rss_mb(),
+    }
+
+
+def _compare(ref, other):
+    ref = np.asarray(ref, dtype=np.float32)
+    other = np.asarray(other, dtype=np.float32)
+    cos = (ref * other).sum(axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(other, axis=1))
+    return {
+        "cosine_min": round(float(cos.min()), 5),
+        "cosine_mean": round(float(cos.mean()), 5),
+        "max_abs_diff": round(float(np.abs(ref - other).max()), 5),
+    }
+
+
+def main(argv=None):
+    import embedder
+
+    ap = argparse.ArgumentParser(description="Benchmark AskAI embedding backends on CPU.")
+    ap.add_argument("--backends", default=",".join(embedder.BACKENDS))
+    ap.add_argument("--queries", type=int, default=100, help="single-text embeds to time")
+    ap.add_argument("--batch", type=int, default=32, help="texts per forward pass for throughput")
+    ap.add_argument("--out", help="write JSON here as well as stdout")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child, args.queries, args.batch, args.vectors)))
+        return
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = set(backends) - set(embedder.BACKENDS)
+    if unknown:
+        ap.error(f"unknown backend(s): {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {
+            "model": embedder.MODEL_NAME,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": [],
+    }
+    vectors = {}
+    with tempfile.TemporaryDirectory(prefix="askai-emb-") as tmp:
+        for backend in backends:
+            vec_path = os.path.join(tmp, f"{backend}.npy")
+            print(f"⏱️ {backend}…", file=sys.stderr)
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", backend, "--vectors", vec_path,
+                 "--queries", str(args.queries), "--batch", str(args.batch)],
+                cwd=HERE, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                report["results"].append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+            report["results"].append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(vec_path)
+
+    if "torch" in vectors:
+        for row in report["results"]:
+            if row["backend"] in vectors and row["backend"] != "torch":
+                row["vs_torch"] = _compare(vectors["torch"], vectors[row["backend"]])
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+AskAI retrieval benchmark: generate synthetic chunk DBs, replay a query mix
+against search_rows / group_by_file / quick_view, and print (or save) JSON
+so runs can be compared over time.
+
+DB variants (all with the same synthetic corpus):
+  canonical   exact _create_chunk_db schema (chunks + external-content chunks_fts,
+              askai_wo_idx, sentence index)
+  legacy_fts  standalone FTS5 table carrying file/wo/content (no base table)
+  like        plain table without FTS, so search_rows takes the LIKE path
+
+Per (variant, size, op, query kind): p50/p95/p99/mean latency in ms, rows
+returned, and "vm_ops" — SQLite VM instructions executed (sampled every
+PROGRESS_OPS ops through the progress handler), a proxy for rows scanned that
+stays comparable across machines (null for quick_view, which runs on the
+pool). Peak RSS of the process is reported once.
+
+Usage (from pythonApp/):
+    python non-app/bench_retrieval.py                          # 10k chunks, all variants
+    python non-app/bench_retrieval.py --sizes 10k,100k,1m --repeat 5 --out bench.json
+    python non-app/bench_retrieval.py --variants canonical --keep /tmp/askai-bench
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import askai  # noqa: E402
+
+PROGRESS_OPS = 1000
+VARIANTS = ("canonical", "legacy_fts", "like")
+
+VOCAB = (
+    "boring drilling soil sample concrete foundation slab settlement groundwater "
+    "compaction density moisture laboratory field report geotechnical bearing capacity "
+    "retaining wall pile footing excavation backfill clay silt sand gravel basalt "
+    "employee policy pto vacation leave holiday sick bereavement payroll overtime "
+    "safety helmet inspection permit contractor schedule invoice proposal"
+).split()
+FILLER = "the of and to in for on with at by from is was are be this that as an or".split()
+
+QUERY_MIX = {
+    "keyword": ["concrete", "groundwater", "basalt", "pile footing", "compaction density"],
+    "wo_number": ["8292", "8292-05", "8015-02B", "8400"],
+    "hr_synonyms": [
+        "How much paid time off do employees get?",
+        "What is the bereavement leave policy for a death in family?",
+        "Which company holidays are observed?",
+        "How many sick days for medical leave?",
+    ],
+}
+# WO-range queries exercise the range pushdown
+WO_RANGES = [(8000, 8100), (8250, 8300)]
+
+
+def _parse_size(text):
+    text = text.strip().lower()
+    mult = 1
+    if text.endswith("k"):
+        mult, text = 1000, text[:-1]
+    elif text.endswith("m"):
+        mult, text = 1000000, text[:-1]
+    return int(float(text) * mult)
+
+
+def _records(n, seed=7):
+    """Deterministic synthetic chunks: ~20 chunks per file, Zipf-ish vocabulary."""
+    rnd = random.Random(seed)
+    weights = [1.0 / (i + 1) for i in range(len(VOCAB))]
+    for i in range(n):
+        wo = 8000 + (i // 20) % 2000
+        words = []
+        for _ in range(rnd.randint(60, 140)):
+            words.append(rnd.choices(VOCAB, weights)[0] if rnd.random() < 0.45 else rnd.choice(FILLER))
+        if rnd.random() < 0.1:
+            words.insert(rnd.randrange(len(words)), f"WO {wo}-0{i % 5}")
+        yield {
+            "file": f"{wo}-0{(i // 20) % 5} Report.pdf",
+            "page": i % 20,
+            "wo": f"{wo}-0{(i // 20) % 5}",
+            "content": " ".join(words).capitalize() + ".",
+        }
+
+
+def build_db(variant, path, n):
+    if os.path.exists(path):
+        os.remove(path)
+    t0 = time.perf_counter()
+    if variant == "canonical":
+        askai._create_chunk_db(path, _records(n))
+    else:
+        conn = sqlite3.connect(path)
+        if variant == "legacy_fts":
+            conn.execute("CREATE VIRTUAL TABLE docs_fts USING fts5(file, wo, content)")
+            sql = "INSERT INTO docs_fts(file, wo, content) VALUES (?,?,?)"
+        else:
+            conn.execute("CREATE TABLE pages (filename TEXT, work_order TEXT, text TEXT)")
+            sql = "INSERT INTO pages(filename, work_order, text) VALUES (?,?,?)"
+        batch = []
+        for r in _records(n):
+            batch.append((r["file"], r["wo"], r["content"]))
+            if len(batch) >= 5000:
+                conn.executemany(sql, batch)
+                batch = []
+        conn.executemany(sql, batch)
+        conn.commit()
+        conn.close()
+    return round(time.perf_counter() - t0, 2)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def _stats(samples):
+    ms = sorted(s["ms"] for s in samples)
+
+    def pct(q):
+        return round(ms[min(len(ms) - 1, int(q * len(ms)))], 3)
+
+    return {
+        "n": len(ms),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "rows_avg": round(statistics.fmean(s["rows"] for s in samples), 1),
+        "vm_ops_avg": (round(statistics.fmean(s["vm_ops"] for s in samples))
+                       if samples[0]["vm_ops"] is not None else None),
+    }
+
+
+def run_queries(db_path, repeat, top_k):
+    conn = askai._connect_ro(db_path)
+    ops = [0]
+
+    def _tick():
+        ops[0] += PROGRESS_OPS
+        return 0
+
+    conn.set_progress_handler(_tick, PROGRESS_OPS)
+    # First touch probes the schema (and may add the WO index); keep it out of the numbers
+    with contextlib.redirect_stdout(io.StringIO()):
+        askai.search_rows(conn, "warmup", 0, 99999999, top_k=top_k)
+        files = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT {askai._schema_profile(conn).file_expr} "
+            f"FROM {askai._schema_profile(conn).row_table} LIMIT 50"
+        )]
+
+    results = {}
+    rnd = random.Random(11)
+
+    def record(op, kind, fn, counted=True):
+        ops[0] = 0
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            out = fn()
+        ms = (time.perf_counter() - t0) * 1000.0
+        results.setdefault((op, kind), []).append(
+            {"ms": ms, "rows": len(out), "vm_ops": ops[0] if counted else None}
+        )
+        return out
+
+    for _ in range(repeat):
+        for kind, queries in QUERY_MIX.items():
+            for q in queries:
+                rows = record("search_rows", kind, lambda: askai.search_rows(conn, q, 0, 99999999, top_k=top_k))
+                record("group_by_file", kind, lambda: askai.group_by_file(rows))
+                if files:
+                    f = rnd.choice(files)
+                    # Runs on a pooled connection, outside the progress handler
+                    record("quick_view", kind, lambda: askai._file_snippets(db_path, f, q, max_len=360), counted=False)
+        for lo, hi in WO_RANGES:
+            for q in QUERY_MIX["keyword"]:
+                record("search_rows", "wo_range", lambda: askai.search_rows(conn, q, lo, hi, top_k=top_k))
+    conn.close()
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark AskAI retrieval on synthetic chunk DBs.")
+    ap.add_argument("--sizes", default="10k", help="comma list, e.g. 10k,100k,1m")
+    ap.add_argument("--variants", default=",".join(VARIANTS), help=f"comma list of {', '.join(VARIANTS)}")
+    ap.add_argument("--repeat", type=int, default=3, help="passes over the query mix")
+    ap.add_argument("--top-k", type=int, default=120, help="search_rows top_k (as /question uses)")
+    ap.add_argument("--keep", help="directory to build (and keep) the DBs in; reused when present")
+    ap.add_argument("--out", help="write JSON here as well as stdout")
+    args = ap.parse_args(argv)
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        ap.error(f"unknown variant(s): {', '.join(sorted(unknown))}")
+    sizes = [_parse_size(s) for s in args.sizes.split(",") if s.strip()]
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="askai-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    report = {
+        "meta": {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "top_k": args.top_k,
+            "fts_tokenize": askai.FTS_TOKENIZE,
+        },
+        "builds": [],
+        "results": [],
+    }
+    try:
+        for size in sizes:
+            for variant in variants:
+                path = os.path.join(work_dir, f"bench_{variant}_{size}.db")
+                built = None
+                if not (args.keep and os.path.exists(path)):
+                    built = build_db(variant, path, size)
+                report["builds"].append({
+                    "variant": variant, "size": size, "build_seconds": built,
+                    "db_mb": round(os.path.getsize(path) / (1024 * 1024), 1),
+                })
+                print(f"⏱️ {variant} @ {size}: querying…", file=sys.stderr)
+                for (op, kind), samples in run_queries(path, args.repeat, args.top_k).items():
+                    report["results"].append({"variant": variant, "size": size, "op": op, "queries": kind,
+                                              **_stats(samples)})
+                askai._POOL.evict(path)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report["peak_rss_mb"] = _peak_rss_mb()
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
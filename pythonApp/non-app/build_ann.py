@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Build (or rebuild) the FAISS HNSW index next to chunk DBs that carry embedding
+blobs (chunks.embedding, as read by helpers.rank_documents), and optionally
+report recall vs latency against the exact matmul path.
+
+The report replays queries made from stored vectors plus noise and compares
+the ANN top-k to the exact top-k for each efSearch: recall@k and p50/p95 ms,
+unfiltered and with a WO range that keeps about a quarter of the rows.
+
+Usage (from pythonApp/):
+    python non-app/build_ann.py uploads/reports_chunks.db
+    python non-app/build_ann.py uploads/reports_chunks.db --report --ef 16,32,64,128
+    python non-app/build_ann.py --synthetic 300k --dim 384 --report --out ann.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import ann_index  # noqa: E402
+import vector_store  # noqa: E402
+
+
+def _parse_size(text):
+    text = text.strip().lower()
+    mult = 1
+    if text.endswith("k"):
+        mult, text = 1000, text[:-1]
+    elif text.endswith("m"):
+        mult, text = 1000000, text[:-1]
+    return int(float(text) * mult)
+
+
+def make_synthetic(path, n, dim, seed=7):
+    """Clustered random embeddings in a helpers-style chunks table; WOs 8000-9999 by file."""
+    rnd = np.random.default_rng(seed)
+    centers = rnd.standard_normal((max(16, n // 500), dim)).astype(np.float32)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE chunks (file TEXT, chunk INTEGER, text TEXT, embedding BLOB)")
+    for start in range(0, n, 20000):
+        m = min(20000, n - start)
+        vecs = centers[rnd.integers(0, len(centers), m)] + 0.6 * rnd.standard_normal((m, dim)).astype(np.float32)
+        conn.executemany(
+            "INSERT INTO chunks VALUES (?,?,?,?)",
+            [(f"{8000 + (start + i) // 20 % 2000}-01 Report.pdf", (start + i) % 20, f"chunk {start + i}",
+              vecs[i].astype(np.float32).tobytes()) for i in range(m)],
+        )
+    conn.commit()
+    conn.close()
+
+
+def _pct(ms, q):
+    ms = sorted(ms)
+    return round(ms[min(len(ms) - 1, int(q * len(ms)))], 3)
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+def report(db_path, store, ann, n_queries, k, efs, seed=11):
+    rnd = np.random.default_rng(seed)
+    picks = rnd.integers(0, len(store), n_queries)
+    queries = np.asarray(store.matrix[picks], dtype=np.float32)
+    queries += 0.05 * rnd.standard_normal(queries.shape).astype(np.float32)
+
+    wo = np.asarray(store.wo) if store.wo is not None else None
+    cases = [("all", None, None)]
+    if wo is not None and (wo >= 0).any():
+        known = np.sort(wo[wo >= 0])
+        lo, hi = int(known[len(known) * 3 // 8]), int(known[len(known) * 5 // 8])
+        mask = store.wo_mask(lo, hi)
+        cases.append((f"wo {lo}-{hi} ({np.count_nonzero(mask) / len(store):.0%} rows)", mask, lo))
+
+    out = []
+    for name, mask, _ in cases:
+        allowed_ids = None if mask is None else np.asarray(store.ids)[mask]
+        exact, exact_ms = [], []
+        for q in queries:
+            hits, ms = _timed(lambda: store.search(q, k, allowed=mask))
+            exact.append({rid for rid, _ in hits})
+            exact_ms.append(ms)
+        row = {"case": name, "exact": {"p50_ms": _pct(exact_ms, 0.5), "p95_ms": _pct(exact_ms, 0.95)}, "ann": []}
+        for ef in efs:
+            recalls, ann_ms = [], []
+            for q, truth in zip(queries, exact):
+                hits, ms = _timed(lambda: ann.search(q, k, allowed_ids=allowed_ids, ef_search=ef))
+                recalls.append(len(truth & {rid for rid, _ in hits}) / max(1, len(truth)))
+                ann_ms.append(ms)
+            row["ann"].append({
+                "ef_search": ef,
+                f"recall@{k}": round(statistics.fmean(recalls), 4),
+                "p50_ms": _pct(ann_ms, 0.5),
+                "p95_ms": _pct(ann_ms, 0.95),
+            })
+        out.append(row)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build the HNSW index for chunk DBs with embedding blobs.")
+    ap.add_argument("dbs", nargs="*", help="DB paths")
+    ap.add_argument("--synthetic", help="build a throwaway DB of this many rows (e.g. 300k) and use it")
+    ap.add_argument("--dim", type=int, default=768, help="embedding size for --synthetic")
+    ap.add_argument("--m", type=int, default=ann_index.HNSW_M, help="HNSW M (graph degree)")
+    ap.add_argument("--ef-construction", type=int, default=ann_index.EF_CONSTRUCTION)
+    ap.add_argument("--report", action="store_true", help="measure recall/latency against exact search")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--ef", default="16,32,64,128,256", help="efSearch values for the report")
+    ap.add_argument("--out", help="write the JSON report here as well as stdout")
+    args = ap.parse_args(argv)
+
+    if not ann_index.available():
+        ap.error("faiss is not installed (pip install faiss-cpu)")
+    if not args.dbs and not args.synthetic:
+        ap.error("give DB paths or --synthetic N")
+
+    tmp_dir = None
+    paths = list(args.dbs)
+    if args.synthetic:
+        tmp_dir = tempfile.mkdtemp(prefix="askai-ann-")
+        path = os.path.join(tmp_dir, "synthetic.db")
+        print(f"⏱️ generating {args.synthetic} x {args.dim} synthetic embeddings…", file=sys.stderr)
+        make_synthetic(path, _parse_size(args.synthetic), args.dim)
+        paths.append(path)
+
+    results = []
+    try:
+        for path in paths:
+            store = vector_store.blob_store(path)
+            if store is None or len(store) == 0:
+                print(f"⚠️ {path}: no embeddings; skipped", file=sys.stderr)
+                continue
+            meta = ann_index.build(path, store, m=args.m, ef_construction=args.ef_construction)
+            print(f"✅ {os.path.basename(path)}: {meta['count']} vectors in {meta['build_seconds']}s",
+                  file=sys.stderr)
+            entry = {"db": path, "rows": len(store), "dim": meta["dim"], "m": meta["m"],
+                     "ef_construction": meta["ef_construction"], "build_seconds": meta["build_seconds"],
+                     "index_mb": round(os.path.getsize(ann_index.index_paths(path)[0]) / (1024 * 1024), 1)}
+            if args.report:
+                efs = [int(x) for x in args.ef.split(",") if x.strip()]
+                entry["report"] = report(path, store, ann_index.load(path), args.queries, args.k, efs)
+            results.append(entry)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
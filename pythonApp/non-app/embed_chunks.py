@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+(Re)compute chunks.embedding for chunk DBs with embed_pipeline: batched,
+across a pool of worker processes, written back in batched transactions.
+A run that is interrupted resumes after the last committed row. When it
+finishes, the embedding store (and the ANN index, if the DB uses one) is
+rebuilt.
+
+The model and backend come from ASKAI_EMBED_MODEL / ASKAI_EMBED_BACKEND, as
+for the server. Changing the model or --dtype starts over from the first row.
+
+Usage (from pythonApp/):
+    python non-app/embed_chunks.py uploads/reports_chunks.db
+    python non-app/embed_chunks.py uploads/*.db --workers 6 --threads 2 --dtype float16
+    python non-app/embed_chunks.py uploads/hr.db --restart --out embed.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import embed_pipeline  # noqa: E402
+
+
+def _progress(p):
+    print(f"⏱️ {p['done']}/{p['rows']} chunks, {p['chunks_per_s']}/s (rowid {p['last_rowid']})",
+          file=sys.stderr)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Embed every chunk of chunk DBs into chunks.embedding.")
+    ap.add_argument("dbs", nargs="+", help="DB paths")
+    ap.add_argument("--workers", type=int, default=embed_pipeline.WORKERS,
+                    help="worker processes (0 = embed in this process)")
+    ap.add_argument("--threads", type=int, default=embed_pipeline.THREADS, help="torch/onnx threads per worker")
+    ap.add_argument("--batch-size", type=int, default=embed_pipeline.BATCH_SIZE, help="texts per forward pass")
+    ap.add_argument("--dtype", choices=("float32", "float16"), default="float32", help="blob dtype")
+    ap.add_argument("--restart", action="store_true", help="ignore saved progress and embed every row")
+    ap.add_argument("--no-index", action="store_true", help="skip rebuilding the embedding store / ANN index")
+    ap.add_argument("--out", help="write the JSON results here as well as stdout")
+    args = ap.parse_args(argv)
+
+    results = []
+    for path in args.dbs:
+        print(f"🧮 {os.path.basename(path)}…", file=sys.stderr)
+        try:
+            results.append({"db": path, **embed_pipeline.embed_chunks(
+                path, dtype=args.dtype, workers=args.workers, threads=max(1, args.threads),
+                batch_size=max(1, args.batch_size), restart=args.restart,
+                rebuild_index=not args.no_index, progress=_progress,
+            )})
+        except (ValueError, RuntimeError, OSError) as e:
+            print(f"⚠️ {path}: {e}", file=sys.stderr)
+            results.append({"db": path, "error": str(e)})
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            fh.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,22 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 from PIL import Image
 
+from llm_scheduler import SchedulerBusy, scheduler
+
 # Load Gemini API Key from .env
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 vision_model = genai.GenerativeModel("gemini-2.5-pro")
 
-def extract_work_orders_from_image(image_path_or_file):
+def extract_work_orders_from_image(image_path_or_file, user="guest"):
     """
     Extracts work order numbers from an image using Gemini.
 
     Parameters:
     - image_path_or_file: str or FileStorage object (from Flask)
+    - user: whose fair-share queue the Gemini call waits in
+
+    Raises SchedulerBusy when the shared Gemini scheduler is full.
 
     Returns:
     - str: Bullet list of extracted work orders or error message
@@ -51,13 +56,16 @@ def extract_work_orders_from_image(image_path_or_file):
             else Image.open(image_path_or_file.stream)
         )
 
-        response = vision_model.generate_content(
-            [prompt, image],
-            generation_config={"temperature": 0.2}
-        )
+        with scheduler.slot(user):
+            response = vision_model.generate_content(
+                [prompt, image],
+                generation_config={"temperature": 0.2}
+            )
 
         return response.text.strip()
 
+    except SchedulerBusy:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,88 @@
+# retrieval_cache.py
+# In-process LRU of ranked retrieval results, so /rank_only followed by
+# /question (or a repeated /question) for the same query skips the FTS query
+# and Python scoring.
+#
+# Keys are built by the caller and must include everything that changes the
+# result (DB file identity + content version, normalized terms, WO range,
+# top_k, ...). Rows are copied on the way in and out, since callers mutate them.
+# Bounded by entry count and by an estimate of the bytes held.
+
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+MAX_BYTES = int(float(os.getenv("ASKAI_RETRIEVAL_CACHE_MB", "64")) * 1024 * 1024)
+MAX_ENTRIES = int(os.getenv("ASKAI_RETRIEVAL_CACHE_ENTRIES", "1024"))
+# Rough per-row bookkeeping cost on top of the string payloads
+ROW_OVERHEAD_BYTES = 200
+
+
+def _rows_size(rows: List[Dict]) -> int:
+    size = 0
+    for r in rows:
+        size += ROW_OVERHEAD_BYTES
+        for v in r.values():
+            if isinstance(v, str):
+                size += len(v)
+    return size
+
+
+class RetrievalCache:
+    def __init__(self, max_bytes: int = MAX_BYTES, max_entries: int = MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[int, List[Dict]]]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            rows = hit[1]
+        return [dict(r) for r in rows]
+
+    def put(self, key: Hashable, rows: List[Dict]) -> None:
+        if self.max_entries <= 0 or self.max_bytes <= 0:
+            return
+        rows = [dict(r) for r in rows]
+        size = _rows_size(rows)
+        if size > self.max_bytes:
+            return  # would evict everything else; not worth it
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0]
+            self._entries[key] = (size, rows)
+            self._bytes += size
+            self.stats["puts"] += 1
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            out = dict(self.stats)
+            out.update({
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+            })
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 3) if lookups else None
+        return out
@@ -0,0 +1,106 @@
+# term_matcher.py
+# Count many query terms (after synonym expansion) in one pass over the text.
+#
+# The terms are compiled once into a single case-insensitive regex. It is built
+# from a prefix trie, so "leave", "leave of absence" and "levels" share their
+# common "le" and each text position costs about the same whether there are 3
+# terms or 30. A match is the longest term starting at that position.
+#
+# Counts follow the old `sum(text.lower().count(t) for t in terms)` rule. When
+# a term is matched, the shorter terms inside it are credited as well ("medical
+# leave" also counts "leave"). The only difference from the old rule is for
+# terms that overlap across a match boundary: "ab" and "bc" in "abc" count once.
+
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+# Compiled matchers kept for reuse across calls with the same term set
+CACHE_SIZE = 256
+
+
+def _trie_pattern(terms: Sequence[str]) -> str:
+    trie: Dict = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = True  # end of a term
+
+    def _emit(node: Dict) -> str:
+        branches = []
+        ends_here = "" in node
+        for ch in sorted(k for k in node if k):
+            branches.append(re.escape(ch) + _emit(node[ch]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if ends_here:
+            # A term ends here; the greedy optional tries the longer terms first
+            return body + "?" if len(branches) == 1 and len(branches[0]) == 1 else "(?:" + body + ")?"
+        return body
+
+    return _emit(trie)
+
+
+class TermMatcher:
+    """Compiled matcher for one set of lowercase terms."""
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: Tuple[str, ...] = tuple(sorted({t.lower() for t in terms if t and t.strip()}))
+        pattern = _trie_pattern(self.terms) if self.terms else None
+        # Matching runs on lowercased text; the IGNORECASE twin is only for the
+        # rare text whose lowercase form has a different length (offsets would shift)
+        self._regex = re.compile(pattern) if pattern else None
+        self._regex_i = re.compile(pattern, re.IGNORECASE) if pattern else None
+        # term -> (shorter term, occurrences inside it) for the containment credit
+        self._inside: Dict[str, List[Tuple[str, int]]] = {
+            t: [(u, t.count(u)) for u in self.terms if u != t and u in t] for t in self.terms
+        }
+        self._weight: Dict[str, int] = {t: 1 + sum(n for _, n in inside) for t, inside in self._inside.items()}
+
+    def _found(self, text: str) -> List[str]:
+        if not text or self._regex is None:
+            return []
+        return self._regex.findall(text.lower())
+
+    def spans(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, term) of each match, left to right and without overlaps.
+        Offsets are into `text` as given, so they can be used to highlight it."""
+        if not text or self._regex is None:
+            return []
+        low = text.lower()
+        if len(low) == len(text):
+            return [(m.start(), m.end(), m.group(0)) for m in self._regex.finditer(low)]
+        out = []
+        for m in self._regex_i.finditer(text):
+            term = m.group(0).lower()
+            if term in self._weight:
+                out.append((m.start(), m.end(), term))
+        return out
+
+    def counts(self, text: str) -> Dict[str, int]:
+        """term -> occurrences (including the containment credit); unmatched terms are left out."""
+        out: Dict[str, int] = {}
+        for term in self._found(text):
+            out[term] = out.get(term, 0) + 1
+            for inner, n in self._inside[term]:
+                out[inner] = out.get(inner, 0) + n
+        return out
+
+    def count(self, text: str) -> int:
+        """Total hits over all terms: what `sum(text.lower().count(t) ...)` used to return."""
+        return sum(map(self._weight.__getitem__, self._found(text)))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile(terms: Tuple[str, ...]) -> TermMatcher:
+    return TermMatcher(terms)
+
+
+def term_matcher(terms: Union[Iterable[str], TermMatcher]) -> TermMatcher:
+    """Cached matcher for `terms`; a TermMatcher is passed through unchanged."""
+    if isinstance(terms, TermMatcher):
+        return terms
+    return _compile(tuple(sorted({t.lower() for t in terms if t and t.strip()})))
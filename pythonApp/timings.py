@@ -0,0 +1,146 @@
+# timings.py
+# Per-request stage timing for AskAI.
+#
+# A StageTimer lives in a ContextVar for the duration of a request; any code on
+# the request path wraps work in `with stage("name"):` (a no-op outside a
+# request). Repeated stages accumulate. Threads started for a request (e.g.
+# federated search) see the same timer when run through contextvars.copy_context,
+# so parallel stages add up their own durations.
+#
+# Finished requests feed per-endpoint, per-stage histograms (fixed ms buckets).
+
+from __future__ import annotations
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class StageTimer:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, ms: float) -> None:
+        with self._lock:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000.0
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            out = {k: round(v, 2) for k, v in self.stages.items()}
+        out["total"] = round(self.total_ms(), 2)
+        return out
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. 'retrieval;dur=12.3, total;dur=40.1'."""
+        return ", ".join(f"{k};dur={v}" for k, v in self.snapshot().items())
+
+
+_CURRENT: ContextVar[Optional[StageTimer]] = ContextVar("askai_stage_timer", default=None)
+
+
+def begin(name: str = "") -> StageTimer:
+    timer = StageTimer(name)
+    _CURRENT.set(timer)
+    return timer
+
+
+def current() -> Optional[StageTimer]:
+    return _CURRENT.get()
+
+
+def end() -> Optional[StageTimer]:
+    timer = _CURRENT.get()
+    _CURRENT.set(None)
+    return timer
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    timer = _CURRENT.get()
+    if timer is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, (time.perf_counter() - t0) * 1000.0)
+
+
+def log_event(event: str, **fields) -> None:
+    """One JSON log line, with the current request's stage timings attached."""
+    timer = _CURRENT.get()
+    payload = {"event": event, **fields}
+    if timer is not None and "stages_ms" not in payload:
+        payload["stages_ms"] = timer.snapshot()
+    print(f"🔎 {json.dumps(payload, default=str)}")
+
+
+class StageHistograms:
+    """endpoint -> stage -> {count, sum_ms, max_ms, buckets}."""
+
+    def __init__(self, buckets_ms=BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Dict]] = {}
+
+    def observe(self, endpoint: str, stages: Dict[str, float]) -> None:
+        with self._lock:
+            per_endpoint = self._data.setdefault(endpoint, {})
+            for name, ms in stages.items():
+                h = per_endpoint.get(name)
+                if h is None:
+                    h = per_endpoint[name] = {
+                        "count": 0, "sum_ms": 0.0, "max_ms": 0.0,
+                        "buckets": [0] * (len(self.buckets_ms) + 1),
+                    }
+                h["count"] += 1
+                h["sum_ms"] += ms
+                h["max_ms"] = max(h["max_ms"], ms)
+                i = 0
+                while i < len(self.buckets_ms) and ms > self.buckets_ms[i]:
+                    i += 1
+                h["buckets"][i] += 1
+
+    def _quantile(self, h: Dict, q: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the q-quantile; None = open-ended bucket."""
+        target = q * h["count"]
+        seen = 0
+        for bound, n in zip(self.buckets_ms, h["buckets"]):
+            seen += n
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self) -> Dict:
+        """endpoint -> stage -> stats; "buckets" are counts per BUCKETS_MS bound plus overflow."""
+        with self._lock:
+            out: Dict[str, Dict] = {}
+            for endpoint, stages in self._data.items():
+                out[endpoint] = {
+                    name: {
+                        "count": h["count"],
+                        "mean_ms": round(h["sum_ms"] / h["count"], 2),
+                        "max_ms": round(h["max_ms"], 2),
+                        "p50_le_ms": self._quantile(h, 0.50),
+                        "p95_le_ms": self._quantile(h, 0.95),
+                        "buckets": list(h["buckets"]),
+                    }
+                    for name, h in stages.items()
+                }
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,452 @@
+# vector_store.py
+# Dense side-index for AskAI chunk DBs: an L2-normalized embedding matrix stored
+# next to each uploads/*.db and memory-mapped at query time.
+#
+# Files written next to <name>.db, per kind of store (".vec" or ".emb"):
+#   <name>.db<kind>.npy       (n, dim) float16/float32, rows L2-normalized
+#   <name>.db<kind>.ids.npy   (n,) int64 rowids into the content table
+#   <name>.db<kind>.wo.npy    (n,) int64 work order per row, -1 if unknown (optional)
+#   <name>.db<kind>.json      metadata; written last, so its presence marks a complete build
+#
+# ".vec" stores are embedded from chunk text (askai hybrid retrieval); ".emb"
+# stores are copied from the embedding blobs a DB already carries
+# (helpers.rank_documents). Being memory-mapped, a store is shared by every
+# worker process through the page cache.
+
+from __future__ import annotations
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+VEC_KIND = ".vec"
+EMB_KIND = ".emb"
+
+DEFAULT_DTYPE = os.getenv("ASKAI_VECTOR_DTYPE", "float16")
+# Rows converted to float32 per matmul block when the matrix is stored as float16
+SEARCH_BLOCK_ROWS = 65536
+# With a row mask keeping less than this fraction, score only the kept rows
+SUBSET_FRACTION = 0.5
+
+EmbedFn = Callable[[Sequence[str]], np.ndarray]
+
+
+def sidecar_paths(db_path: str, kind: str = VEC_KIND) -> Tuple[str, str, str]:
+    return (db_path + kind + ".npy", db_path + kind + ".ids.npy", db_path + kind + ".json")
+
+
+def wo_path(db_path: str, kind: str = VEC_KIND) -> str:
+    return db_path + kind + ".wo.npy"
+
+
+# Chunk DBs that support incremental updates carry an explicit content version
+META_TABLE = "askai_meta"
+CONTENT_VERSION_KEY = "content_version"
+
+# db path -> ((mtime_ns, size), content_version or None)
+_VERSION_CACHE: Dict[str, Tuple[Tuple[int, int], Optional[str]]] = {}
+_VERSION_LOCK = threading.Lock()
+
+
+def ro_uri(db_path: str) -> str:
+    """Read-only SQLite URI for a path ('#', '?' and '%' in it are quoted)."""
+    return f"file:{quote(Path(db_path).resolve().as_posix(), safe='/:')}?mode=ro"
+
+
+def _meta_value(db_path: str, key: str) -> Optional[str]:
+    try:
+        conn = sqlite3.connect(ro_uri(db_path), uri=True)
+        try:
+            row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (key,)).fetchone()
+            return str(row[0]) if row else None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+def content_version(db_path: str) -> Optional[str]:
+    """askai_meta.content_version of a DB, or None if it has none (legacy DBs)."""
+    st = os.stat(db_path)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    key = os.path.normcase(os.path.abspath(db_path))
+    with _VERSION_LOCK:
+        hit = _VERSION_CACHE.get(key)
+    if hit and hit[0] == stat_key:
+        return hit[1]
+    version = _meta_value(db_path, CONTENT_VERSION_KEY)
+    with _VERSION_LOCK:
+        _VERSION_CACHE[key] = (stat_key, version)
+    return version
+
+
+def db_stamp(db_path: str) -> str:
+    """
+    Identity of the DB contents a store was built from. The content version when
+    the DB has one (index/maintenance writes don't change it), else mtime:size.
+    """
+    version = content_version(db_path)
+    if version is not None:
+        return f"v{version}"
+    st = os.stat(db_path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def l2_normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class VectorStore:
+    """Read-only view over a built store. `matrix` is an np.memmap."""
+
+    def __init__(self, matrix: np.ndarray, ids: np.ndarray, meta: Dict, wo: Optional[np.ndarray] = None):
+        self.matrix = matrix
+        self.ids = ids
+        self.meta = meta
+        self.wo = wo
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ q
+        # float16 has no BLAS path; upcast in bounded blocks instead of copying it all
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            out[start:start + block.shape[0]] = block @ q
+        return out
+
+    def wo_mask(self, min_wo: int, max_wo: int) -> Optional[np.ndarray]:
+        """Rows inside [min_wo, max_wo] or without a WO; None if the store has no WO array."""
+        if self.wo is None:
+            return None
+        wo = np.asarray(self.wo)
+        return (wo < 0) | ((wo >= min_wo) & (wo <= max_wo))
+
+    def search(self, query_vec: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Exact cosine top-k: one matmul + argpartition. Returns [(rowid, score)].
+        `allowed` is an optional boolean row mask (e.g. from wo_mask).
+        """
+        n = len(self) if allowed is None else int(np.count_nonzero(allowed))
+        if n == 0 or k <= 0:
+            return []
+        q = l2_normalize(np.asarray(query_vec, dtype=np.float32).reshape(-1))
+        rows = None
+        if allowed is not None and n < SUBSET_FRACTION * len(self):
+            # Narrow filter (e.g. a small WO range): gather and score just those rows
+            rows = np.flatnonzero(allowed)
+            scores = np.asarray(self.matrix[rows], dtype=np.float32) @ q
+        else:
+            scores = self._scores(q)
+            if allowed is not None:
+                scores = np.where(allowed, scores, -np.inf)
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        pos = top if rows is None else rows[top]
+        return [(int(self.ids[p]), float(s)) for p, s in zip(pos, scores[top])]
+
+
+# -----------------------------
+# Loading (cached per process)
+# -----------------------------
+_STORE_CACHE: Dict[Tuple[str, str], Tuple[int, VectorStore]] = {}
+_STORE_LOCK = threading.Lock()
+
+
+def load_store(db_path: str, require_fresh: bool = True, kind: str = VEC_KIND) -> Optional[VectorStore]:
+    """
+    Memory-map the store for `db_path`, or None if it was never built or (with
+    require_fresh) was built from different DB contents. While an embed job holds
+    the DB its commits only touch a staging column, so the last store keeps
+    serving instead of being rebuilt after every batch.
+    """
+    vec_path, ids_path, meta_path = sidecar_paths(db_path, kind)
+    try:
+        meta_mtime = os.stat(meta_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    key = (os.path.normcase(os.path.abspath(db_path)), kind)
+    with _STORE_LOCK:
+        hit = _STORE_CACHE.get(key)
+    if hit and hit[0] == meta_mtime:
+        store = hit[1]
+    else:
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        ids = np.load(ids_path, mmap_mode="r")
+        matrix = np.load(vec_path, mmap_mode="r")[: ids.shape[0]]
+        wo = np.load(wo_path(db_path, kind), mmap_mode="r") if meta.get("has_wo") else None
+        store = VectorStore(matrix, ids, meta, wo)
+        with _STORE_LOCK:
+            _STORE_CACHE[key] = (meta_mtime, store)
+
+    if require_fresh and store.meta.get("db_stamp") != db_stamp(db_path) and not embed_job_active(db_path):
+        return None
+    return store
+
+
+# Chunk DBs read by helpers.rank_documents carry blobs in chunks.embedding:
+# float32, or the dtype/dim recorded under askai_meta.embedding_dtype /
+# embedding_dim (embed_pipeline)
+BLOB_TABLE, BLOB_COL, BLOB_FILE_COL = "chunks", "embedding", "file"
+EMBEDDING_DTYPE_KEY = "embedding_dtype"
+EMBEDDING_DIM_KEY = "embedding_dim"
+_BLOB_BUILD_LOCK = threading.Lock()
+
+# {"pid", "heartbeat"} while embed_pipeline runs on a DB; a heartbeat older
+# than this means the job died without clearing it
+EMBED_JOB_KEY = "embed_job"
+EMBED_JOB_STALE_S = 600
+
+
+def embed_job_active(db_path: str) -> bool:
+    raw = _meta_value(db_path, EMBED_JOB_KEY)
+    if not raw:
+        return False
+    try:
+        return time.time() - float(json.loads(raw).get("heartbeat", 0)) < EMBED_JOB_STALE_S
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+def wo_from_filename(filename: Optional[str]) -> Optional[int]:
+    """Work order from a file name's leading 4-5 digits, e.g. "8292-05 Report.pdf" -> 8292."""
+    match = re.match(r"(\d{4,5})", filename or "")
+    return int(match.group(1)) if match else None
+
+
+def blob_dtype(db_path: str) -> str:
+    return _meta_value(db_path, EMBEDDING_DTYPE_KEY) or "float32"
+
+
+def blob_dim(db_path: str) -> Optional[int]:
+    value = _meta_value(db_path, EMBEDDING_DIM_KEY)
+    return int(value) if value else None
+
+
+def blob_store(db_path: str) -> Optional[VectorStore]:
+    """The ".emb" store of a DB with embedding blobs; (re)built from the blobs when missing or stale."""
+    store = load_store(db_path, kind=EMB_KIND)
+    if store is None:
+        with _BLOB_BUILD_LOCK:
+            store = load_store(db_path, kind=EMB_KIND)
+            if store is None:
+                meta = build_store_from_blobs(
+                    db_path, BLOB_TABLE, BLOB_COL, wo_source_col=BLOB_FILE_COL, wo_fn=wo_from_filename,
+                    blob_dtype=blob_dtype(db_path), blob_dim=blob_dim(db_path),
+                )
+                print(f"🧮 Built embedding store for {os.path.basename(db_path)}: "
+                      f"{meta['count']} rows in {meta['build_seconds']}s")
+                if meta["skipped"]:
+                    print(f"⚠️ {os.path.basename(db_path)}: {meta['skipped']} embedding blobs "
+                          f"don't match the {meta['dim']}-dim {blob_dtype(db_path)} layout; left out")
+                store = load_store(db_path, kind=EMB_KIND, require_fresh=False)
+    return store
+
+
+def drop_cached(db_path: str) -> None:
+    path = os.path.normcase(os.path.abspath(db_path))
+    with _STORE_LOCK:
+        for key in [k for k in _STORE_CACHE if k[0] == path]:
+            del _STORE_CACHE[key]
+
+
+# -----------------------------
+# Building
+# -----------------------------
+def build_store(
+    db_path: str,
+    table: str,
+    pk_expr: str,
+    content_col: str,
+    embed_fn: EmbedFn,
+    dtype: str = DEFAULT_DTYPE,
+    batch_size: int = 64,
+    model_name: str = "",
+) -> Dict:
+    """
+    Embed every row of `table` and write the sidecar files atomically.
+    The matrix is filled in place through a memmap, so memory stays O(batch).
+    """
+    vec_path = sidecar_paths(db_path)[0]
+    t0 = time.perf_counter()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # Stamp first, then one read transaction: the count and the rows are the
+        # same snapshot, and a write in between only makes the store look stale
+        stamp = db_stamp(db_path)
+        conn.execute("BEGIN")
+        n = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        cur = conn.execute(f"SELECT {pk_expr}, {content_col} FROM {table} ORDER BY {pk_expr}")
+
+        tmp_vec = vec_path + ".tmp.npy"
+        matrix = None
+        ids = np.empty(n, dtype=np.int64)
+        filled = 0
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            texts = [str(r[1] or "") for r in batch]
+            vecs = l2_normalize(embed_fn(texts))
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(tmp_vec, mode="w+", dtype=dtype, shape=(n, vecs.shape[1]))
+            matrix[filled:filled + len(batch)] = vecs.astype(dtype)
+            ids[filled:filled + len(batch)] = [int(r[0]) for r in batch]
+            filled += len(batch)
+    finally:
+        conn.close()
+
+    return _publish(db_path, VEC_KIND, matrix, tmp_vec, dtype, ids[:filled], None, {
+        "db_stamp": stamp,
+        "table": table,
+        "model": model_name,
+        "build_seconds": round(time.perf_counter() - t0, 2),
+    })
+
+
+def _publish(
+    db_path: str,
+    kind: str,
+    matrix: Optional[np.memmap],
+    tmp_vec: str,
+    dtype: str,
+    ids: np.ndarray,
+    wo: Optional[np.ndarray],
+    meta: Dict,
+) -> Dict:
+    """Move a finished build into place; the metadata file goes last."""
+    vec_path, ids_path, meta_path = sidecar_paths(db_path, kind)
+    dim = int(matrix.shape[1]) if matrix is not None else 0
+    if matrix is None:
+        matrix = np.lib.format.open_memmap(tmp_vec, mode="w+", dtype=dtype, shape=(0, 0))
+    matrix.flush()
+    del matrix
+
+    tmp_ids = ids_path + ".tmp.npy"
+    np.save(tmp_ids, ids)
+    os.replace(tmp_vec, vec_path)
+    os.replace(tmp_ids, ids_path)
+    if wo is not None:
+        tmp_wo = wo_path(db_path, kind) + ".tmp.npy"
+        np.save(tmp_wo, wo)
+        os.replace(tmp_wo, wo_path(db_path, kind))
+
+    meta = {
+        **meta,
+        "count": int(ids.shape[0]),
+        "dim": dim,
+        "dtype": dtype,
+        "has_wo": wo is not None,
+        "built_at": time.time(),
+    }
+    tmp_meta = meta_path + ".tmp"
+    with open(tmp_meta, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp_meta, meta_path)
+    drop_cached(db_path)
+    return meta
+
+
+def build_store_from_blobs(
+    db_path: str,
+    table: str,
+    blob_col: str,
+    wo_source_col: Optional[str] = None,
+    wo_fn: Optional[Callable[[Optional[str]], Optional[int]]] = None,
+    dtype: str = "float32",
+    batch_size: int = 4096,
+    blob_dtype: str = "float32",
+    blob_dim: Optional[int] = None,
+) -> Dict:
+    """
+    Store for a DB whose rows already carry embedding blobs (float32, or
+    `blob_dtype`): the blobs are copied (normalized) into the matrix, no model
+    needed. With `wo_fn`, each row's WO is derived from `wo_source_col` (e.g. the
+    file name) into the WO side array. The blob width is `blob_dim` values of
+    `blob_dtype` when the DB records it, else the most common one in the table;
+    rows with a missing or different-sized blob are skipped, counted in
+    meta["skipped"] and reported.
+    """
+    vec_path = sidecar_paths(db_path, EMB_KIND)[0]
+    t0 = time.perf_counter()
+
+    conn = sqlite3.connect(ro_uri(db_path), uri=True)
+    try:
+        stamp = db_stamp(db_path)
+        conn.execute("BEGIN")  # widths/counts and rows from one snapshot
+        widths = conn.execute(
+            f"SELECT length({blob_col}), COUNT(*) FROM {table} WHERE {blob_col} IS NOT NULL "
+            f"GROUP BY 1 ORDER BY 2 DESC"
+        ).fetchall()
+        width, n = widths[0] if widths else (0, 0)
+        if blob_dim:
+            width = blob_dim * np.dtype(blob_dtype).itemsize
+            n = next((count for w, count in widths if w == width), 0)
+        src = wo_source_col if (wo_fn and wo_source_col) else "NULL"
+        cur = conn.execute(
+            f"SELECT rowid, {src}, {blob_col} FROM {table} WHERE {blob_col} IS NOT NULL ORDER BY rowid"
+        )
+
+        tmp_vec = vec_path + ".tmp.npy"
+        matrix = None
+        ids = np.empty(n, dtype=np.int64)
+        wo = np.full(n, -1, dtype=np.int64) if wo_fn else None
+        filled = skipped = 0
+        if n:
+            dim = width // np.dtype(blob_dtype).itemsize
+            matrix = np.lib.format.open_memmap(tmp_vec, mode="w+", dtype=dtype, shape=(n, dim))
+        while n:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            good = [r for r in batch if len(r[2]) == width]
+            skipped += len(batch) - len(good)
+            if not good:
+                continue
+            vecs = l2_normalize(np.frombuffer(b"".join(r[2] for r in good), dtype=blob_dtype).reshape(len(good), -1))
+            end = filled + len(good)
+            matrix[filled:end] = vecs.astype(dtype)
+            ids[filled:end] = [int(r[0]) for r in good]
+            if wo is not None:
+                wo[filled:end] = [-1 if v is None else v for v in (wo_fn(r[1]) for r in good)]
+            filled = end
+    finally:
+        conn.close()
+
+    # Skipped rows leave unused tail rows in the matrix; load_store slices to len(ids)
+    return _publish(db_path, EMB_KIND, matrix, tmp_vec, dtype, ids[:filled],
+                    None if wo is None else wo[:filled], {
+        "db_stamp": stamp,
+        "table": table,
+        "skipped": skipped,
+        "build_seconds": round(time.perf_counter() - t0, 2),
+    })
+
+
+# -----------------------------
+# Fusion
+# -----------------------------
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Standard RRF: score(id) = sum over lists of 1 / (k + rank). Best first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, rid in enumerate(ranking, start=1):
+            fused[rid] = fused.get(rid, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)